@@ -9,12 +9,20 @@ from shutil import copyfile
 
 from dateutil.relativedelta import relativedelta
 import requests
-from reviewrot.basereview import Age
+from reviewrot.basereview import Age, is_wip
 from reviewrot.gerritstack import GerritService
 from reviewrot.githubstack import GithubService
 from reviewrot.gitlabstack import GitlabService
+from reviewrot.httpcache import DEFAULT_MAX_SIZE, DEFAULT_TTL, ResponseCache
 from reviewrot.pagurestack import PagureService
 from reviewrot.phabricatorstack import PhabricatorService
+from reviewrot.retry import (
+    DEFAULT_BACKOFF,
+    DEFAULT_MAX_TIME,
+    DEFAULT_RETRIES,
+    RetryPolicy,
+)
+from reviewrot.state import ReviewState
 from six import iteritems
 from six.moves import input
 import yaml
@@ -24,36 +32,114 @@ log = logging.getLogger(__name__)
 
 # Valid values of choices for arguments
 CHOICES = {
-    "format": ["oneline", "indented", "json"],
+    "format": ["oneline", "indented", "json", "ndjson"],
     "sort": ["submitted", "updated", "commented"],
 }
 
 DEFAULT_SUBJECT = "review-rot notification"
 
 
-def get_git_service(git):
+def get_git_service(git, cache=None, state=None, rate_limiter=None, retry=None):
     """
     Returns git service as per requested.
 
     Args:
         git (str): String indicating git service requested.
+        cache (ResponseCache): Cache for responses of the git service
+        state (ReviewState): State of review requests from previous run
+        rate_limiter (RateLimiter): Rate limit budget shared by services
+        retry (RetryPolicy): Policy for retrying transient failures
 
     Returns:
         Returns desired git service
     """
     if git == "github":
-        return GithubService()
+        service = GithubService()
     elif git == "gitlab":
-        return GitlabService()
+        service = GitlabService()
     elif git == "pagure":
-        return PagureService()
+        service = PagureService()
     elif git == "gerrit":
-        return GerritService()
+        service = GerritService()
     elif git == "phabricator":
-        return PhabricatorService()
+        service = PhabricatorService()
     else:
         raise ValueError("requested git service %s is not valid" % (git))
 
+    if cache is not None:
+        service.use_cache(cache)
+    # mounted after the cache, which replaces PyGithub connections
+    # and adapters of the sessions
+    if retry is not None:
+        service.use_retry(retry)
+    if rate_limiter is not None:
+        service.use_rate_limiter(rate_limiter)
+    if state is not None:
+        service.use_state(state)
+    return service
+
+
+def get_response_cache(arguments):
+    """
+    Returns response cache configured by arguments.
+
+    Args:
+        arguments (dict): Parsed arguments
+
+    Returns:
+        cache (ResponseCache): Returns the cache or None if not configured
+    """
+    cache_dir = arguments.get("cache_dir")
+    if not cache_dir:
+        return None
+
+    return ResponseCache(
+        expanduser(expandvars(cache_dir)),
+        ttl=arguments.get("cache_ttl") or DEFAULT_TTL,
+        max_size=arguments.get("cache_max_size") or DEFAULT_MAX_SIZE,
+    )
+
+
+def get_retry_policy(arguments):
+    """
+    Returns policy for retrying transient failures configured by arguments.
+
+    Args:
+        arguments (dict): Parsed arguments
+
+    Returns:
+        retry (RetryPolicy): Returns the policy or None if retries are disabled
+    """
+    retries = arguments.get("retries")
+    if retries is None:
+        retries = DEFAULT_RETRIES
+    if not retries:
+        return None
+
+    backoff = arguments.get("retry_backoff")
+    return RetryPolicy(
+        total=retries,
+        backoff_factor=DEFAULT_BACKOFF if backoff is None else backoff,
+        max_time=arguments.get("retry_max_time") or DEFAULT_MAX_TIME,
+    )
+
+
+def get_review_state(arguments):
+    """
+    Returns state of review requests from previous run.
+
+    Args:
+        arguments (dict): Parsed arguments
+
+    Returns:
+        state (ReviewState): Returns the state or None if not configured
+    """
+    state_file = arguments.get("state_file")
+    if not state_file:
+        return None
+
+    return ReviewState(expanduser(expandvars(state_file)))
+
 
 def get_arguments(cli_arguments, config):
     """
@@ -156,6 +242,9 @@ def get_arguments(cli_arguments, config):
             "{} format doesn't support last comment functionality".format(format)
         )
 
+    if parsed_arguments.get("compact") and format not in ("json", "ndjson"):
+        raise ValueError("Compact output is only supported by json and ndjson format")
+
     irc = parsed_arguments.get("irc")
     email = parsed_arguments.get("email")
     if email and format:
@@ -180,6 +269,25 @@ def get_arguments(cli_arguments, config):
             "for correct configuration."
         )
 
+    for argument in [
+        "workers",
+        "max_per_host",
+        "cache_ttl",
+        "cache_max_size",
+        "interval",
+        "serve",
+    ]:
+        value = parsed_arguments.get(argument)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise ValueError("{} must be a positive number".format(argument))
+
+    for argument in ["retries", "retry_backoff", "retry_max_time"]:
+        value = parsed_arguments.get(argument)
+        if value is not None and (
+            not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0
+        ):
+            raise ValueError("{} must not be a negative number".format(argument))
+
     return parsed_arguments
 
 
@@ -222,7 +330,7 @@ class ParseAge(argparse.Action):
         delta = relativedelta(**parts)
         date = datetime.datetime.now() - delta
 
-        return Age(date=date, state=state)
+        return Age(date=date, state=state, delta=delta)
 
 
 def parse_cli_args(args):
@@ -258,6 +366,11 @@ def parse_cli_args(args):
         choices=CHOICES["format"],
         help="Choose from one of a few different styles",
     )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write json and ndjson output without indentation and spaces",
+    )
     parser.add_argument(
         "--show-last-comment",
         nargs="?",
@@ -305,6 +418,67 @@ def parse_cli_args(args):
     parser.add_argument(
         "--ignore-wip", help="Omit WIP PRs/MRs from output", action="store_true"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of repositories to query in parallel. Defaults to 1",
+    )
+    parser.add_argument(
+        "--max-per-host",
+        type=int,
+        default=None,
+        help="Maximum number of parallel queries against a single host",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        help="Number of retries of requests failed for transient reasons,"
+        " 0 disables them. Defaults to {}".format(DEFAULT_RETRIES),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory to cache responses in, used for conditional requests",
+    )
+    parser.add_argument(
+        "--state-file",
+        default=None,
+        help="File to keep review requests of previous run in, used to"
+        " refresh only updated ones, report new and closed ones and query"
+        " repositories with most reviews first",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        metavar="FILE",
+        help="Write output to a file instead of console, replacing it",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and collect reviews periodically",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=None,
+        help="Seconds between collections in daemon mode. Defaults to 900",
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        default=None,
+        metavar="PORT",
+        help="Serve collected reviews and web UI over HTTP, implies --daemon",
+    )
+    parser.add_argument(
+        "--bind",
+        default=None,
+        metavar="ADDRESS",
+        help="Address to serve on. Defaults to 127.0.0.1",
+    )
     ssl_group = parser.add_argument_group("SSL")
     ssl_group.add_argument(
         "-k",
@@ -421,12 +595,4 @@ def remove_wip(results):
         res (list): list of BaseReview instances with WIP
                     reviews removed
     """
-    res = []
-    for result in results:
-        match = re.match(
-            r"^(\[WIP\]\s*|WIP:\s*|WIP\s+|Draft:)+\s*", str(result.title), re.IGNORECASE
-        )
-        if not match:
-            res.append(result)
-
-    return res
+    return [result for result in results if not is_wip(result.title)]
@@ -1,18 +1,53 @@
 """basereview module."""
 from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import datetime
 import hashlib
 import json
 import logging
+import re
 import textwrap
+import threading
 import time
 
 from dateutil.relativedelta import relativedelta
+import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from reviewrot.httpcache import mount_cache
+from reviewrot.retry import mount_retry
 
 log = logging.getLogger(__name__)
 
 LastComment = namedtuple("LastComment", ("author", "body", "created_at"))
-Age = namedtuple("Age", ("date", "state"))
+# delta is the relative age the date was computed from, if any
+Age = namedtuple("Age", ("date", "state", "delta"), defaults=(None,))
+
+
+WIP_PATTERN = re.compile(r"^(\[WIP\]\s*|WIP:\s*|WIP\s+|Draft:)+\s*", re.IGNORECASE)
+
+
+def is_wip(title):
+    """Return True if the title marks a review as work in progress."""
+    return bool(WIP_PATTERN.match(str(title)))
+
+
+def refresh_age(age, now=None):
+    """
+    Returns age filter with its date computed again from its delta.
+
+    Args:
+        age (Age): age filter, returned as is without delta
+        now (datetime.datetime): current local time, taken if None
+
+    Returns:
+        age (Age): age filter relative to now
+    """
+    if age is None or age.delta is None:
+        return age
+    if now is None:
+        now = datetime.datetime.now()
+    return age._replace(date=now - age.delta)
 
 
 def gravatar(email):
@@ -22,9 +57,396 @@ def gravatar(email):
     return "https://www.gravatar.com/avatar/" + digest + default
 
 
+# Units of relative durations, minutes are shown only if they are all
+DURATION_UNITS = ("year", "month", "day", "hour", "minute")
+
+
+def duration_text(rel_diff):
+    """
+    Returns text of relative duration.
+
+    Args:
+        rel_diff (relativedelta): the duration
+
+    Returns:
+        a string like "1 year 2 months", "less than 1 minute" for no duration
+    """
+    values = (
+        rel_diff.years,
+        rel_diff.months,
+        rel_diff.days,
+        rel_diff.hours,
+        rel_diff.minutes,
+    )
+    result = []
+    for unit, value in zip(DURATION_UNITS, values):
+        # add minutes only if it is the only
+        # information available
+        if unit == "minute" and result:
+            continue
+        if value == 1:
+            result.append("1 " + unit)
+        elif value > 1:
+            result.append("%s %ss" % (value, unit))
+
+    if not result:
+        return "less than 1 minute"
+
+    return " ".join(result)
+
+
+class RelativeAge(object):
+    """
+    Formats durations of many dates until one reference time.
+
+    All durations of a report are relative to the same time, taken once.
+    Durations are computed at minute granularity, so they are memoized
+    by the minute of the date, which many reviews and comments share.
+    """
+
+    def __init__(self, now=None):
+        """
+        Returns relative age object.
+
+        Args:
+            now (datetime.datetime): reference UTC time, taken if None
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        self.now = now.replace(second=0, microsecond=0)
+        self._durations = {}
+
+    def __call__(self, date):
+        """
+        Returns duration from a date until the reference time.
+
+        Args:
+            date (datetime.datetime): the date
+
+        Returns:
+            a string of the duration
+        """
+        minute = date.replace(second=0, microsecond=0)
+        duration = self._durations.get(minute)
+        if duration is None:
+            duration = duration_text(relativedelta(self.now, minute))
+            self._durations[minute] = duration
+        return duration
+
+    def format_all(self, dates):
+        """
+        Returns durations from many dates until the reference time.
+
+        Args:
+            dates (iterable): the dates
+
+        Returns:
+            durations (list): a string of every duration
+        """
+        return [self(date) for date in dates]
+
+
+class FilterStats(object):
+    """
+    Counters of reviews passing through the filter chain of a service.
+
+    Services filter reviews in stages. Cheap filters, which only need
+    the data of the review listing (WIP, age), run first. Expensive
+    enrichment, like looking up the last comment, is done only for reviews
+    which survived them, followed by filters depending on the enriched data.
+    """
+
+    STAGES = (
+        "fetched",
+        "dropped_wip",
+        "dropped_age",
+        "enriched",
+        "reused",
+        "dropped_last_comment",
+        "kept",
+    )
+
+    def __init__(self):
+        """Initialization dunder."""
+        self.counts = OrderedDict((stage, 0) for stage in self.STAGES)
+
+    def add(self, stage, count=1):
+        """
+        Increase counter of a stage.
+
+        Args:
+            stage (str): one of STAGES
+            count (int): number to add
+        """
+        self.counts[stage] += count
+
+    @property
+    def saved(self):
+        """Number of enrichment lookups avoided by filters and state reuse."""
+        return (
+            self.counts["dropped_wip"]
+            + self.counts["dropped_age"]
+            + self.counts["reused"]
+        )
+
+    def log(self, label):
+        """
+        Log the counters as debug output.
+
+        Args:
+            label (str): name of the queried repository
+        """
+        log.debug(
+            "Filter stages for %s: fetched %d, dropped as WIP %d, "
+            "dropped by age %d, enriched %d (reused %d, saved %d lookups), "
+            "dropped by last comment %d, kept %d",
+            label,
+            self.counts["fetched"],
+            self.counts["dropped_wip"],
+            self.counts["dropped_age"],
+            self.counts["enriched"],
+            self.counts["reused"],
+            self.saved,
+            self.counts["dropped_last_comment"],
+            self.counts["kept"],
+        )
+
+
 class BaseService(object):
     """TODO: docstring goes here."""
 
+    # ReviewState of the previous run, used to skip enrichment of
+    # unchanged review requests
+    state = None
+    # Sessions and library clients shared by all services of the process,
+    # so connections to a host are kept alive between entries
+    clients = {}
+    clients_lock = threading.Lock()
+    # Connections kept alive per host, matched to the number of workers
+    pool_size = DEFAULT_POOLSIZE
+
+    @staticmethod
+    def set_pool_size(workers):
+        """
+        Sizes connection pools of sessions and clients created afterwards.
+
+        Args:
+            workers (int): number of requests sent at the same time
+        """
+        BaseService.pool_size = max(DEFAULT_POOLSIZE, workers)
+
+    def shared_client(self, host, token, ssl_verify, factory):
+        """
+        Returns client shared by all services of the same type.
+
+        Args:
+            host (str): host the client talks to
+            token (str): token the client authenticates with
+            ssl_verify (bool/str): SSL verification of the client
+            factory (callable): creates the client if there's none yet
+
+        Returns:
+            client: the shared client
+        """
+        key = (type(self).__name__, host, token, ssl_verify)
+        with self.clients_lock:
+            if key not in self.clients:
+                self.clients[key] = factory()
+            return self.clients[key]
+
+    def shared_session(self):
+        """
+        Returns requests session shared by all services of the same type.
+
+        Headers are sent per request, so a session can serve any host and
+        token, keeping its connections alive between entries.
+
+        Returns:
+            session (requests.Session): the shared session
+        """
+        return self.shared_client(None, None, None, self._create_session)
+
+    def _create_session(self):
+        """Returns requests session with connection pools of pool_size."""
+        session = requests.session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def map_workers(function, items, workers):
+        """
+        Returns results of a function for every item, in the same order.
+
+        Items are processed by a pool of threads. Every call runs in a copy
+        of the caller's context, so the work done by the pool is attributed
+        to the job of the caller, see fetcher.job_context().
+
+        Args:
+            function (callable): called with every item
+            items (list): items to process
+            workers (int): number of items processed at the same time,
+                           processed one by one if less than 2
+
+        Returns:
+            results (list): result of every item
+        """
+        if not workers or workers < 2 or len(items) < 2:
+            return [function(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, function, item)
+                for item in items
+            ]
+            return [future.result() for future in futures]
+
+    def use_state(self, state):
+        """
+        Reuses enrichment data of review requests unchanged since previous run.
+
+        Args:
+            state (ReviewState): state stored by the previous run
+        """
+        self.state = state
+
+    def previous_review(self, url, updated_time, stats=None, comments_mode=None):
+        """
+        Returns record of review request if it didn't change since previous run.
+
+        Args:
+            url (str): URL of the review request
+            updated_time (datetime.datetime): when the review request was
+                                              last updated
+            stats (FilterStats): counters to update
+            comments_mode (str): how comments are counted, records of
+                                 comments counted otherwise aren't used
+        Returns:
+            record (ReviewRecord): record from the previous run, None if the
+                                   review request is new, changed or no
+                                   state is used
+        """
+        if self.state is None:
+            return None
+
+        record = self.state.lookup(url, updated_time, comments_mode)
+        if record is not None:
+            log.debug("review request %s didn't change since previous run", url)
+            if stats:
+                stats.add("reused")
+        return record
+
+    def use_cache(self, cache):
+        """
+        Sends GET requests of the service through a response cache.
+
+        Args:
+            cache (ResponseCache): cache used for conditional requests
+        """
+        session = getattr(self, "session", None)
+        if session is not None:
+            mount_cache(session, cache)
+
+    def use_retry(self, retry):
+        """
+        Retries transient failures of the service requests.
+
+        Args:
+            retry (RetryPolicy): policy shared by all services
+        """
+        session = getattr(self, "session", None)
+        if session is not None:
+            mount_retry(session, retry)
+
+    def use_rate_limiter(self, limiter):
+        """
+        Accounts and throttles requests of the service by a rate limiter.
+
+        Args:
+            limiter (RateLimiter): limiter shared by all services
+        """
+        session = getattr(self, "session", None)
+        if session is not None:
+            limiter.mount(session)
+
+    def passes_metadata_filters(
+        self, title, created_at, age=None, ignore_wip=False, stats=None, url=None
+    ):
+        """
+        Cheap filter stage, applied before any further API call for a review.
+
+        Args:
+            title (str): title of the review request
+            created_at (datetime.datetime): the date review request was filed
+            age (Age): Contains the filter state for pull requests,
+                       e.g, older or newer and date
+            ignore_wip (bool): Drop review requests marked as WIP
+            stats (FilterStats): counters to update
+            url (str): URL of the review request, recorded as still open
+                       in the state before any filter applies
+        Returns:
+            True if the review request should be enriched, False otherwise
+        """
+        if stats:
+            stats.add("fetched")
+        if self.state is not None and url is not None:
+            self.state.listed(url)
+
+        if ignore_wip and is_wip(title):
+            log.debug("review request '%s' is WIP", title)
+            if stats:
+                stats.add("dropped_wip")
+            return False
+
+        # check if review request is older/newer than specified time interval
+        if self.check_request_state(created_at, age) is False:
+            log.debug(
+                "review request '%s' is not %s than specified time interval",
+                title,
+                age.state,
+            )
+            if stats:
+                stats.add("dropped_age")
+            return False
+
+        if stats:
+            stats.add("enriched")
+        return True
+
+    def passes_comment_filter(
+        self, title, last_comment, show_last_comment=None, stats=None
+    ):
+        """
+        Filter stage applied after the last comment was looked up.
+
+        Args:
+            title (str): title of the review request
+            last_comment (LastComment): last comment of the review request
+            show_last_comment (int): filter out review requests in which
+                                     last comments are newer than
+                                     specified number of days
+            stats (FilterStats): counters to update
+        Returns:
+            True if the review request should be kept, False otherwise
+        """
+        if last_comment and show_last_comment:
+            if self.has_new_comments(last_comment.created_at, show_last_comment):
+                log.debug(
+                    "review request '%s' had new comments in last %s days",
+                    title,
+                    show_last_comment,
+                )
+                if stats:
+                    stats.add("dropped_last_comment")
+                return False
+
+        if stats:
+            stats.add("kept")
+        return True
+
     def check_request_state(self, created_at, age):
         """
         Checks if the review request is older or newer than specified time interval.
@@ -88,7 +510,7 @@ class BaseService(object):
         except ValueError:
             raise ValueError("Invalid json content: %s" % content)
 
-    def _call_api(self, url, method="GET", ssl_verify=True):
+    def _call_api(self, url, method="GET", ssl_verify=True, **kwargs):
         """
         Method used to call the API.
 
@@ -100,11 +522,12 @@ class BaseService(object):
                           Defaults to GET
             ssl_verify (bool/str): Whether or not to verify SSL certificates,
                                    or a path to a CA file to use.
+            kwargs: Additional arguments passed to the request, e.g. json body
         Returns:
             raw JSON returned by API
         """
         decoded_response = ""
-        response = self.get_response(method, url, ssl_verify)
+        response = self.get_response(method, url, ssl_verify, **kwargs)
         try:
             # fails for gerrit services
             decoded_response = response.json()
@@ -112,7 +535,7 @@ class BaseService(object):
             decoded_response = self._decode_response(response)
         return decoded_response
 
-    def get_response(self, method, url, ssl_verify):
+    def get_response(self, method, url, ssl_verify, **kwargs):
         """
         Method used to make request.
 
@@ -122,18 +545,38 @@ class BaseService(object):
             url(str): URL for git based service
             ssl_verify (bool/str): Whether or not to verify SSL certificates,
                                    or a path to a CA file to use.
+            kwargs: Additional arguments passed to the request, e.g. json body
         Returns:
             Output returned by request module
         """
         response = self.session.request(
-            method=method, url=url, headers=self.header, verify=ssl_verify
+            method=method, url=url, headers=self.header, verify=ssl_verify, **kwargs
         )
         response.raise_for_status()
         return response
 
 
 class BaseReview(object):
-    """TODO: docstring goes here."""
+    """
+    Review request reported by a git service.
+
+    Attributes are kept in slots, without a dictionary per review request,
+    as org-wide scans keep tens of thousands of them. Subclasses have to
+    declare their own (empty) __slots__ to keep it that way.
+    """
+
+    __slots__ = (
+        "user",
+        "title",
+        "url",
+        "time",
+        "updated_time",
+        "comments",
+        "image",
+        "last_comment",
+        "project_name",
+        "project_url",
+    )
 
     def __init__(
         self,
@@ -161,74 +604,67 @@ class BaseReview(object):
         self.project_url = project_url
 
     @staticmethod
-    def format_duration(created_at):
+    def format_duration(created_at, now=None):
         """
         Formats the duration the review request is pending for.
 
         Args:
             created_at (str): the date review request was filed
+            now (datetime.datetime or RelativeAge): current UTC time, taken
+                                                    if None, or relative age
+                                                    of a whole report
 
         Returns:
             a string of duration the review request is pending for
         """
+        if isinstance(now, RelativeAge):
+            return now(created_at)
         """
         find the relative time difference between now and
         review request filed to retrieve relative information
         """
-        rel_diff = relativedelta(datetime.datetime.utcnow(), created_at)
-
-        time_dict = OrderedDict(
-            [
-                ("year", rel_diff.years),
-                ("month", rel_diff.months),
-                ("day", rel_diff.days),
-                ("hour", rel_diff.hours),
-                ("minute", rel_diff.minutes),
-            ]
-        )
-
-        result = []
-        for k, v in time_dict.items():
-            # add minutes only if it is the only
-            # information available
-            if k == "minute" and result:
-                continue
-            if v == 1:
-                result.append("%s %s" % (v, k))
-            elif v > 1:
-                result.append("%s %ss" % (v, k))
-
-        if not result:
-            return "less than 1 minute"
-
-        return " ".join(result)
+        if now is None:
+            now = datetime.datetime.utcnow()
+        return duration_text(relativedelta(now, created_at))
 
     @property
     def since(self):
         """TODO: docstring goes here."""
         return self.format_duration(created_at=self.time)
 
-    def format(self, style, i, n, show_last_comment=None):
+    def since_at(self, now=None):
+        """
+        Formats the duration the review request is pending for until now.
+
+        Args:
+            now (datetime.datetime or RelativeAge): current UTC time, taken if None
+
+        Returns:
+            a string of duration the review request is pending for
+        """
+        return self.format_duration(self.time, now)
+
+    def format(self, style, i, n, show_last_comment=None, now=None):
         """
         Format the result in a given style.
 
+        Only the requested style is rendered, by the formatter registered
+        for it in FORMATTERS.
+
         Args:
             style(str): the name of the style.
             i(int): position in a list.
             n(int): length of the list.
             show_last_comment (int): show last_comment text in output
+            now (datetime.datetime or RelativeAge): current UTC time
+                                                    durations are relative
+                                                    to, taken if None
         Return:
             formatted_string(str): Formatted string as per style
         """
-        lookup = {
-            "oneline": self._format_oneline(i, n),
-            "indented": self._format_indented(i, n, show_last_comment),
-            "json": self._format_json(i, n, show_last_comment),
-            "irc": self._format_irc(),
-        }
-        return lookup[style]
+        return FORMATTERS[style](self, i, n, show_last_comment, now)
 
-    def _format_oneline(self, i, n):
+    def _format_oneline(self, i, n, show_last_comment=None, now=None):
         """
         Format the result in oneline style.
 
@@ -237,11 +673,13 @@ class BaseReview(object):
                     in all the formatting methods
             n(int): Not used in this method, added to have same parameters
                     in all the formatting methods
+            show_last_comment (int): Not used in this method
+            now (datetime.datetime or RelativeAge): current UTC time, taken if None
         Return:
             formatted_string(str): Formatted string as per style
         """
         string = "{} filed '{}' {} {} ago".format(
-            self.user, self.title, self.url, self.since
+            self.user, self.title, self.url, self.since_at(now)
         )
 
         if self.comments == 1:
@@ -252,12 +690,12 @@ class BaseReview(object):
         if self.last_comment:
             string += ", last comment by {} {} ago".format(
                 self.last_comment.author,
-                self.format_duration(self.last_comment.created_at),
+                self.format_duration(self.last_comment.created_at, now),
             )
 
         return string
 
-    def _format_indented(self, i, n, show_last_comment):
+    def _format_indented(self, i, n, show_last_comment, now=None):
         """
         Format the result in indented style.
 
@@ -267,11 +705,12 @@ class BaseReview(object):
             n(int): Not used in this method, added to have same parameters
                     in all the formatting methods
             show_last_comment (int): show last_comment text in output
+            now (datetime.datetime or RelativeAge): current UTC time, taken if None
         Return:
             formatted_string(str): Formatted string as per style
         """
         string = "{} filed '{}'\n\t{}\n\t{} ago".format(
-            self.user, self.title, self.url, self.since
+            self.user, self.title, self.url, self.since_at(now)
         )
 
         if self.comments == 1:
@@ -282,7 +721,7 @@ class BaseReview(object):
         if self.last_comment:
             string += ", last comment by {} {} ago".format(
                 self.last_comment.author,
-                self.format_duration(self.last_comment.created_at),
+                self.format_duration(self.last_comment.created_at, now),
             )
 
         if show_last_comment and self.last_comment:
@@ -294,7 +733,7 @@ class BaseReview(object):
             string += "\n{}".format(comment)
         return string
 
-    def _format_json(self, i, n, show_last_comment):
+    def _format_json(self, i, n, show_last_comment, now=None):
         """
         Format the result in json style.
 
@@ -302,24 +741,30 @@ class BaseReview(object):
             i(int): position in a list.
             n(int): length of the list.
             show_last_comment (bool): show last_comment text in output
+            now (datetime.datetime or RelativeAge): current UTC time, taken if None
         Return:
             formatted_string(str): Formatted string as per style
         """
         # Include a comma after every entry, except the last.
         suffix = "," if i < n - 1 else ""
-        return json.dumps(self.__json__(show_last_comment), indent=2) + suffix
+        return json.dumps(self.__json__(show_last_comment, now=now), indent=2) + suffix
 
-    def _format_irc(self):
+    def _format_irc(self, i=None, n=None, show_last_comment=None, now=None):
         """
         Format the result for irc output.
 
+        Args:
+            i(int): Not used in this method
+            n(int): Not used in this method
+            show_last_comment (int): Not used in this method
+            now (datetime.datetime or RelativeAge): current UTC time, taken if None
         Return:
             formatted_string(str): Formatted string as per style
         """
         # \x02 is bold
         # \x0312 is blue color
         string = "\x02{}\x02 filed \x02'{}'\x02 \x0312{}\x03 {} ago".format(
-            self.user, self.title, self.url, self.since
+            self.user, self.title, self.url, self.since_at(now)
         )
 
         if self.comments == 1:
@@ -330,18 +775,18 @@ class BaseReview(object):
         if self.last_comment:
             string += ", last comment by \x02{}\x02 {} ago".format(
                 self.last_comment.author,
-                self.format_duration(self.last_comment.created_at),
+                self.format_duration(self.last_comment.created_at, now),
             )
 
         return string
 
-    def __json__(self, show_last_comment):
+    def __json__(self, show_last_comment, now=None):
         """TODO: docstring goes here."""
         data = {
             "user": self.user,
             "title": self.title,
             "url": self.url,
-            "relative_time": self.since,
+            "relative_time": self.since_at(now),
             "time": time.mktime(self.time.timetuple()),
             "updated_time": time.mktime(self.updated_time.timetuple()),
             "comments": self.comments,
@@ -357,3 +802,54 @@ class BaseReview(object):
                 data["last_comment"]["body"] = self.last_comment.body
 
         return data
+
+
+# Formatters of output styles, called with review, position in a list,
+# length of the list, show_last_comment and current UTC time
+FORMATTERS = OrderedDict(
+    [
+        ("oneline", BaseReview._format_oneline),
+        ("indented", BaseReview._format_indented),
+        ("json", BaseReview._format_json),
+        ("irc", BaseReview._format_irc),
+    ]
+)
+
+
+def register_formatter(style, formatter):
+    """
+    Registers formatter of an output style, replacing the current one.
+
+    Args:
+        style (str): the name of the style
+        formatter (callable): called with review, position in a list, length
+                              of the list, show_last_comment and current UTC
+                              time, returns the formatted string
+    """
+    FORMATTERS[style] = formatter
+
+
+def format_reviews(reviews, style, show_last_comment=None, now=None):
+    """
+    Formats list of reviews in a given style.
+
+    Durations of all reviews are relative to the same time, computed by
+    one RelativeAge.
+
+    Args:
+        reviews (list): reviews to format
+        style (str): the name of the style
+        show_last_comment (int): show last_comment text in output
+        now (datetime.datetime or RelativeAge): current UTC time, taken if None
+
+    Returns:
+        formatted (list): formatted string of every review
+    """
+    formatter = FORMATTERS[style]
+    if not isinstance(now, RelativeAge):
+        now = RelativeAge(now)
+    n = len(reviews)
+    return [
+        formatter(review, i, n, show_last_comment, now)
+        for i, review in enumerate(reviews)
+    ]
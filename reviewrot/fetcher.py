@@ -0,0 +1,210 @@
+"""fetcher module."""
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import contextvars
+import logging
+
+log = logging.getLogger(__name__)
+
+FetchJob = namedtuple("FetchJob", ("label", "host", "service", "kwargs"))
+FetchError = namedtuple("FetchError", ("job", "error"))
+
+# Label of the job running in the current context, copied to nested
+# worker pools by BaseService.map_workers()
+job_label = contextvars.ContextVar("job_label", default=None)
+
+
+@contextmanager
+def job_context(label):
+    """
+    Attributes work done in the current context to a job.
+
+    Requests are accounted to the job by the rate limiter and review
+    requests listed by services are recorded for it by the state.
+
+    Args:
+        label (str): label of the job
+    """
+    token = job_label.set(label)
+    try:
+        yield
+    finally:
+        job_label.reset(token)
+
+
+class ReviewFetcher(object):
+    """
+    Dispatches request_reviews calls of git services in parallel.
+
+    Jobs are executed by a pool of worker threads, optionally capped per
+    host, so a single slow or rate limited host cannot occupy all workers.
+    A job is handed to the pool only once its host has a free slot, jobs
+    waiting for a busy host don't hold a worker.
+    Results are always returned in the order the jobs were given, no matter
+    in which order they finish. With a rate limiter, jobs are started in
+    order of their expected yield and their requests are accounted to them.
+
+    The cap counts jobs. Lookups a running job makes in parallel itself,
+    the last comments of GitLab merge requests (comment_workers) and
+    avatars of Pagure users (avatar_workers), are not capped by it, so up
+    to per_host times that many requests may be sent to one host.
+    """
+
+    def __init__(self, workers=1, per_host=None, rate_limiter=None):
+        """
+        Returns fetcher object.
+
+        Args:
+            workers (int): Maximum number of jobs running at the same time
+            per_host (int): Maximum number of jobs running at the same time
+                            against a single host, no cap if None
+            rate_limiter (RateLimiter): Rate limit budget shared by services
+        """
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1")
+        if per_host is not None and per_host < 1:
+            raise ValueError("Number of workers per host must be at least 1")
+
+        self.workers = workers
+        self.per_host = per_host
+        self.rate_limiter = rate_limiter
+
+    def _run_job(self, job):
+        """
+        Runs a single job.
+
+        Args:
+            job (FetchJob): job to run
+
+        Returns:
+            reviews (list): reviews returned by the service
+        """
+        log.debug("Fetching reviews for %s", job.label)
+        with job_context(job.label):
+            reviews = self._request_reviews(job)
+        if self.rate_limiter is not None:
+            self.rate_limiter.record_yield(job.label, len(reviews))
+        return reviews
+
+    def _request_reviews(self, job):
+        """
+        Calls the service of a job.
+
+        Args:
+            job (FetchJob): job to run
+
+        Returns:
+            reviews (list): reviews returned by the service
+        """
+        return job.service.request_reviews(**job.kwargs) or []
+
+    def run(self, jobs):
+        """
+        Runs all jobs and collects their results.
+
+        Errors raised by a job are logged and collected, the remaining jobs
+        are still executed.
+
+        Args:
+            jobs (list): list of FetchJob
+
+        Returns:
+            results (list): reviews of all jobs in order of the jobs
+            errors (list): list of FetchError for jobs which failed
+        """
+        return self.run_grouped([jobs])[0]
+
+    def run_grouped(self, groups):
+        """
+        Runs jobs of all groups together and collects results per group.
+
+        Args:
+            groups (list): list of lists of FetchJob
+
+        Returns:
+            outcomes (list): pair of results and errors, as returned by run(),
+                             for every group
+        """
+        jobs = [job for group in groups for job in group]
+        order = list(range(len(jobs)))
+        if self.rate_limiter is not None:
+            order = self.rate_limiter.order(jobs)
+
+        if self.workers == 1 or len(jobs) < 2:
+            finished = dict(
+                (index, self._capture(self._run_job, jobs[index])) for index in order
+            )
+        else:
+            finished = self._run_parallel(jobs, order)
+        outcomes = [finished[index] for index in range(len(jobs))]
+
+        grouped = []
+        outcomes = iter(outcomes)
+        for group in groups:
+            results = []
+            errors = []
+            for job in group:
+                reviews, error = next(outcomes)
+                if error is not None:
+                    log.error("Failed to fetch reviews for %s: %s", job.label, error)
+                    errors.append(FetchError(job=job, error=error))
+                else:
+                    results.extend(reviews)
+            grouped.append((results, errors))
+
+        return grouped
+
+    def _run_parallel(self, jobs, order):
+        """
+        Runs jobs in the worker pool, within the cap of their hosts.
+
+        Jobs are started in the given order, skipping those whose host is
+        busy until one of its jobs finishes.
+
+        Args:
+            jobs (list): list of FetchJob
+            order (list): indexes of the jobs, in order to start them
+
+        Returns:
+            finished (dict): outcome of every job, by its index
+        """
+        finished = {}
+        pending = list(order)
+        running = {}
+        busy = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                waiting = []
+                for index in pending:
+                    host = jobs[index].host
+                    if len(running) >= self.workers or (
+                        self.per_host is not None and busy[host] >= self.per_host
+                    ):
+                        waiting.append(index)
+                        continue
+                    busy[host] += 1
+                    future = executor.submit(self._capture, self._run_job, jobs[index])
+                    running[future] = index
+                pending = waiting
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    busy[jobs[index].host] -= 1
+                    finished[index] = future.result()
+        return finished
+
+    @staticmethod
+    def _capture(func, job):
+        """
+        Calls func with job, capturing raised exception.
+
+        Returns:
+            outcome (tuple): pair of return value and exception
+        """
+        try:
+            return func(job), None
+        except Exception as e:
+            log.debug("Job %s failed", job.label, exc_info=True)
+            return None, e
@@ -1,12 +1,34 @@
 """gerritstack module."""
 from datetime import datetime
 import logging
+import os
+import re
+import threading
+import urllib.parse
 
 import requests
-from reviewrot.basereview import BaseReview, BaseService, gravatar, LastComment
+from reviewrot.basereview import (
+    BaseReview,
+    BaseService,
+    FilterStats,
+    gravatar,
+    LastComment,
+)
+from reviewrot.httpcache import EndpointCache
 
 log = logging.getLogger(__name__)
 
+# projects combined into one query, keeps the query URL reasonably short
+PROJECTS_PER_QUERY = 20
+# changes requested per page by combined queries
+CHANGES_PER_PAGE = 500
+# file in the cache directory storing validated hosts and repositories,
+# without .json suffix so it isn't evicted with cached responses
+ENDPOINTS_FILE = "gerrit-endpoints.cache"
+# ways comments are counted, inline comments unless bulk_comments is used
+INLINE_COMMENTS = "inline"
+MESSAGE_COMMENTS = "messages"
+
 
 class GerritService(BaseService):
     """
@@ -16,24 +38,68 @@ class GerritService(BaseService):
     https://gerrit-review.googlesource.com/Documentation/rest-api.html
     """
 
+    # EndpointCache of every cache directory, shared by all Gerrit entries
+    endpoint_caches = {}
+    endpoint_caches_lock = threading.Lock()
+
     def __init__(self):
         """TODO: docstring goes here."""
-        self.session = requests.session()
+        self.session = self.shared_session()
         self.header = {"Accept": "application/json"}
         self.url = None
         self.host_exists = None
         self.ssl_verify = None
+        # repositories of one host may be queried from several threads
+        self._host_lock = threading.Lock()
+        self.endpoints = EndpointCache()
+        # repositories validated together with the first one requested
+        self._expected = {}
+
+    def use_cache(self, cache):
+        """
+        Sends GET requests through a response cache.
+
+        Validated hosts and repositories are stored in the cache directory.
+
+        Args:
+            cache (ResponseCache): cache used for conditional requests
+        """
+        super(GerritService, self).use_cache(cache)
+        with self.endpoint_caches_lock:
+            if cache.path not in self.endpoint_caches:
+                self.endpoint_caches[cache.path] = EndpointCache(
+                    os.path.join(cache.path, ENDPOINTS_FILE), ttl=cache.ttl
+                )
+            self.endpoints = self.endpoint_caches[cache.path]
+
+    def expect_repos(self, host, repo_names):
+        """
+        Registers repositories which are going to be requested.
+
+        Existence of all registered repositories of a host is checked by
+        one request, when the first of them is requested.
+
+        Args:
+            host (str): Gerrit Host URL
+            repo_names (list): URL quoted Gerrit repository names
+        """
+        with self._host_lock:
+            self._expected.setdefault(host, set()).update(repo_names)
 
     def request_reviews(
         self,
         host,
-        repo_name,
+        repo_name=None,
         age=None,
         user_name=None,
         token=None,
         show_last_comment=None,
         ssl_verify=True,
         reviewers_config=None,
+        ignore_wip=False,
+        repo_names=None,
+        bulk_comments=False,
+        **kwargs
     ):
         """
         Creates a Gerrit object.
@@ -59,6 +125,13 @@ class GerritService(BaseService):
         reviewers endpoint can be used:
         https://gerrit-review.googlesource.com/Documentation/rest-api-changes.html#list-reviewers
 
+        With repo_names, changes of all given repositories are requested
+        by combined queries instead of one query per repository.
+
+        With bulk_comments, change messages are requested together with
+        the changes and comments are derived from them, instead of
+        requesting comments of every change separately.
+
         Args:
             host (str): Gerrit Host URL
             repo_name (str): Gerrit repository name
@@ -74,6 +147,9 @@ class GerritService(BaseService):
                                    or a path to a CA file to use.
             reviewers_config (Optional[Dict]): Controls excluding changes
                 based on invited reviewers.
+            ignore_wip (bool): Omit changes marked as WIP
+            repo_names (list): Gerrit repository names, queried together
+            bulk_comments (bool): Derive comments from change messages
         Returns:
             response (list): Returns list of list of pull requests for
                              specified repo name
@@ -82,25 +158,58 @@ class GerritService(BaseService):
 
         # If the request for reviews is on a different host than the previous
         # request, update the URL and check if the new host exists.
-        if self.url != host:
-            self.url = host
-            self.host_exists = self.get_response(
-                method="HEAD", url=self.url, ssl_verify=ssl_verify
-            )
+        with self._host_lock:
+            if self.url != host:
+                if host in self.endpoints:
+                    self.host_exists = True
+                else:
+                    self.host_exists = self.get_response(
+                        method="HEAD", url=host, ssl_verify=ssl_verify
+                    )
+                    if self.host_exists:
+                        self.endpoints.add(host)
+                self.url = host
 
-        # checks if specified repo exists
-        repo_exists = self.check_repo_exists(repo_name, ssl_verify)
+        repos = repo_names if repo_names is not None else [repo_name]
+
+        # checks if specified repos exist
+        try:
+            repo_exists = self.check_repos_exist(repos, ssl_verify)
+        finally:
+            # written only if some endpoint was validated by this entry
+            self.endpoints.save()
 
         if not self.host_exists or not repo_exists:
             return
 
-        request_url = (
-            "{}/changes/?q=project:{}+status:open"
-            "&o=DETAILED_ACCOUNTS"
-            "&o=DETAILED_LABELS"
-        ).format(self.url, repo_name)
-        log.debug("Looking for change requests for %s -> %s", self.url, repo_name)
-        review_response = self._call_api(url=request_url, ssl_verify=ssl_verify)
+        options = "&o=DETAILED_ACCOUNTS&o=DETAILED_LABELS"
+        if bulk_comments:
+            options += "&o=MESSAGES"
+
+        review_response = []
+        if repo_names is None:
+            log.debug("Looking for change requests for %s -> %s", self.url, repo_name)
+            review_response = self._query_changes(
+                "project:{}+status:open".format(repo_name), options, ssl_verify
+            )
+        else:
+            for start in range(0, len(repo_names), PROJECTS_PER_QUERY):
+                chunk = repo_names[start : start + PROJECTS_PER_QUERY]
+                log.debug(
+                    "Looking for change requests for %s -> %s",
+                    self.url,
+                    ", ".join(chunk),
+                )
+                query = "({})+status:open".format(
+                    "+OR+".join("project:{}".format(repo) for repo in chunk)
+                )
+                review_response.extend(
+                    self._query_changes(
+                        query,
+                        "&n={}{}".format(CHANGES_PER_PAGE, options),
+                        ssl_verify,
+                    )
+                )
 
         if not review_response:
             return []
@@ -110,7 +219,42 @@ class GerritService(BaseService):
         if reviewers_config and reviewers_config.get("ensure", True):
             review_response = self._filter_invited(review_response, **reviewers_config)
 
-        return self.format_response(review_response, age, show_last_comment)
+        return self.format_response(
+            review_response,
+            age,
+            show_last_comment,
+            ignore_wip=ignore_wip,
+            bulk_comments=bulk_comments,
+        )
+
+    def _query_changes(self, query, options, ssl_verify):
+        """
+        Returns all changes matching the query, following pagination.
+
+        Args:
+            query (str): Gerrit search query
+            options (str): additional URL parameters, e.g. &o=MESSAGES
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+
+        Returns:
+            changes (list): changes of all pages
+        """
+        request_url = "{}/changes/?q={}{}".format(self.url, query, options)
+        changes = []
+        while True:
+            page_url = request_url
+            if changes:
+                page_url = "{}&S={}".format(request_url, len(changes))
+            response = self._call_api(url=page_url, ssl_verify=ssl_verify)
+            if not response:
+                break
+
+            changes.extend(response)
+            # the last change of a page is marked if there are more
+            if not response[-1].get("_more_changes"):
+                break
+        return changes
 
     def _filter_invited(self, changes, **kwargs):
         """Filter out changes without users invited to review.
@@ -164,6 +308,77 @@ class GerritService(BaseService):
 
         return reviewers
 
+    def check_repos_exist(self, repo_names, ssl_verify):
+        """
+        Check if repos exist in gerrit.
+
+        Repositories validated before are not checked again. Remaining
+        repositories, together with the expected ones, are looked up by
+        one project listing request. Repositories missing in the listing,
+        e.g. due to its visibility, are checked one by one.
+
+        Args:
+            repo_names (list): URL quoted Gerrit repository names
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+        Returns:
+             true/false(bool): Returns true if all repos exist else false
+        """
+        with self._host_lock:
+            expected = self._expected.pop(self.url, set())
+            pending = [
+                repo
+                for repo in sorted(expected.union(repo_names))
+                if self._project_url(repo) not in self.endpoints
+            ]
+            if len(pending) > 1:
+                found = self._list_projects(pending, ssl_verify)
+                self.endpoints.add(*[self._project_url(repo) for repo in found])
+
+        return all(
+            [
+                self._project_url(repo) in self.endpoints
+                or self.check_repo_exists(repo, ssl_verify)
+                for repo in repo_names
+            ]
+        )
+
+    def _project_url(self, repo_name):
+        """Returns URL of a repository on the current host."""
+        return "{}/projects/{}".format(self.url, repo_name)
+
+    def _list_projects(self, repo_names, ssl_verify):
+        """
+        Returns repositories found by one project listing request.
+
+        Args:
+            repo_names (list): URL quoted Gerrit repository names
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+        Returns:
+            found (list): names of repo_names which exist, as given
+        """
+        names = dict((urllib.parse.unquote_plus(repo), repo) for repo in repo_names)
+        # every character of the names is matched literally
+        regex = "^({})$".format(
+            "|".join(
+                re.sub(r"([^A-Za-z0-9_/-])", r"\\\1", name) for name in sorted(names)
+            )
+        )
+        request_url = "{}/projects/?r={}".format(
+            self.url, urllib.parse.quote(regex, safe="")
+        )
+        log.debug("Checking if %d repos exist", len(names))
+        try:
+            projects = self._call_api(url=request_url, ssl_verify=ssl_verify)
+        except requests.exceptions.HTTPError as e:
+            log.debug("Unable to list projects of %s: %s", self.url, e)
+            return []
+
+        if not isinstance(projects, dict):
+            return []
+        return [repo for name, repo in names.items() if name in projects]
+
     def check_repo_exists(self, repo_name, ssl_verify):
         """
         Check if repo exist in gerrit.
@@ -175,10 +390,11 @@ class GerritService(BaseService):
         Returns:
              true/false(bool): Returns true if repo exist else false
         """
-        request_url = "{}/projects/{}".format(self.url, repo_name)
+        request_url = self._project_url(repo_name)
         log.debug("Checking if repo %s exists", repo_name)
         try:
             self._call_api(url=request_url, ssl_verify=ssl_verify)
+            self.endpoints.add(request_url)
             return True
         except requests.exceptions.HTTPError:
             raise ValueError(
@@ -247,7 +463,59 @@ class GerritService(BaseService):
             # find last comment in list of comments
             return max(comments, key=lambda c: c.created_at)
 
-    def format_response(self, decoded_responses, age, show_last_comment):
+    def get_message_comments(self, change):
+        """
+        Returns change messages written by people.
+
+        Messages generated by Gerrit itself, like uploads of new patch
+        sets, are skipped.
+
+        Args:
+            change (dict): change requested with MESSAGES option
+
+        Returns:
+            messages (list): ChangeMessageInfo dictionaries, oldest first
+        """
+        return [
+            message
+            for message in change.get("messages", [])
+            if message.get("author")
+            and not message.get("tag", "").startswith("autogenerated:")
+        ]
+
+    def get_last_message(self, messages):
+        """
+        Returns information about last of given change messages.
+
+        Args:
+            messages (list): ChangeMessageInfo dictionaries, oldest first
+
+        Returns:
+            last comment (LastComment): Returns namedtuple LastComment
+            with data related to last comment
+        """
+        if not messages:
+            return None
+
+        last_message = messages[-1]
+        author = last_message["author"]
+        return LastComment(
+            author=author.get("username") or author.get("email"),
+            body=last_message["message"],
+            # see get_last_comment for the date format
+            created_at=datetime.strptime(
+                last_message["date"][:-3], "%Y-%m-%d %H:%M:%S.%f"
+            ),
+        )
+
+    def format_response(
+        self,
+        decoded_responses,
+        age,
+        show_last_comment,
+        ignore_wip=False,
+        bulk_comments=False,
+    ):
         """
         Formats the pull requests details and print it on console.
 
@@ -259,11 +527,16 @@ class GerritService(BaseService):
                                      filter out pull requests in which
                                      last comments are newer than
                                      specified number of days
+            ignore_wip (bool): Omit changes marked as WIP
+            bulk_comments (bool): Derive comments from change messages
+                                  included in the response
 
         Returns:
              res_(list): Returns list of pull requests for specified repo name.
         """
         res_ = []
+        stats = FilterStats()
+        comments_mode = MESSAGE_COMMENTS if bulk_comments else INLINE_COMMENTS
         for decoded_response in decoded_responses:
 
             time_format = "%Y-%m-%d %H:%M:%S.%f"
@@ -273,35 +546,46 @@ class GerritService(BaseService):
             updated_date = datetime.strptime(
                 decoded_response["updated"][:-3], time_format
             )
-            result = self.check_request_state(created_date, age)
+            # skip changes filtered out by their metadata before
+            # requesting their comments
+            change_number = decoded_response["_number"]
+            url = "{}/{}".format(self.url, str(change_number))
+            if not self.passes_metadata_filters(
+                decoded_response["subject"],
+                created_date,
+                age,
+                ignore_wip,
+                stats,
+                url=url,
+            ):
+                continue
 
-            comments_request_url = "{}/changes/{}/comments".format(
-                self.url, str(decoded_response["id"])
+            previous = self.previous_review(
+                url, updated_date, stats, comments_mode=comments_mode
             )
+            if previous is not None:
+                comments = previous.comments
+                last_comment = previous.last_comment
+            elif bulk_comments:
+                messages = self.get_message_comments(decoded_response)
+                comments = len(messages)
+                last_comment = self.get_last_message(messages)
+            else:
+                comments_request_url = "{}/changes/{}/comments".format(
+                    self.url, str(decoded_response["id"])
+                )
 
-            comments_response = self._call_api(comments_request_url)
+                comments_response = self._call_api(comments_request_url)
 
-            last_comment = self.get_last_comment(comments_response)
+                comments = self.get_comments_count(comments_response)
+                last_comment = self.get_last_comment(comments_response)
 
-            if result is False:
-                log.debug(
-                    "Change request '%s' is not %s than specified " "time interval",
-                    decoded_response["subject"],
-                    age.state,
-                )
+            if not self.passes_comment_filter(
+                decoded_response["subject"], last_comment, show_last_comment, stats
+            ):
                 continue
 
-            if last_comment and show_last_comment:
-                if self.has_new_comments(last_comment.created_at, show_last_comment):
-                    log.debug(
-                        "Review '%s' had new comments in last %s days",
-                        decoded_response["subject"],
-                        show_last_comment,
-                    )
-                    continue
-
             owner = decoded_response["owner"]
-            change_number = decoded_response["_number"]
 
             # Use the gerrit logo by default
             image = GerritReview.logo
@@ -312,15 +596,21 @@ class GerritService(BaseService):
             res = GerritReview(
                 user=owner.get("username", owner.get("email")),
                 title=decoded_response["subject"],
-                url="{}/{}".format(self.url, str(change_number)),
+                url=url,
                 time=created_date,
                 updated_time=updated_date,
-                comments=self.get_comments_count(comments_response),
+                comments=comments,
                 last_comment=last_comment,
                 project_name=decoded_response["project"],
                 image=image,
+                comments_mode=comments_mode,
             )
             res_.append(res)
+
+        if decoded_responses:
+            # combined queries return changes of several projects
+            projects = sorted(set(change["project"] for change in decoded_responses))
+            stats.log("gerrit {}".format(", ".join(projects)))
         return res_
 
 
@@ -328,4 +618,15 @@ class GerritReview(BaseReview):
     """TODO: docstring goes here."""
 
     logo = "http://electric-cloud.com/wp-content/uploads/2014/09/EC-Gerrit.png"
-    pass
+    __slots__ = ("comments_mode",)
+
+    def __init__(self, comments_mode=INLINE_COMMENTS, **kwargs):
+        """
+        Returns review object.
+
+        Args:
+            comments_mode (str): INLINE_COMMENTS or MESSAGE_COMMENTS
+            kwargs: Arguments of BaseReview
+        """
+        super(GerritReview, self).__init__(**kwargs)
+        self.comments_mode = comments_mode
@@ -1,12 +1,166 @@
 """githubstack module."""
+from collections import OrderedDict
+import datetime
+import functools
 import logging
 
 from github import Github
-from github.GithubException import UnknownObjectException
-from reviewrot.basereview import BaseReview, BaseService, LastComment
+from github.GithubException import GithubException, UnknownObjectException
+import requests
+from reviewrot.basereview import BaseReview, BaseService, FilterStats, LastComment
+from reviewrot.httpcache import mount_cache, wrap_github_sessions
+from reviewrot.retry import github_retry_policy, mount_retry
 
 log = logging.getLogger(__name__)
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Search API returns at most this many results of one query
+SEARCH_RESULTS_LIMIT = 1000
+
+# Open pull requests of a repository together with everything needed to
+# build GithubReview, including counts and the newest review and issue
+# comments, so no further request per pull request is needed.
+PULL_REQUESTS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    nameWithOwner
+    url
+    pullRequests(states: OPEN, first: 50, after: $cursor) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        number
+        title
+        url
+        createdAt
+        updatedAt
+        author {
+          login
+          avatarUrl
+        }
+        comments(last: 1) {
+          totalCount
+          nodes {
+            author {
+              login
+            }
+            body
+            createdAt
+          }
+        }
+        reviews(last: 100) {
+          pageInfo {
+            hasPreviousPage
+            startCursor
+          }
+          nodes {
+            comments(last: 1) {
+              totalCount
+              nodes {
+                author {
+                  login
+                }
+                body
+                createdAt
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# earlier reviews of pull requests with more than 100 of them
+REVIEWS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      reviews(last: 100, before: $cursor) {
+        pageInfo {
+          hasPreviousPage
+          startCursor
+        }
+        nodes {
+          comments(last: 1) {
+            totalCount
+            nodes {
+              author {
+                login
+              }
+              body
+              createdAt
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLUnavailableError(Exception):
+    """GraphQL API can't be used, REST API should be used instead."""
+
+    pass
+
+
+class RepoScanStats(object):
+    """
+    Counters of repositories scanned for a user or organization.
+
+    Repositories listed for a user or organization are skipped when they
+    are archived or have no open issues or pull requests, and the listed
+    repository objects are reused instead of being fetched again. The
+    counters show how many requests that saved.
+    """
+
+    STAGES = (
+        "listed",
+        "skipped_archived",
+        "skipped_empty",
+        "queried",
+        "saved_requests",
+    )
+
+    def __init__(self):
+        """Initialization dunder."""
+        self.counts = OrderedDict((stage, 0) for stage in self.STAGES)
+
+    def add(self, stage, count=1):
+        """
+        Increase counter of a stage.
+
+        Args:
+            stage (str): one of STAGES
+            count (int): number to add
+        """
+        self.counts[stage] += count
+
+    def log(self, label):
+        """
+        Log the counters as debug output.
+
+        Args:
+            label (str): name of the scanned user or organization
+        """
+        log.debug(
+            "Repositories of %s: listed %d, skipped as archived %d, "
+            "skipped without open pull requests %d, queried %d, "
+            "saved %d requests",
+            label,
+            self.counts["listed"],
+            self.counts["skipped_archived"],
+            self.counts["skipped_empty"],
+            self.counts["queried"],
+            self.counts["saved_requests"],
+        )
+
 
 class GithubService(BaseService):
     """
@@ -16,6 +170,52 @@ class GithubService(BaseService):
     https://developer.github.com/v3/
     """
 
+    def __init__(self):
+        """Initialization dunder."""
+        self.session = self.shared_session()
+        self.header = None
+
+    def use_cache(self, cache):
+        """
+        Sends GET requests of the service through a response cache.
+
+        Besides own session used for GraphQL API, it applies to all
+        PyGithub clients.
+
+        Args:
+            cache (ResponseCache): cache used for conditional requests
+        """
+        super(GithubService, self).use_cache(cache)
+        wrap_github_sessions("cache", functools.partial(mount_cache, cache=cache))
+
+    def use_retry(self, retry):
+        """
+        Retries transient failures of the service requests.
+
+        Besides own session used for GraphQL API, it applies to all
+        PyGithub clients.
+
+        Args:
+            retry (RetryPolicy): policy shared by all services
+        """
+        super(GithubService, self).use_retry(retry)
+        # retry policy replaces PyGithub's default GithubRetry
+        policy = github_retry_policy(retry)
+        wrap_github_sessions("retry", functools.partial(mount_retry, retry=policy))
+
+    def use_rate_limiter(self, limiter):
+        """
+        Accounts and throttles requests of the service by a rate limiter.
+
+        Besides own session used for GraphQL API, it applies to all
+        PyGithub clients.
+
+        Args:
+            limiter (RateLimiter): limiter shared by all services
+        """
+        super(GithubService, self).use_rate_limiter(limiter)
+        wrap_github_sessions("rate_limiter", limiter.mount)
+
     def request_reviews(
         self,
         user_name,
@@ -24,6 +224,10 @@ class GithubService(BaseService):
         show_last_comment=None,
         token=None,
         host=None,
+        ssl_verify=True,
+        graphql=False,
+        ignore_wip=False,
+        search=False,
         **kwargs
     ):
         """
@@ -46,13 +250,31 @@ class GithubService(BaseService):
             token (str): Github token for authentication
             host (str): Github host name (This value is not yet supported.
                         Default behavior is to use public github instance.)
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+            graphql (bool): Fetch pull requests with GraphQL API, which needs
+                            one request per 50 pull requests of a repository.
+                            REST API is used if GraphQL API is not available.
+            ignore_wip (bool): Omit pull requests marked as WIP
+            search (bool): Without repo name, find repositories with open
+                           pull requests by search API instead of listing
+                           pull requests of every repository. Repositories
+                           are listed if there are too many pull requests.
         Returns:
             response (list): Returns list of list of pull requests for
                              specified username and reponame or all reponame
                              for given username
         """
-        # get authenticated github object
-        g = Github(token)
+        if graphql and not token:
+            log.debug("GraphQL API requires a token, falling back to REST API")
+            graphql = False
+        if graphql:
+            self.header = {"Authorization": "bearer " + token}
+
+        # get authenticated github object, shared by entries of the token
+        g = self.shared_client(
+            host, token, ssl_verify, lambda: Github(token, pool_size=self.pool_size)
+        )
         log.debug("Github instance created: %s", g)
         try:
             # get user object
@@ -64,37 +286,160 @@ class GithubService(BaseService):
         # if Repository name is explicitely provided
         if repo_name is not None:
             # get pull requests for specified username and repo name
-            res = self.get_reviews(
+            res = self._get_reviews(
+                graphql=graphql,
+                ssl_verify=ssl_verify,
                 uname=uname,
                 repo_name=repo_name,
                 age=age,
                 show_last_comment=show_last_comment,
+                ignore_wip=ignore_wip,
             )
             # extend incase of a non empty result
             if res:
                 response.extend(res)
         else:
-            # get all of the respositories for specified user/organization
-            repo_list = uname.get_repos()
-            if not repo_list:
-                log.debug("No repositories found for user name %s", user_name)
+            repos = None
+            if search:
+                repo_names = self.search_repos_with_pulls(g, uname)
+                if repo_names is not None:
+                    repos = [(repo_name, None) for repo_name in repo_names]
+            if repos is None:
+                # get all of the respositories for specified user/organization
+                repo_list = uname.get_repos()
+                if not repo_list:
+                    log.debug("No repositories found for user name %s", user_name)
+                repos = [
+                    (repo.name, repo)
+                    for repo in self.scannable_repos(repo_list, graphql, user_name)
+                ]
             """
             list pull requests for all of the repositories for specified
             user/organization
             """
-            for repo in repo_list:
-                res = self.get_reviews(
+            for repo_name, repo in repos:
+                res = self._get_reviews(
+                    graphql=graphql,
+                    ssl_verify=ssl_verify,
+                    repo=repo,
                     uname=uname,
-                    repo_name=repo.name,
+                    repo_name=repo_name,
                     age=age,
                     show_last_comment=show_last_comment,
+                    ignore_wip=ignore_wip,
                 )
                 # extend incase of a non empty result
                 if res:
                     response.extend(res)
         return response
 
-    def get_reviews(self, uname, repo_name, age=None, show_last_comment=None):
+    def search_repos_with_pulls(self, g, uname):
+        """
+        Finds repositories of user/organization with open pull requests.
+
+        Open pull requests are searched by one paginated query, so
+        repositories without open pull requests don't cost any request.
+
+        Args:
+            g (github.Github): Github object
+            uname (github.NamedUser.NamedUser): Github user or organization
+        Returns:
+            repo_names (list): names of repositories with open pull requests,
+                               None if the search can't return all of them
+        """
+        qualifier = "org" if uname.type == "Organization" else "user"
+        query = "{}:{} is:pr is:open".format(qualifier, uname.login)
+        log.debug("Searching for repositories with open pull requests: %s", query)
+        repo_names = set()
+        try:
+            results = g.search_issues(query)
+            for issue in results:
+                # known once the first page is fetched
+                if results.totalCount > SEARCH_RESULTS_LIMIT:
+                    log.info(
+                        "%d open pull requests of %s exceed search limit, "
+                        "listing repositories instead",
+                        results.totalCount,
+                        uname.login,
+                    )
+                    return None
+                if results.incomplete_results:
+                    log.info("Search results of %s incomplete", uname.login)
+                    return None
+                repo_names.add(issue.repository_url.rsplit("/", 1)[-1])
+        except GithubException as e:
+            log.warning("Unable to search pull requests of %s: %s", uname.login, e)
+            return None
+        return sorted(repo_names)
+
+    def scannable_repos(self, repo_list, graphql, label):
+        """
+        Filters out listed repositories which can't have open pull requests.
+
+        Args:
+            repo_list (list): repositories of user/organization
+            graphql (bool): pull requests are fetched with GraphQL API
+            label (str): name of the user/organization used in logs
+        Returns:
+            repos (list): repositories to look for pull requests in
+        """
+        # REST API needs to get the repository and its pull requests,
+        # GraphQL API one query
+        requests_per_repo = 1 if graphql else 2
+        stats = RepoScanStats()
+        repos = []
+        for repo in repo_list:
+            stats.add("listed")
+            if repo.archived:
+                stats.add("skipped_archived")
+            elif repo.open_issues_count == 0:
+                # open issues count includes open pull requests
+                stats.add("skipped_empty")
+            else:
+                repos.append(repo)
+                continue
+            stats.add("saved_requests", requests_per_repo)
+
+        stats.add("queried", len(repos))
+        if not graphql:
+            # listed repository objects are reused by get_reviews
+            stats.add("saved_requests", len(repos))
+        stats.log("github {}".format(label))
+        return repos
+
+    def _get_reviews(self, graphql, ssl_verify, repo=None, **kwargs):
+        """
+        Fetches pull requests with GraphQL API if requested, REST API otherwise.
+
+        Args:
+            graphql (bool): Try GraphQL API first
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+            repo (github.Repository.Repository): Already fetched repository,
+                                                 used by REST API
+            kwargs: Arguments of get_reviews method
+        Returns:
+            res_ (list): Returns list of pull requests for specified
+                         username and repo name
+        """
+        if graphql:
+            try:
+                return self.get_reviews_graphql(ssl_verify=ssl_verify, **kwargs)
+            except GraphQLUnavailableError as e:
+                log.warning("GraphQL API not available, using REST API: %s", e)
+        if repo is not None:
+            kwargs["repo"] = repo
+        return self.get_reviews(**kwargs)
+
+    def get_reviews(
+        self,
+        uname,
+        repo_name,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        repo=None,
+    ):
         """
         Fetches pull requests for specified username and repo name.
 
@@ -110,18 +455,24 @@ class GithubService(BaseService):
                                      filter out pull requests in which
                                      last comments are newer than
                                      specified number of days
+            ignore_wip (bool): Omit pull requests marked as WIP
+            repo (github.Repository.Repository): Repository object, fetched
+                                                 by repo name if not given
         Returns:
             res_ (list): Returns list of pull requests for specified
                          username and repo name
         """
-        try:
-            # get repository object for given user/organization and repo name
-            repo = uname.get_repo(repo_name)
-        except UnknownObjectException:
-            log.exception("Repository %s not found for user %s", repo_name, uname.login)
-            raise Exception(
-                "Repository %s not found for user %s" % (repo_name, uname.login)
-            )
+        if repo is None:
+            try:
+                # get repository object for given user/organization and repo name
+                repo = uname.get_repo(repo_name)
+            except UnknownObjectException:
+                log.exception(
+                    "Repository %s not found for user %s", repo_name, uname.login
+                )
+                raise Exception(
+                    "Repository %s not found for user %s" % (repo_name, uname.login)
+                )
         log.debug(
             "Looking for pull requests for %s -> %s/%s ",
             "github",
@@ -133,31 +484,26 @@ class GithubService(BaseService):
         if not pull_requests:
             log.debug("No open pull requests found for %s/%s ", uname.login, repo_name)
         res_ = []
+        stats = FilterStats()
 
         for pr in pull_requests:
-            last_comment = self.get_last_comment(pr)
-
-            """ check if review request is older/newer than specified time
-            interval"""
-            result = self.check_request_state(pr.created_at, age)
-
-            if result is False:
-                # skip the current pull request
-                log.debug(
-                    "review request '%s' is not %s than specified" " time interval",
-                    pr.title,
-                    age.state,
-                )
+            # skip pull requests filtered out by their metadata before
+            # looking up their comments
+            if not self.passes_metadata_filters(
+                pr.title, pr.created_at, age, ignore_wip, stats, url=pr.html_url
+            ):
                 continue
 
-            if last_comment and show_last_comment:
-                if self.has_new_comments(last_comment.created_at, show_last_comment):
-                    log.debug(
-                        "Pull request '%s' had " "new comments in last %s days",
-                        pr.title,
-                        show_last_comment,
-                    )
-                    continue
+            previous = self.previous_review(pr.html_url, pr.updated_at, stats)
+            if previous is not None:
+                last_comment = previous.last_comment
+            else:
+                last_comment = self.get_last_comment(pr)
+
+            if not self.passes_comment_filter(
+                pr.title, last_comment, show_last_comment, stats
+            ):
+                continue
 
             res = GithubReview(
                 user=pr.user.login,
@@ -173,8 +519,224 @@ class GithubService(BaseService):
             )
             log.debug(res)
             res_.append(res)
+
+        stats.log("github {}/{}".format(uname.login, repo_name))
+        return res_
+
+    def get_reviews_graphql(
+        self,
+        uname,
+        repo_name,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        ssl_verify=True,
+    ):
+        """
+        Fetches pull requests for specified username and repo name with GraphQL.
+
+        Pull requests, their comment counts and last comments are fetched in
+        one query per 50 pull requests. Reviews of pull requests with more
+        than 100 of them are completed by additional queries.
+
+        Args:
+            uname (github.NamedUser.NamedUser): Github user or organization
+            repo_name (str): Github repository name for specified
+                             username or organization
+            age (Age): Contains the filter state for pull requests,
+                       e.g, older or newer and date
+            show_last_comment (int): Show text of last comment and
+                                     filter out pull requests in which
+                                     last comments are newer than
+                                     specified number of days
+            ignore_wip (bool): Omit pull requests marked as WIP
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+        Returns:
+            res_ (list): Returns list of pull requests for specified
+                         username and repo name
+        Raises:
+            GraphQLUnavailableError if the query can't be answered by GraphQL API
+        """
+        log.debug(
+            "Looking for pull requests for %s -> %s/%s using GraphQL",
+            "github",
+            uname.login,
+            repo_name,
+        )
+        res_ = []
+        stats = FilterStats()
+        cursor = None
+        while True:
+            repository = self._graphql(
+                PULL_REQUESTS_QUERY,
+                {"owner": uname.login, "name": repo_name, "cursor": cursor},
+                ssl_verify=ssl_verify,
+            ).get("repository")
+            if repository is None:
+                raise Exception(
+                    "Repository %s not found for user %s" % (repo_name, uname.login)
+                )
+
+            pull_requests = repository["pullRequests"]
+            for pr in pull_requests["nodes"]:
+                created_at = self._parse_time(pr["createdAt"])
+                if not self.passes_metadata_filters(
+                    pr["title"], created_at, age, ignore_wip, stats, url=pr["url"]
+                ):
+                    continue
+
+                pr["reviews"]["nodes"] = self._all_reviews_graphql(
+                    uname.login, repo_name, pr, ssl_verify
+                )
+                last_comment = self.get_last_comment_graphql(pr)
+
+                if not self.passes_comment_filter(
+                    pr["title"], last_comment, show_last_comment, stats
+                ):
+                    continue
+
+                review_comments = sum(
+                    review["comments"]["totalCount"]
+                    for review in pr["reviews"]["nodes"]
+                )
+                author = pr["author"] or {}
+                res = GithubReview(
+                    user=author.get("login"),
+                    title=pr["title"],
+                    url=pr["url"],
+                    time=created_at,
+                    updated_time=self._parse_time(pr["updatedAt"]),
+                    comments=review_comments + pr["comments"]["totalCount"],
+                    image=author.get("avatarUrl"),
+                    last_comment=last_comment,
+                    project_name=repository["nameWithOwner"],
+                    project_url=repository["url"],
+                )
+                log.debug(res)
+                res_.append(res)
+
+            if not pull_requests["pageInfo"]["hasNextPage"]:
+                break
+            cursor = pull_requests["pageInfo"]["endCursor"]
+
+        if not res_:
+            log.debug("No open pull requests found for %s/%s ", uname.login, repo_name)
+        stats.log("github {}/{}".format(uname.login, repo_name))
         return res_
 
+    def _all_reviews_graphql(self, owner, repo_name, pr, ssl_verify=True):
+        """
+        Returns all reviews of pull request fetched by GraphQL.
+
+        PULL_REQUESTS_QUERY returns the last 100 reviews only, earlier ones
+        are requested page by page, so none of their comments are missed.
+
+        Args:
+            owner (str): Github user or organization login
+            repo_name (str): Github repository name
+            pr (dict): Pull request returned by PULL_REQUESTS_QUERY
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+        Returns:
+            reviews (list): review nodes, the oldest first
+        Raises:
+            GraphQLUnavailableError if the query can't be answered by GraphQL API
+        """
+        reviews = pr["reviews"]
+        nodes = list(reviews["nodes"])
+        page_info = reviews["pageInfo"]
+        while page_info["hasPreviousPage"]:
+            repository = self._graphql(
+                REVIEWS_QUERY,
+                {
+                    "owner": owner,
+                    "name": repo_name,
+                    "number": pr["number"],
+                    "cursor": page_info["startCursor"],
+                },
+                ssl_verify=ssl_verify,
+            ).get("repository")
+            if not repository or not repository.get("pullRequest"):
+                raise GraphQLUnavailableError("Reviews of %s not found" % pr["url"])
+            reviews = repository["pullRequest"]["reviews"]
+            nodes = reviews["nodes"] + nodes
+            page_info = reviews["pageInfo"]
+        return nodes
+
+    def _graphql(self, query, variables, ssl_verify=True):
+        """
+        Calls Github GraphQL API.
+
+        Args:
+            query (str): GraphQL query
+            variables (dict): Values of query variables
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+        Returns:
+            data (dict): Data returned by the query
+        Raises:
+            GraphQLUnavailableError if the request or the query fails
+        """
+        try:
+            response = self._call_api(
+                url=GRAPHQL_URL,
+                method="POST",
+                ssl_verify=ssl_verify,
+                json={"query": query, "variables": variables},
+            )
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise GraphQLUnavailableError(str(e))
+
+        errors = response.get("errors")
+        if errors:
+            # Missing repository is reported as an error, but it's not
+            # a reason to try REST API
+            if all(error.get("type") == "NOT_FOUND" for error in errors):
+                return {}
+            raise GraphQLUnavailableError(
+                ", ".join(error.get("message", "") for error in errors)
+            )
+        return response.get("data") or {}
+
+    def get_last_comment_graphql(self, pr):
+        """
+        Returns information about last comment of pull request fetched by GraphQL.
+
+        Args:
+            pr (dict): Pull request returned by PULL_REQUESTS_QUERY
+
+        Returns:
+            last comment (LastComment): Returns namedtuple LastComment
+            with data related to last comment
+        """
+        comments = list(pr["comments"]["nodes"])
+        for review in pr["reviews"]["nodes"]:
+            comments.extend(review["comments"]["nodes"])
+
+        if comments:
+            # timestamps are in ISO 8601 format, so they can be compared
+            # as strings
+            last_comment = max(comments, key=lambda c: c["createdAt"])
+            return LastComment(
+                author=(last_comment["author"] or {}).get("login"),
+                body=last_comment["body"],
+                created_at=self._parse_time(last_comment["createdAt"]),
+            )
+
+    @staticmethod
+    def _parse_time(value):
+        """
+        Converts timestamp returned by GraphQL API to datetime.
+
+        Args:
+            value (str): timestamp, e.g. 2019-05-24T10:12:02Z
+
+        Returns:
+            datetime (datetime.datetime): naive datetime in UTC
+        """
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
     def get_last_comment(self, pr):
         """
         Returns information about last comment of given pull request.
@@ -221,4 +783,4 @@ class GithubService(BaseService):
 class GithubReview(BaseReview):
     """TODO: docstring goes here."""
 
-    pass
+    __slots__ = ()
@@ -1,15 +1,23 @@
 """gitlabstack module."""
+from collections import OrderedDict
 import datetime
 import logging
 import os
 
 import gitlab
 from gitlab.exceptions import GitlabGetError, GitlabListError
+from gitlab.v4.objects import ProjectMergeRequest
 from requests.exceptions import SSLError
-from reviewrot.basereview import BaseReview, BaseService, LastComment
+from reviewrot.basereview import BaseReview, BaseService, FilterStats, LastComment
 
 log = logging.getLogger(__name__)
 
+# number of merge requests whose notes are looked up at the same time
+DEFAULT_COMMENT_WORKERS = 4
+# notes are listed newest first, so the last comment is usually on the
+# first small page, unless it's buried under system notes
+NOTES_PER_PAGE = 20
+
 
 class GitlabService(BaseService):
     """
@@ -19,6 +27,34 @@ class GitlabService(BaseService):
     https://docs.gitlab.com/ee/api/
     """
 
+    def __init__(self):
+        """Initialization dunder."""
+        # given to python-gitlab clients, so the response cache, retries
+        # and rate limiter mounted to it apply to them
+        self.session = self.shared_session()
+
+    def _create_client(self, host, token, ssl_verify):
+        """
+        Creates authenticated python-gitlab client using the shared session.
+
+        Args:
+            host (str): Gitlab host name
+            token (str): Gitlab token for authentication
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+
+        Returns:
+            gl (gitlab.Gitlab): Gitlab client
+        """
+        gl = gitlab.Gitlab(host, token, ssl_verify=ssl_verify, session=self.session)
+        try:
+            gl.auth()
+        except SSLError as e:
+            log.exception("Error during authentification: %s", str(e))
+
+        log.debug("Gitlab instance created: %s", gl)
+        return gl
+
     def request_reviews(
         self,
         user_name,
@@ -28,6 +64,8 @@ class GitlabService(BaseService):
         token=None,
         host=None,
         ssl_verify=True,
+        ignore_wip=False,
+        comment_workers=None,
         **kwargs
     ):
         """
@@ -51,18 +89,24 @@ class GitlabService(BaseService):
             host (str): Gitlab host name for authentication
             ssl_verify (bool/str): Whether or not to verify SSL certificates,
                                    or a path to a CA file to use.
+            ignore_wip (bool): Omit merge requests marked as WIP
+            comment_workers (int): Number of merge requests whose last
+                                   comment is looked up at the same time,
+                                   DEFAULT_COMMENT_WORKERS if None
         Returns:
             response (list): Returns the list of pull requests for
                              specified user(group) name and projectname or all
                              projectname for given groupname
         """
-        gl = gitlab.Gitlab(host, token, ssl_verify=ssl_verify)
-        try:
-            gl.auth()
-        except SSLError as e:
-            log.exception("Error during authentification: %s", str(e))
-
-        log.debug("Gitlab instance created: %s", gl)
+        if comment_workers is None:
+            comment_workers = DEFAULT_COMMENT_WORKERS
+
+        gl = self.shared_client(
+            host,
+            token,
+            ssl_verify,
+            lambda: self._create_client(host, token, ssl_verify),
+        )
         response = []
         # if Repository name is explicitly provided
         if repo_name is not None:
@@ -80,6 +124,8 @@ class GitlabService(BaseService):
                 project=project,
                 age=age,
                 show_last_comment=show_last_comment,
+                ignore_wip=ignore_wip,
+                comment_workers=comment_workers,
             )
             # extend in case of a non empty result
             if res:
@@ -92,24 +138,183 @@ class GitlabService(BaseService):
                 log.debug("Invalid user/group name: %s", user_name)
                 raise Exception("Invalid user/group name: %s" % user_name)
 
-            # get projects list for specified group
-            group_projects = group.projects.list(all=True, simple=True)
+            try:
+                res = self.get_group_reviews(
+                    gl=gl,
+                    uname=user_name,
+                    group=group,
+                    age=age,
+                    show_last_comment=show_last_comment,
+                    ignore_wip=ignore_wip,
+                    comment_workers=comment_workers,
+                )
+            except GitlabListError:
+                # group merge requests endpoint is not available on old
+                # Gitlab versions
+                log.warning(
+                    "Unable to list merge requests of group %s, "
+                    "listing them per project",
+                    user_name,
+                )
+                res = self.get_project_reviews(
+                    gl=gl,
+                    uname=user_name,
+                    group=group,
+                    age=age,
+                    show_last_comment=show_last_comment,
+                    ignore_wip=ignore_wip,
+                    comment_workers=comment_workers,
+                )
+            response.extend(res)
+        return response
 
-            if not group_projects:
-                log.debug("No projects found for user/group name %s", user_name)
+    def get_group_reviews(
+        self,
+        gl,
+        uname,
+        group,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        comment_workers=DEFAULT_COMMENT_WORKERS,
+    ):
+        """
+        Fetches merge requests of all projects of a group at once.
+
+        Open merge requests of the group and its subgroups are listed by
+        the group merge requests endpoint and grouped by project locally,
+        so projects without any open merge request cost no API call.
+
+        Args:
+            gl (gitlab.Gitlab): Gitlab client
+            uname (str): Gitlab group name
+            group (gitlab.v4.objects.Group): Gitlab group
+            age (Age): Contains the filter state for pull requests,
+                       e.g, older or newer and date
+            show_last_comment (int): Show text of last comment and
+                                     filter out pull requests in which
+                                     last comments are newer than
+                                     specified number of days
+            ignore_wip (bool): Omit merge requests marked as WIP
+            comment_workers (int): Number of merge requests whose last
+                                   comment is looked up at the same time
 
-            # get merge requests for all projects for specified group
-            for group_project in group_projects:
+        Returns:
+            res_ (list): Returns list of pull requests for all projects
+                         of the group
+        """
+        log.debug("Looking for merge requests for %s -> all projects", uname)
+        merge_requests = group.mergerequests.list(
+            state="opened", include_subgroups=True, all=True, per_page=100
+        )
+        if not merge_requests:
+            log.debug("No open merge requests found for %s", uname)
+            return []
 
-                project = gl.projects.get(group_project.id)
-                res = self.get_reviews(uname=user_name, project=project, age=age)
+        by_project = OrderedDict()
+        for mr in merge_requests:
+            by_project.setdefault(mr.project_id, []).append(mr)
 
-                # extend in case of a non empty result
-                if res:
-                    response.extend(res)
-        return response
+        # names and URLs of projects, listed in bulk as well
+        projects = dict(
+            (project.id, project)
+            for project in group.projects.list(
+                all=True, simple=True, include_subgroups=True, per_page=100
+            )
+        )
+
+        res_ = []
+        for project_id, group_merge_requests in by_project.items():
+            project = projects.get(project_id)
+            if project is None:
+                # e.g. project shared with the group from elsewhere
+                project = gl.projects.get(project_id)
+
+            # merge requests bound to their project, so their notes can be
+            # listed, without fetching the project
+            manager = gl.projects.get(project_id, lazy=True).mergerequests
+            project_merge_requests = [
+                ProjectMergeRequest(manager, mr.attributes)
+                for mr in group_merge_requests
+            ]
+            res_.extend(
+                self.format_reviews(
+                    uname=uname,
+                    project=project,
+                    merge_requests=project_merge_requests,
+                    age=age,
+                    show_last_comment=show_last_comment,
+                    ignore_wip=ignore_wip,
+                    comment_workers=comment_workers,
+                )
+            )
+        return res_
+
+    def get_project_reviews(
+        self,
+        gl,
+        uname,
+        group,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        comment_workers=DEFAULT_COMMENT_WORKERS,
+    ):
+        """
+        Fetches merge requests of all projects of a group one by one.
+
+        Args:
+            gl (gitlab.Gitlab): Gitlab client
+            uname (str): Gitlab group name
+            group (gitlab.v4.objects.Group): Gitlab group
+            age (Age): Contains the filter state for pull requests,
+                       e.g, older or newer and date
+            show_last_comment (int): Show text of last comment and
+                                     filter out pull requests in which
+                                     last comments are newer than
+                                     specified number of days
+            ignore_wip (bool): Omit merge requests marked as WIP
+            comment_workers (int): Number of merge requests whose last
+                                   comment is looked up at the same time
 
-    def get_reviews(self, uname, project, age=None, show_last_comment=None):
+        Returns:
+            res_ (list): Returns list of pull requests for all projects
+                         of the group
+        """
+        # get projects list for specified group
+        group_projects = group.projects.list(all=True, simple=True)
+
+        if not group_projects:
+            log.debug("No projects found for user/group name %s", uname)
+
+        res_ = []
+        # get merge requests for all projects for specified group
+        for group_project in group_projects:
+
+            project = gl.projects.get(group_project.id)
+            res = self.get_reviews(
+                uname=uname,
+                project=project,
+                age=age,
+                show_last_comment=show_last_comment,
+                ignore_wip=ignore_wip,
+                comment_workers=comment_workers,
+            )
+
+            # extend in case of a non empty result
+            if res:
+                res_.extend(res)
+        return res_
+
+    def get_reviews(
+        self,
+        uname,
+        project,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        comment_workers=DEFAULT_COMMENT_WORKERS,
+    ):
         """
         Fetches merge requests for specified username(groupname) and repo(project) name.
 
@@ -125,6 +330,9 @@ class GitlabService(BaseService):
                                      filter out pull requests in which
                                      last comments are newer than
                                      specified number of days
+            ignore_wip (bool): Omit merge requests marked as WIP
+            comment_workers (int): Number of merge requests whose last
+                                   comment is looked up at the same time
 
         Returns:
             res_ (list): Returns list of pull requests for specified
@@ -144,11 +352,54 @@ class GitlabService(BaseService):
 
         if not merge_requests:
             log.debug("No open merge requests found for %s/%s ", uname, project.name)
-        res_ = []
-        for mr in merge_requests:
 
-            last_comment = self.get_last_comment(mr)
+        return self.format_reviews(
+            uname=uname,
+            project=project,
+            merge_requests=merge_requests,
+            age=age,
+            show_last_comment=show_last_comment,
+            ignore_wip=ignore_wip,
+            comment_workers=comment_workers,
+        )
+
+    def format_reviews(
+        self,
+        uname,
+        project,
+        merge_requests,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        comment_workers=DEFAULT_COMMENT_WORKERS,
+    ):
+        """
+        Filters merge requests of a project and formats them as reviews.
+
+        Last comments of merge requests passing the metadata filters are
+        looked up together, comment_workers at a time.
 
+        Args:
+            uname (str): Gitlab namespace
+            project (gitlab.v4.objects.Project): Gitlab project
+            merge_requests (list): open merge requests of the project
+            age (Age): Contains the filter state for pull requests,
+                       e.g, older or newer and date
+            show_last_comment (int): Show text of last comment and
+                                     filter out pull requests in which
+                                     last comments are newer than
+                                     specified number of days
+            ignore_wip (bool): Omit merge requests marked as WIP
+            comment_workers (int): Number of merge requests whose last
+                                   comment is looked up at the same time
+
+        Returns:
+            res_ (list): Returns list of pull requests for specified
+                         user(group) name and project name
+        """
+        candidates = []
+        stats = FilterStats()
+        for mr in merge_requests:
             try:
                 mr_date = datetime.datetime.strptime(
                     mr.created_at, "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -165,26 +416,35 @@ class GitlabService(BaseService):
                     mr.updated_at, "%Y-%m-%dT%H:%M:%SZ"
                 )
 
-            """ check if review request is older/newer than specified time
-            interval"""
-            result = self.check_request_state(mr_date, age)
-
-            if result is False:
-                log.debug(
-                    "merge request '%s' is not %s than specified" " time interval",
-                    mr.title,
-                    age.state,
-                )
+            # skip merge requests filtered out by their metadata before
+            # looking up their notes
+            if not self.passes_metadata_filters(
+                mr.title, mr_date, age, ignore_wip, stats, url=mr.web_url
+            ):
                 continue
 
-            if last_comment and show_last_comment:
-                if self.has_new_comments(last_comment.created_at, show_last_comment):
-                    log.debug(
-                        "merge request '%s' has new " "comments  in last %s days",
-                        mr.title,
-                        show_last_comment,
-                    )
-                    continue
+            previous = self.previous_review(mr.web_url, mr_updated_date, stats)
+            candidates.append((mr, mr_date, mr_updated_date, previous))
+
+        # enrichment stage, notes of all remaining merge requests at once
+        last_comments = iter(
+            self.get_last_comments(
+                [mr for mr, _, _, previous in candidates if previous is None],
+                workers=comment_workers,
+            )
+        )
+
+        res_ = []
+        for mr, mr_date, mr_updated_date, previous in candidates:
+            if previous is not None:
+                last_comment = previous.last_comment
+            else:
+                last_comment = next(last_comments)
+
+            if not self.passes_comment_filter(
+                mr.title, last_comment, show_last_comment, stats
+            ):
+                continue
 
             res = GitlabReview(
                 user=mr.author["username"],
@@ -203,12 +463,31 @@ class GitlabService(BaseService):
 
             log.debug(res)
             res_.append(res)
+
+        stats.log("gitlab {}/{}".format(uname, project.name))
         return res_
 
+    def get_last_comments(self, merge_requests, workers=DEFAULT_COMMENT_WORKERS):
+        """
+        Returns last comments of given merge requests.
+
+        Args:
+            merge_requests (list): Gitlab merge requests
+            workers (int): Number of merge requests looked up at the same time
+
+        Returns:
+            last comments (list): LastComment or None for every merge request,
+                                  in the same order
+        """
+        return self.map_workers(self.get_last_comment, merge_requests, workers)
+
     def get_last_comment(self, mr):
         """
         Returns information about last comment of given merge request.
 
+        Notes are listed newest first in small pages, so usually only
+        the first page is needed.
+
         Args:
             mr (gitlab.v4.objects.ProjectMergeRequest): Gitlab merge request
 
@@ -216,15 +495,23 @@ class GitlabService(BaseService):
             last comment (LastComment): Returns namedtuple LastComment
             with data related to last comment
         """
-        for note in mr.notes.list():
-            if not note.system:
-                return LastComment(
-                    author=note.author["username"],
-                    body=note.body,
-                    created_at=datetime.datetime.strptime(
-                        note.created_at, "%Y-%m-%dT%H:%M:%S.%fZ"
-                    ),
-                )
+        page = 1
+        while True:
+            notes = mr.notes.list(
+                sort="desc", order_by="created_at", per_page=NOTES_PER_PAGE, page=page
+            )
+            for note in notes:
+                if not note.system:
+                    return LastComment(
+                        author=note.author["username"],
+                        body=note.body,
+                        created_at=datetime.datetime.strptime(
+                            note.created_at, "%Y-%m-%dT%H:%M:%S.%fZ"
+                        ),
+                    )
+            if len(notes) < NOTES_PER_PAGE:
+                return None
+            page += 1
 
 
 class GitlabReview(BaseReview):
@@ -232,4 +519,4 @@ class GitlabReview(BaseReview):
 
     # XXX - Here just until we figure out how to do gitlab avatars.
     logo = "https://docs.gitlab.com/assets/images/gitlab-logo.svg"
-    pass
+    __slots__ = ()
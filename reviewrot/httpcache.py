@@ -0,0 +1,512 @@
+"""httpcache module."""
+import base64
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import DEFAULT_POOLSIZE, DEFAULT_RETRIES, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+log = logging.getLogger(__name__)
+
+# Headers which identify who is asking, responses for different
+# identities are cached separately
+AUTH_HEADERS = ("Authorization", "Private-Token", "Job-Token", "Cookie")
+
+# Headers describing the transfer of the original body, which don't apply
+# to the decoded body stored in cache
+TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+# Configurators of sessions of PyGithub connections, see wrap_github_sessions()
+GITHUB_SESSION_CONFIGURATORS = OrderedDict()
+GITHUB_SESSIONS_LOCK = threading.Lock()
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Yields file replacing the given one once it is written.
+
+    The file is written next to the target first, so readers never see
+    a partially written file. The temporary file is removed on errors.
+
+    Args:
+        path (str): path of the file to replace
+
+    Yields:
+        file (file): text file to write to
+    """
+    directory = os.path.dirname(path) or "."
+    fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of HTTP responses used for conditional requests.
+
+    Every entry is stored in its own file, keyed by URL and a hash of the
+    credentials used for the request. Modification time of the file is the
+    last time the entry was stored or revalidated. Entries not used for ttl
+    seconds are dropped. When the cache grows over max_size bytes, the least
+    recently used entries are evicted. The directory is scanned for the size
+    of the cache once, stored entries then keep a running total.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        """
+        Returns cache object.
+
+        Args:
+            path (str): Directory to store the cached responses in
+            ttl (int): Number of seconds an entry is kept for
+            max_size (int): Maximum size of the cache in bytes
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # total size of the entries, unknown until the directory is scanned
+        self._size = None
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(request):
+        """
+        Returns cache key of a request.
+
+        Args:
+            request (requests.PreparedRequest): request to compute key for
+
+        Returns:
+            key (str): hex digest of URL and credentials of the request
+        """
+        digest = hashlib.sha256(request.url.encode("utf-8"))
+        for header in AUTH_HEADERS:
+            value = request.headers.get(header)
+            if value:
+                digest.update(b"\0" + header.lower().encode("utf-8"))
+                digest.update(b"\0" + value.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _file(self, key):
+        """Returns path of the file storing entry with given key."""
+        return os.path.join(self.path, key + ".json")
+
+    def get(self, key):
+        """
+        Returns cached entry, or None if there is no valid entry.
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            entry (dict): url, headers and base64 encoded body of the response
+        """
+        filename = self._file(key)
+        try:
+            stat = os.stat(filename)
+            age = time.time() - stat.st_mtime
+            if self.ttl is not None and age > self.ttl:
+                log.debug("Cached response %s expired", key)
+                self._remove(filename)
+                self._resize(-stat.st_size)
+                return None
+            with open(filename, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, key, response):
+        """
+        Stores response in the cache.
+
+        Args:
+            key (str): cache key
+            response (requests.Response): response to store
+        """
+        headers = dict(
+            (name, value)
+            for name, value in response.headers.items()
+            if name.lower() not in TRANSFER_HEADERS
+        )
+        entry = {
+            "url": response.url,
+            "headers": headers,
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        # write to a temporary file first, so concurrent readers never see
+        # a partially written entry
+        filename = self._file(key)
+        previous = self._entry_size(filename)
+        try:
+            with atomic_write(filename) as f:
+                json.dump(entry, f)
+                size = f.tell()
+        except (IOError, OSError):
+            # the response is still used, it's just not cached
+            log.warning("Unable to store cached response to %s", self.path)
+            return
+        self._resize(size - previous)
+
+    def touch(self, key):
+        """
+        Marks entry as recently used and valid.
+
+        Args:
+            key (str): cache key
+        """
+        try:
+            os.utime(self._file(key), None)
+        except OSError:
+            log.debug("Unable to refresh cache entry %s", key)
+
+    @staticmethod
+    def _entry_size(filename):
+        """Returns size of an entry file, 0 if there's none."""
+        try:
+            return os.stat(filename).st_size
+        except OSError:
+            return 0
+
+    def _resize(self, delta):
+        """
+        Updates total size of the entries, evicting entries over max_size.
+
+        Args:
+            delta (int): bytes added to the cache, negative if removed
+        """
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += delta
+            # the first entry stored is counted by scanning the directory
+            over = self._size is None or self._size > self.max_size
+        if over and delta > 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries over the size limit.
+
+        The directory is scanned, so entries stored by other processes are
+        counted too, and the total size is updated.
+        """
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith(".json"):
+                    continue
+                filename = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, filename in sorted(entries):
+                if size <= self.max_size:
+                    break
+                log.debug("Evicting cached response %s", filename)
+                self._remove(filename)
+                size -= entry_size
+            self._size = size
+
+    @staticmethod
+    def _remove(filename):
+        """Removes file, ignoring already removed files."""
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class ValueCache(object):
+    """
+    Values looked up from a service, like avatar URLs of users.
+
+    Values are kept in memory for ttl seconds. When a path is given, they
+    are also stored in a JSON file by save(), so following runs don't need
+    to look up the same values again.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        """
+        Returns cache object.
+
+        Args:
+            path (str): File to store the values in, kept in memory only
+                        if None
+            ttl (int): Number of seconds a value is kept for
+        """
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values = {}
+        # values were cached since they were loaded or stored
+        self._dirty = False
+        if path is not None:
+            try:
+                with open(path, "r") as f:
+                    for key, (stored, value) in json.load(f).items():
+                        self._values[key] = (float(stored), value)
+            except (IOError, OSError, ValueError, TypeError, AttributeError):
+                log.debug("No cached values loaded from %s", path)
+
+    def _valid(self, stored):
+        """Returns True if value stored at given time didn't expire."""
+        return self.ttl is None or time.time() - stored <= self.ttl
+
+    def get(self, key):
+        """
+        Returns cached value.
+
+        Args:
+            key (str): key of the value
+
+        Returns:
+            value: the value, None if it isn't cached or expired
+        """
+        entry = self._values.get(key)
+        if entry is None or not self._valid(entry[0]):
+            return None
+        return entry[1]
+
+    def update(self, values):
+        """
+        Caches values.
+
+        Args:
+            values (dict): values by their keys
+        """
+        now = time.time()
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = (now, value)
+            self._dirty = self._dirty or bool(values)
+
+    def save(self):
+        """
+        Stores values which didn't expire yet.
+
+        Nothing is written if no path is set or no value was cached since
+        the values were loaded or last stored.
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            values = dict(
+                (key, entry)
+                for key, entry in self._values.items()
+                if self._valid(entry[0])
+            )
+        try:
+            with atomic_write(self.path) as f:
+                json.dump(values, f)
+        except (IOError, OSError):
+            log.warning("Unable to store cached values to %s", self.path)
+            with self._lock:
+                self._dirty = True
+
+
+class EndpointCache(ValueCache):
+    """
+    Endpoints, like hosts and repositories, validated to exist.
+
+    Only successful validations are cached, missing endpoints are always
+    checked again. Validations are stored by save().
+    """
+
+    def __contains__(self, endpoint):
+        """Returns True if endpoint was validated within ttl seconds."""
+        return self.get(endpoint) is not None
+
+    def add(self, *endpoints):
+        """
+        Marks endpoints as validated.
+
+        Args:
+            endpoints (str): URLs of the validated endpoints
+        """
+        self.update(dict((endpoint, True) for endpoint in endpoints))
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter revalidating cached GET responses.
+
+    Requests for cached URLs are sent with If-None-Match/If-Modified-Since
+    headers. When the server answers 304 Not Modified, the cached body is
+    returned instead. Github doesn't count such responses against the rate
+    limit.
+    """
+
+    def __init__(self, cache, **kwargs):
+        """
+        Returns adapter object.
+
+        Args:
+            cache (ResponseCache): cache to store responses in
+            kwargs: Arguments of requests.adapters.HTTPAdapter
+        """
+        super(CachingAdapter, self).__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        """Sends request, using cached response if it wasn't modified."""
+        conditional = "If-None-Match" in request.headers or (
+            "If-Modified-Since" in request.headers
+        )
+        if request.method != "GET" or conditional:
+            return super(CachingAdapter, self).send(request, **kwargs)
+
+        key = self.cache.key(request)
+        entry = self.cache.get(key)
+        if entry:
+            headers = CaseInsensitiveDict(entry["headers"])
+            if headers.get("ETag"):
+                request.headers["If-None-Match"] = headers["ETag"]
+            if headers.get("Last-Modified"):
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        response = super(CachingAdapter, self).send(request, **kwargs)
+
+        if entry and response.status_code == 304:
+            log.debug("Using cached response for %s", request.url)
+            self.cache.touch(key)
+            return self._cached_response(entry, request, response)
+
+        if response.status_code == 200 and (
+            "ETag" in response.headers or "Last-Modified" in response.headers
+        ):
+            self.cache.set(key, response)
+
+        return response
+
+    def _cached_response(self, entry, request, not_modified):
+        """
+        Builds response from cached entry.
+
+        Args:
+            entry (dict): cached entry
+            request (requests.PreparedRequest): the request sent
+            not_modified (requests.Response): 304 response from the server
+
+        Returns:
+            response (requests.Response): response with the cached body
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        # fresh headers, e.g. rate limit state, take precedence
+        for name, value in not_modified.headers.items():
+            if name.lower() not in TRANSFER_HEADERS:
+                response.headers[name] = value
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        response.from_cache = True
+        not_modified.close()
+        return response
+
+
+def mount_cache(session, cache):
+    """
+    Mounts caching adapter to a requests session.
+
+    Pool sizes and retries of the adapter it replaces are kept.
+
+    Args:
+        session (requests.Session): session to mount the adapter to
+        cache (ResponseCache): cache to use
+    """
+    current = session.get_adapter("https://")
+    if isinstance(current, CachingAdapter) and current.cache is cache:
+        return
+    adapter = CachingAdapter(
+        cache,
+        pool_connections=getattr(current, "_pool_connections", DEFAULT_POOLSIZE),
+        pool_maxsize=getattr(current, "_pool_maxsize", DEFAULT_POOLSIZE),
+        max_retries=getattr(current, "max_retries", DEFAULT_RETRIES),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def wrap_github_sessions(name, configure):
+    """
+    Configures requests sessions of PyGithub connections.
+
+    PyGithub creates its own sessions, so its https connection class is
+    replaced, once, by a subclass passing the session of every connection
+    created afterwards to all configurators, in order they were added.
+    Adding a configurator of the same name again replaces it.
+
+    Args:
+        name (str): name of the configurator, e.g. cache
+        configure (callable): called with requests.Session of every new
+                              PyGithub connection
+    """
+    from github import Requester
+
+    # injectConnectionClasses() would also disable persistent connections,
+    # so only the https connection class is replaced
+    attribute = "_Requester__httpsConnectionClass"
+    with GITHUB_SESSIONS_LOCK:
+        base = getattr(Requester.Requester, attribute, None)
+        if base is None:
+            log.warning("Unable to configure sessions of Github REST API")
+            return
+
+        installed = getattr(base, "session_configurators", None)
+        if installed is not GITHUB_SESSION_CONFIGURATORS:
+
+            class ConfiguredConnection(base):
+                """PyGithub connection with configured session."""
+
+                session_configurators = GITHUB_SESSION_CONFIGURATORS
+
+                def __init__(self, *args, **kwargs):
+                    """Initialization dunder."""
+                    super(ConfiguredConnection, self).__init__(*args, **kwargs)
+                    for configurator in list(self.session_configurators.values()):
+                        configurator(self.session)
+
+            setattr(Requester.Requester, attribute, ConfiguredConnection)
+
+        GITHUB_SESSION_CONFIGURATORS[name] = configure
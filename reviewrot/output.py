@@ -0,0 +1,116 @@
+"""output module."""
+import json
+import logging
+
+from reviewrot.basereview import FORMATTERS, RelativeAge
+
+log = logging.getLogger(__name__)
+
+# Styles written as JSON documents, one per review for ndjson
+JSON_STYLES = ("json", "ndjson")
+
+
+class ReviewWriter(object):
+    """
+    Writes formatted reviews to a stream one by one.
+
+    Every review is formatted and written as soon as it is passed to the
+    writer, so memory used doesn't grow with the size of the output. The
+    json style is written as one array, the ndjson style as one JSON
+    document per line, which downstream tools can process line by line.
+    """
+
+    def __init__(
+        self, stream, style="oneline", show_last_comment=None, compact=False, now=None
+    ):
+        """
+        Returns writer object.
+
+        Args:
+            stream (file): stream to write to
+            style (str): the name of the style
+            show_last_comment (int): show last_comment text in output
+            compact (bool): write JSON without indentation and spaces
+            now (datetime.datetime or RelativeAge): current UTC time
+                                                    durations are relative
+                                                    to, taken if None
+        """
+        if style not in JSON_STYLES and style not in FORMATTERS:
+            raise KeyError(style)
+        self.stream = stream
+        self.style = style
+        self.show_last_comment = show_last_comment
+        self.compact = compact
+        if not isinstance(now, RelativeAge):
+            now = RelativeAge(now)
+        self.now = now
+        self.count = 0
+        self.closed = False
+
+    def __enter__(self):
+        """Starts the output."""
+        if self.style == "json":
+            self.stream.write("[\n")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Finishes the output, even if it was interrupted."""
+        self.close()
+
+    def _dumps(self, review):
+        """Returns review as JSON document."""
+        data = review.__json__(self.show_last_comment, now=self.now)
+        if self.compact or self.style == "ndjson":
+            separators = (",", ":") if self.compact else None
+            return json.dumps(data, separators=separators)
+        return json.dumps(data, indent=2)
+
+    def write(self, review):
+        """
+        Writes one review.
+
+        Args:
+            review (BaseReview): review to write
+        """
+        if self.style == "json":
+            # the separator is written once the next review comes
+            if self.count:
+                self.stream.write(",\n")
+            self.stream.write(self._dumps(review))
+        elif self.style == "ndjson":
+            self.stream.write(self._dumps(review) + "\n")
+        else:
+            formatter = FORMATTERS[self.style]
+            line = formatter(review, self.count, None, self.show_last_comment, self.now)
+            self.stream.write(line + "\n")
+        self.count += 1
+
+    def close(self):
+        """Finishes the output and flushes the stream."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.style == "json":
+            self.stream.write("\n]\n" if self.count else "]\n")
+        self.stream.flush()
+        log.debug("Wrote %d reviews as %s", self.count, self.style)
+
+
+def write_reviews(stream, reviews, style="oneline", show_last_comment=None, **kwargs):
+    """
+    Writes reviews to a stream as they are iterated.
+
+    Args:
+        stream (file): stream to write to
+        reviews (iterable): reviews to write, may be a generator
+        style (str): the name of the style
+        show_last_comment (int): show last_comment text in output
+        kwargs: Arguments of ReviewWriter
+
+    Returns:
+        count (int): number of reviews written
+    """
+    with ReviewWriter(stream, style, show_last_comment, **kwargs) as writer:
+        for review in reviews:
+            writer.write(review)
+    return writer.count
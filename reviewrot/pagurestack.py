@@ -1,23 +1,70 @@
 """pagurestack module."""
+import calendar
 from datetime import datetime
 import hashlib
 import logging
+import os
+import re
+import threading
 
 import requests
-from reviewrot.basereview import BaseReview, BaseService, LastComment
+from reviewrot.basereview import BaseReview, BaseService, FilterStats, LastComment
+from reviewrot.httpcache import ValueCache
 from six.moves import urllib
 
 log = logging.getLogger(__name__)
 
+DEFAULT_AVATAR_WORKERS = 4
+# maximum number of pull requests per page allowed by Pagure
+PULL_REQUESTS_PER_PAGE = 100
+
 
 class PagureService(BaseService):
     """TODO: docstring goes here."""
 
+    # ValueCache of avatar URLs of every instance, shared by all entries
+    avatar_caches = {}
+    avatar_caches_lock = threading.Lock()
+
     def __init__(self):
         """Initialization dunder."""
-        self.session = requests.session()
+        self.session = self.shared_session()
         self.instance = "https://pagure.io"
         self.header = None
+        self.cache = None
+
+    def use_cache(self, cache):
+        """
+        Sends GET requests through a response cache.
+
+        Avatar URLs are stored in the cache directory between runs.
+
+        Args:
+            cache (ResponseCache): cache used for conditional requests
+        """
+        super(PagureService, self).use_cache(cache)
+        self.cache = cache
+
+    def avatar_cache(self):
+        """
+        Returns avatar URLs of users of the instance, shared by all entries.
+
+        Returns:
+            avatars (ValueCache): avatar URLs by user names
+        """
+        with self.avatar_caches_lock:
+            if self.instance not in self.avatar_caches:
+                if self.cache is not None:
+                    host = urllib.parse.urlparse(self.instance).netloc
+                    name = re.sub(r"[^\w.-]", "_", host)
+                    path = os.path.join(
+                        self.cache.path, "pagure-avatars-{}.cache".format(name)
+                    )
+                    avatars = ValueCache(path, ttl=self.cache.ttl)
+                else:
+                    avatars = ValueCache()
+                self.avatar_caches[self.instance] = avatars
+            return self.avatar_caches[self.instance]
 
     def request_reviews(
         self,
@@ -28,6 +75,9 @@ class PagureService(BaseService):
         host=None,
         token=None,
         ssl_verify=True,
+        ignore_wip=False,
+        avatar_workers=None,
+        local_avatars=False,
         **kwargs
     ):
         """
@@ -35,6 +85,9 @@ class PagureService(BaseService):
 
         For specified username(namespace) and repo(project) name.
         Formats the merge requests details and print it on console.
+        All pages of open pull requests are read. When only pull requests
+        newer than some date are requested, Pagure is asked to return only
+        pull requests updated since then.
 
         Args:
             user_name (str): Pagure username or organization name
@@ -52,6 +105,11 @@ class PagureService(BaseService):
                         The default behavior is to use public pagure instance)
             ssl_verify (bool/str): Whether or not to verify SSL certificates,
                                    or a path to a CA file to use.
+            ignore_wip (bool): Omit pull requests marked as WIP
+            avatar_workers (int): Number of avatar URLs looked up at the same
+                                  time, DEFAULT_AVATAR_WORKERS if None
+            local_avatars (bool): Construct libravatar URLs from user names
+                                  instead of looking them up
         Returns:
             res_ (list): Returns list of pull requests for specified
                          namespace and/or repo name
@@ -76,14 +134,16 @@ class PagureService(BaseService):
             request_url = "{}/api/0/{}/pull-requests".format(self.instance, repo_name)
             log.debug("Looking for pull requests for %s -> %s", "pagure.io", repo_name)
         log.debug("Calling API with request_url: %s", request_url)
-        try:
-            response = self._call_api(url=request_url, ssl_verify=ssl_verify)
-        except requests.exceptions.HTTPError:
-            raise ValueError(
-                "No repo found. Please check the repo " "name in config file."
-            )
-        res_ = []
-        for res in response["requests"]:
+        params = {"status": "Open", "per_page": PULL_REQUESTS_PER_PAGE}
+        if age is not None and age.state == "newer":
+            # pull requests created after the date were updated after it too
+            params["updated_since"] = calendar.timegm(age.date.timetuple())
+
+        if avatar_workers is None:
+            avatar_workers = DEFAULT_AVATAR_WORKERS
+        candidates = []
+        stats = FilterStats()
+        for res in self._pull_requests(request_url, params, ssl_verify):
             # if namespace exists in response
             if res["project"]["namespace"]:
                 repo_reference = "{}/{}".format(
@@ -92,8 +152,6 @@ class PagureService(BaseService):
             else:
                 repo_reference = res["project"]["name"]
 
-            last_comment = self.get_last_comment(res)
-
             # format pull request url
             url = "https://pagure.io/{}/pull-request/{}".format(
                 repo_reference, res["id"]
@@ -113,43 +171,90 @@ class PagureService(BaseService):
                 date = datetime.strptime(created_date, "%Y-%m-%d %H:%M:%S")
                 updated_time = datetime.strptime(updated_date, "%Y-%m-%d %H:%M:%S")
 
-            """ check if review request is older/newer than specified time
-            interval"""
-            result = self.check_request_state(date, age)
-            if result is False:
-                log.debug(
-                    "pull request '%s' is not %s than specified" " time interval",
-                    res["title"],
-                    age.state,
-                )
+            # skip pull requests filtered out by their metadata before
+            # looking up avatars of their authors
+            if not self.passes_metadata_filters(
+                res["title"], date, age, ignore_wip, stats, url=url
+            ):
                 continue
 
-            if last_comment and show_last_comment:
-                if self.has_new_comments(last_comment.created_at, show_last_comment):
-                    log.debug(
-                        "pull request '%s' has new " "comments in last %s days",
-                        res["title"],
-                        show_last_comment,
-                    )
-                    continue
+            last_comment = self.get_last_comment(res)
+
+            if not self.passes_comment_filter(
+                res["title"], last_comment, show_last_comment, stats
+            ):
+                continue
 
+            previous = self.previous_review(url, updated_time, stats)
             project_url = "https://pagure.io/{}".format(repo_reference)
-            res = PagureReview(
+            review = dict(
                 user=res["user"]["name"],
                 title=res["title"],
                 url=url,
                 time=date,
                 updated_time=updated_time,
                 comments=len(res["comments"]),
-                image=self._avatar(res["user"]["name"], ssl_verify=ssl_verify),
                 last_comment=last_comment,
                 project_name=repo_reference,
                 project_url=project_url,
             )
+            candidates.append((review, previous))
+
+        # look up avatar of every author once
+        avatars = self.get_avatars(
+            [review["user"] for review, previous in candidates if previous is None],
+            ssl_verify=ssl_verify,
+            workers=avatar_workers,
+            local=local_avatars,
+        )
+
+        res_ = []
+        for review, previous in candidates:
+            if previous is not None:
+                image = previous.image
+            else:
+                image = avatars[review["user"]]
+
+            res = PagureReview(image=image, **review)
             log.debug(res)
             res_.append(res)
+
+        stats.log("pagure {}".format(request_url))
         return res_
 
+    def _pull_requests(self, request_url, params, ssl_verify):
+        """
+        Yields pull requests of all pages of a pull request listing.
+
+        Args:
+            request_url (str): URL of the first page
+            params (dict): query parameters of the first page
+            ssl_verify (bool/str): Whether or not to verify SSL certificates,
+                                   or a path to a CA file to use.
+
+        Yields:
+            pull request (dict): pull request returned by Pagure API
+        """
+        try:
+            response = self._call_api(
+                url=request_url, ssl_verify=ssl_verify, params=params
+            )
+        except requests.exceptions.HTTPError:
+            raise ValueError(
+                "No repo found. Please check the repo " "name in config file."
+            )
+
+        while True:
+            for res in response["requests"]:
+                yield res
+
+            # URL of the next page already contains all query parameters
+            next_url = (response.get("pagination") or {}).get("next")
+            if not next_url:
+                return
+            log.debug("Calling API with request_url: %s", next_url)
+            response = self._call_api(url=next_url, ssl_verify=ssl_verify)
+
     def get_last_comment(self, res):
         """
         Returns information about last comment of given pull request.
@@ -174,6 +279,51 @@ class PagureService(BaseService):
                 created_at=last_comment_date,
             )
 
+    def get_avatars(self, usernames, ssl_verify=True, workers=1, local=False):
+        """
+        Returns avatar URLs of given pagure users.
+
+        Every user is looked up once. Users whose avatar URL was looked up
+        before are taken from the avatar cache, the others are looked up
+        concurrently.
+
+        Args:
+            usernames (list): users to fetch avatar URLs for, may repeat
+            ssl_verify (bool): whether or not to verify the identity
+                               cert of the pagure instance
+            workers (int): Number of users looked up at the same time
+            local (bool): construct libravatar URLs instead of looking
+                          them up
+
+        Returns:
+           avatars (dict): avatar URLs by user names
+        """
+        unique = list(dict.fromkeys(usernames))
+        if local:
+            return dict((username, self._libravatar(username)) for username in unique)
+
+        cache = self.avatar_cache()
+        avatars = {}
+        missing = []
+        for username in unique:
+            avatar_url = cache.get(username)
+            if avatar_url is None:
+                missing.append(username)
+            else:
+                avatars[username] = avatar_url
+
+        if missing:
+            log.debug("Looking up avatars of %d users", len(missing))
+
+            def lookup(username):
+                return self._avatar(username, ssl_verify=ssl_verify)
+
+            found = self.map_workers(lookup, missing, workers)
+            cache.update(dict(zip(missing, found)))
+            cache.save()
+            avatars.update(zip(missing, found))
+        return avatars
+
     def _avatar(self, username, ssl_verify=True):
         """
         Return the avatar URL of a given pagure user.
@@ -215,15 +365,27 @@ class PagureService(BaseService):
                 "Pagure instance does not expose user's avatar URL. "
                 "Fallback to construct based on username"
             )
-            query = urllib.parse.urlencode(avatar_query)
-            openid = u"http://%s.id.fedoraproject.org/" % username
-            idx = hashlib.sha256(openid.encode("utf-8")).hexdigest()
-            avatar_url = "https://seccdn.libravatar.org/avatar/%s?%s" % (idx, query)
+            avatar_url = self._libravatar(username)
 
         return avatar_url
 
+    def _libravatar(self, username):
+        """
+        Return the libravatar URL constructed from a pagure user name.
+
+        Args:
+            username (str): user to construct avatar URL for
+
+        Returns:
+           avatar_url (str): The avatar URL for the given user
+        """
+        query = urllib.parse.urlencode({"s": 64, "d": "retro"})
+        openid = u"http://%s.id.fedoraproject.org/" % username
+        idx = hashlib.sha256(openid.encode("utf-8")).hexdigest()
+        return "https://seccdn.libravatar.org/avatar/%s?%s" % (idx, query)
+
 
 class PagureReview(BaseReview):
     """TODO: docstring goes here."""
 
-    pass
+    __slots__ = ()
@@ -1,24 +1,205 @@
 """phabricatorstack module."""
 import datetime
 import logging
+import os
 import re
+import threading
 
-from phabricator import Phabricator
-from reviewrot.basereview import BaseReview, BaseService, LastComment
+from phabricator import parse_interfaces, Phabricator
+from reviewrot.basereview import BaseReview, BaseService, FilterStats, LastComment
+from reviewrot.httpcache import DEFAULT_TTL, ValueCache
 
 try:
-    from urllib.parse import urljoin
+    from urllib.parse import urljoin, urlparse
 except ImportError:
-    from urlparse import urljoin
+    from urlparse import urljoin, urlparse
 
 log = logging.getLogger(__name__)
 
+# revisions whose comments are requested by one getrevisioncomments call
+REVISIONS_PER_QUERY = 100
+# users requested by one user.query call
+USERS_PER_QUERY = 100
+# format of stored Conduit method schemas, stored schemas of other
+# formats are downloaded again
+SCHEMA_VERSION = 1
+
+
+class UserDirectory(ValueCache):
+    """
+    Phabricator users of one host, indexed by PHID and user name.
+
+    Users are cached by their PHIDs for ttl seconds, and stored in a JSON
+    file by save() when a path is given, so following runs don't need to
+    query the same users again. User names are indexed on top.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        """
+        Returns directory object.
+
+        Args:
+            path (str): File to store the users in, kept in memory only
+                        if None
+            ttl (int): Number of seconds a user is kept for
+        """
+        super(UserDirectory, self).__init__(path, ttl=ttl)
+        self._by_name = dict(
+            (user["userName"], phid)
+            for phid, (_, user) in self._values.items()
+            if isinstance(user, dict) and "userName" in user
+        )
+
+    def get_by_name(self, user_name):
+        """
+        Returns user with given user name.
+
+        Args:
+            user_name (str): user name of the user
+
+        Returns:
+            user (dict): user as returned by user.query, None if unknown
+        """
+        phid = self._by_name.get(user_name)
+        if phid is None:
+            return None
+        return self.get(phid)
+
+    def __contains__(self, phid):
+        """Returns True if user with given PHID is known."""
+        return self.get(phid) is not None
+
+    def add(self, users):
+        """
+        Adds queried users.
+
+        Args:
+            users (lst(dict)): users as returned by user.query
+        """
+        users = list(users)
+        self.update(dict((user["phid"], user) for user in users))
+        with self._lock:
+            for user in users:
+                self._by_name[user["userName"]] = user["phid"]
+
 
 class PhabricatorService(BaseService):
     """This class represents Phabricator Service for Review Rot."""
 
+    # ResponseCache whose directory stores user directories, if used
+    cache = None
+    # UserDirectory of every host, shared by all Phabricator entries
+    directories = {}
+    directories_lock = threading.Lock()
+
+    def use_cache(self, cache):
+        """
+        Stores resolved users and Conduit schemas in the cache directory.
+
+        Args:
+            cache (ResponseCache): cache whose directory and ttl are used
+        """
+        self.cache = cache
+
+    def use_retry(self, retry):
+        """
+        Skips the retry policy, which applies to requests sessions only.
+
+        The phabricator library sends Conduit calls by its own HTTP client,
+        so Phabricator requests are not retried.
+
+        Args:
+            retry (RetryPolicy): policy shared by all services
+        """
+        log.debug("Retry policy is not supported by Phabricator service")
+
+    def _cache_file(self, kind, host):
+        """Returns path of file in the cache directory storing data of a host."""
+        name = re.sub(r"[^\w.-]", "_", urlparse(host).netloc or host)
+        return os.path.join(
+            self.cache.path, "phabricator-{}-{}.cache".format(kind, name)
+        )
+
+    def get_client(self, host, token):
+        """
+        Returns Phabricator client, shared by all entries of a host.
+
+        The client knows the Conduit method schema of the host. Without a
+        cache, the schema is downloaded once per host and token. With a
+        cache, it is stored in the cache directory and downloaded again
+        only after cache_ttl seconds.
+
+        Args:
+            host (str): The host Phabricator server url
+            token (str): Phabricator token for authentication
+
+        Returns:
+            phab (Phabricator): client of the host
+        """
+        return self.shared_client(
+            host, token, None, lambda: self._create_client(host, token)
+        )
+
+    def _create_client(self, host, token):
+        """
+        Creates Phabricator client with Conduit method schema of the host.
+
+        Args:
+            host (str): The host Phabricator server url
+            token (str): Phabricator token for authentication
+
+        Returns:
+            phab (Phabricator): client of the host
+        """
+        # Create Phabricator object with token
+        phab = Phabricator(host=urljoin(host, "/api/"), token=token)
+        if self.cache is None:
+            phab.update_interfaces()
+            return phab
+
+        schemas = ValueCache(self._cache_file("schema", host), ttl=self.cache.ttl)
+        # schemas stored in other formats are downloaded again
+        key = "conduit-{}".format(SCHEMA_VERSION)
+        schema = schemas.get(key)
+        if schema is None:
+            schema = dict(phab.conduit.query())
+            schemas.update({key: schema})
+            schemas.save()
+        return Phabricator(
+            host=urljoin(host, "/api/"),
+            token=token,
+            interface=parse_interfaces(schema),
+        )
+
+    def user_directory(self, host):
+        """
+        Returns directory of users of a host, shared by all entries.
+
+        Args:
+            host (str): The host Phabricator server url
+
+        Returns:
+            users (UserDirectory): users of the host
+        """
+        with self.directories_lock:
+            if host not in self.directories:
+                path = None
+                ttl = DEFAULT_TTL
+                if self.cache is not None:
+                    path = self._cache_file("users", host)
+                    ttl = self.cache.ttl
+                self.directories[host] = UserDirectory(path, ttl=ttl)
+            return self.directories[host]
+
     def request_reviews(
-        self, host, token, user_names=None, age=None, show_last_comment=None, **kwargs
+        self,
+        host,
+        token,
+        user_names=None,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
+        **kwargs
     ):
         """
         Returns revision requests for specified username and repo name.
@@ -36,48 +217,48 @@ class PhabricatorService(BaseService):
                                      filter out pull requests in which
                                      last comments are newer than
                                      specified number of days
+            ignore_wip (bool): Omit revisions marked as WIP
         Returns:
             response (list): Returns list of list of pull requests for
                              specified username and reponame or all reponame
                              for given username
         Note:
-            We will use the list 'raw_response' to keep track of the
-            raw queries we make to phabricator. We do this to keep
-            API calls minimal, and first search through raw_response
-            before making another API call.
+            We will use the UserDirectory of the host to keep track of
+            the users we come across. We do this to keep API calls
+            minimal, and first search through the directory before
+            making another API call.
         """
-        # Create Phabricator object with token
-        phab = Phabricator(host=urljoin(host, "/api/"), token=token)
-        phab.update_interfaces()
+        # Reuse Phabricator object of the host
+        phab = self.get_client(host, token)
         # Create response list
         response = []
-        # Create raw response list to keep track of users we've come across
-        raw_response = []
+        # Directory to keep track of users we've come across
+        users = self.user_directory(host)
         if user_names:
             # Find open reviews for all users (aka the list user_names)
 
             # Generate a list of user phids based on their username
-            # Also begin keeping track of queried users in raw_response
-            user_phids, raw_response = self.generate_phids(user_names, phab)
+            user_phids = self.generate_phids(user_names, phab, users)
 
             # Query phabricator based on all users passed
             reviews = self.differential_query(
-                status="status-open", responsibleUsers=user_phids, phab=phab
+                status="status-open", responsible_users=user_phids, phab=phab
             )
         else:
             # Find all open reviews
             reviews = self.differential_query(
-                status="status-open", responsibleUsers=[], phab=phab
+                status="status-open", responsible_users=[], phab=phab
             )
 
         # Format and go through all reviews for a user
         res = self.get_reviews(
             phab=phab,
             reviews=reviews,
-            raw_response=raw_response,
+            users=users,
             host=host,
             age=age,
             show_last_comment=show_last_comment,
+            ignore_wip=ignore_wip,
         )
         # extend in case of non-empty results
         # If we've come across a revision that's dated < duration
@@ -86,20 +267,31 @@ class PhabricatorService(BaseService):
         if res:
             response.extend(res)
 
+        users.save()
         return response
 
     def get_reviews(
-        self, phab, reviews, raw_response, host, age=None, show_last_comment=None
+        self,
+        phab,
+        reviews,
+        users,
+        host,
+        age=None,
+        show_last_comment=None,
+        ignore_wip=False,
     ):
         """
         Fetches pull requests for specified username and repo name.
 
         Formats the pull requests details and print it on console.
+        Comments of all revisions and all their authors and commenters
+        are requested together, so the number of API calls doesn't grow
+        with the number of revisions.
         Args:
                 phab (object): This is the Phabricator object to make API calls
                 reviews (dict): The list of open reviews that we are looking at
-                raw_response (lst(dict)): The raw data in the query, to use be used
-                                          later to minimize API calls
+                users (UserDirectory): The users we've seen, to be used
+                                       to minimize API calls
                 host (str): The host Phabricator server url
                 age (Age): Contains the filter state for pull requests,
                            e.g, older or newer and date
@@ -107,49 +299,64 @@ class PhabricatorService(BaseService):
                                              filter out pull requests in which
                                              last comments are newer than
                                              specified number of days
+                ignore_wip (bool): Omit revisions marked as WIP
         Returns:
                 response (list): Returns list of pull requests for specified
                                  username and repo name
         """
         response = []
+        stats = FilterStats()
+        candidates = []
         for review in reviews:
-            # Check if there is a last comment
-            comments = self.get_comments(id=review["id"], phab=phab)
-            last_comment = self.get_last_comment(
-                comments=comments, phab=phab, raw_response=raw_response
-            )
-
             # Get and convert the date created and last modified to datetime
 
             date_created = self.time_from_epoch(review["dateCreated"])
             date_modified = self.time_from_epoch(review["dateModified"])
 
-            result = self.check_request_state(date_created, age)
+            # Check if review should be looked at before requesting
+            # its comments
+            if not self.passes_metadata_filters(
+                review["title"], date_created, age, ignore_wip, stats, url=review["uri"]
+            ):
+                continue
+
+            previous = self.previous_review(review["uri"], date_modified, stats)
+            candidates.append((review, date_created, date_modified, previous))
 
-            # Check if review should be looked at
-            if result is False:
-                # Skip the current review
-                log.debug(
-                    "review request '%s' is not %s than specified" " time interval",
-                    review["title"],
-                    age.state,
+        # Request comments of all revisions changed since previous run at once
+        changed = [review for review, _, _, previous in candidates if previous is None]
+        comments_by_id = self.get_comments_bulk(
+            ids=[review["id"] for review in changed], phab=phab
+        )
+        # Resolve authors of the revisions and of their last comments at once
+        phids = [review["authorPHID"] for review, _, _, _ in candidates]
+        phids.extend(
+            transactions[0]["authorPHID"]
+            for transactions in comments_by_id.values()
+            if transactions
+        )
+        self.resolve_users(phids, users, phab)
+
+        for review, date_created, date_modified, previous in candidates:
+            if previous is not None:
+                comments = previous.comments
+                last_comment = previous.last_comment
+            else:
+                # Check if there is a last comment
+                transactions = comments_by_id[review["id"]]
+                comments = len(transactions)
+                last_comment = self.get_last_comment(
+                    comments=transactions, phab=phab, users=users
                 )
-                continue
 
-            if last_comment and show_last_comment:
-                # If our reviews last comment is newer than show_last_comment, skip
-                if self.has_new_comments(last_comment.created_at, show_last_comment):
-                    log.debug(
-                        "Pull request '%s' had " "new comments in last %s days",
-                        review["title"],
-                        show_last_comment,
-                    )
-                    continue
+            # If our reviews last comment is newer than show_last_comment, skip
+            if not self.passes_comment_filter(
+                review["title"], last_comment, show_last_comment, stats
+            ):
+                continue
             # Query the author to get relevant information and
-            # update raw_response if needed
-            author_data, raw_response = self.author_data(
-                review["authorPHID"], raw_response, phab
-            )
+            # update users if needed
+            author_data = self.author_data(review["authorPHID"], users, phab)
 
             # Remove any fluff if the URL has it (i.e. www.google.com/api
             # to www.google.com)
@@ -165,7 +372,7 @@ class PhabricatorService(BaseService):
                 url=review["uri"],
                 time=date_created,
                 updated_time=date_modified,
-                comments=len(comments),
+                comments=comments,
                 image=author_data["image"],
                 last_comment=last_comment,
                 project_name="Phabricator",
@@ -173,27 +380,42 @@ class PhabricatorService(BaseService):
             )
             log.debug(res)
             response.append(res)
+
+        stats.log("phabricator {}".format(host))
         return response
 
-    def generate_phids(self, user_names, phab):
+    def generate_phids(self, user_names, phab, users):
         """
         Function to generate the phids from the usernames passed into the config file.
 
+        Only users not found in the directory are queried, by one API call
+        per USERS_PER_QUERY users.
+
         Args:
                 user_names (lst(str)): The list of usernames
                 phab (object): This is the Phabricator object to make API calls
+                users (UserDirectory): The users we've seen, updated with
+                                       the queried ones
         Returns:
                 list_of_phids (lst): A list of all phids associated with the users
-                raw_response (lst(dict)): The raw data in the query, to use be used
-                                          later to minimize API calls
         """
         list_of_phids = []
-        raw_response = []
-        query = self.user_query_usernames(user_names, phab)
-        for user in query:
-            raw_response.append(user)
-            list_of_phids.append(user["phid"])
-        return list_of_phids, raw_response
+        missing = []
+        for user_name in user_names:
+            user = users.get_by_name(user_name)
+            if user is None:
+                missing.append(user_name)
+            else:
+                list_of_phids.append(user["phid"])
+
+        for start in range(0, len(missing), USERS_PER_QUERY):
+            query = self.user_query_usernames(
+                missing[start : start + USERS_PER_QUERY], phab
+            )
+            users.add(query)
+            for user in query:
+                list_of_phids.append(user["phid"])
+        return list_of_phids
 
     def get_comments(self, id, phab):
         """
@@ -208,16 +430,60 @@ class PhabricatorService(BaseService):
                 list_of_all_comments (lst): Returns an list
                                             representation of all comments
         """
-        # Make API call to get a timeline of review (all events)
-        timeline = phab.differential.getrevisioncomments(ids=[int(id)])[id]
-        # Create a list to return
-        list_of_all_comments = []
-        for event in timeline:
-            if event["action"] == "comment":
-                list_of_all_comments.append(event)
-        return list_of_all_comments
+        return self.get_comments_bulk(ids=[id], phab=phab)[id]
+
+    def get_comments_bulk(self, ids, phab):
+        """
+        Helper function to get all comments for many revisions.
+
+        Comments are requested by one API call per REVISIONS_PER_QUERY
+        revisions.
+
+        Args:
+                ids (lst(str)): The ID numbers for the revisions
+                phab (object): This is the Phabricator object to make API calls
+                                (>=0.7.0)
+
+        Returns:
+                comments (dict): Returns lists of all comments keyed by
+                                 the revision ID
+        """
+        comments = {}
+        for start in range(0, len(ids), REVISIONS_PER_QUERY):
+            chunk = ids[start : start + REVISIONS_PER_QUERY]
+            # Make API call to get a timeline of reviews (all events)
+            timelines = phab.differential.getrevisioncomments(
+                ids=[int(id) for id in chunk]
+            )
+            for id in chunk:
+                comments[id] = [
+                    event for event in timelines[id] if event["action"] == "comment"
+                ]
+        return comments
+
+    def resolve_users(self, phids, users, phab):
+        """
+        Helper function to query all users not seen yet.
+
+        Users are requested by one API call per USERS_PER_QUERY users.
+
+        Args:
+                phids (lst(str)): The phids of users to look up
+                users (UserDirectory): The users we've seen, updated with
+                                       the queried ones
+                phab (object): This is the Phabricator object to make API calls
+                                (>=0.7.0)
+        """
+        missing = []
+        for phid in phids:
+            if phid not in users and phid not in missing:
+                missing.append(phid)
+
+        for start in range(0, len(missing), USERS_PER_QUERY):
+            chunk = missing[start : start + USERS_PER_QUERY]
+            users.add(self.user_query_ids(chunk, phab))
 
-    def get_last_comment(self, comments, phab, raw_response):
+    def get_last_comment(self, comments, phab, users):
         """
         Helper function to get the last comment from a list of comments.
 
@@ -226,20 +492,16 @@ class PhabricatorService(BaseService):
                                         associated with a revision
                 phab (object): This is the Phabricator object to make API calls
                                 (>=0.7.0)
-                raw_response (lst(dict)): The raw response received from
-                                            individual user.query calls.
-                                            Keep updating and passing this
-                                            list as we call user.query
+                users (UserDirectory): The users we've seen, updated
+                                       as we call user.query
         Returns:
                 LastComment (object): Returns the LastComment object
                                       that can be used in ReviewRot
         """
         if len(comments) > 0:
             # Get the username for the last comment
-            author, raw_response = self.author_data(
-                author_phid=comments[0]["authorPHID"],
-                phab=phab,
-                raw_response=raw_response,
+            author = self.author_data(
+                author_phid=comments[0]["authorPHID"], phab=phab, users=users
             )
             # Convert the timestamp to datetime
             created_at = self.time_from_epoch(comments[0]["dateCreated"])
@@ -251,33 +513,28 @@ class PhabricatorService(BaseService):
                 created_at=created_at,
             )
 
-    def author_data(self, author_phid, raw_response, phab):
+    def author_data(self, author_phid, users, phab):
         """
-        Helper function to look up data related to authorsi.
+        Helper function to look up data related to authors.
 
         (i.e. for last comment or individual review).
-        Keeps updating users seen in raw_response
+        Keeps updating users seen in the directory
         Args:
                 author_phid (str): The phid for the author queried
-                raw_response (lst(dict)): The raw response received from
-                                            individual user.query calls.
-                                            Keep updating and passing this
-                                            list as we call user.query
+                users (UserDirectory): The users we've seen, updated
+                                       as we call user.query
                 phab (object): This is the Phabricator object to make API calls
                                 (>=0.7.0)
         Returns:
                 new_user/user (dict): The user that was queried
-                raw_response (lst(dict)): The updated (or same) list
-                                          that holds all the users
-                                          we've seen
         """
-        for user in raw_response:
-            if user["phid"] == author_phid:
-                return user, raw_response
+        user = users.get(author_phid)
+        if user is not None:
+            return user
 
         new_user = self.user_query_ids([author_phid], phab)[0]
-        raw_response.append(new_user)
-        return new_user, raw_response
+        users.add([new_user])
+        return new_user
 
     def user_query_usernames(self, usernames, phab):
         """
@@ -363,4 +620,4 @@ class PhabricatorService(BaseService):
 class PhabricatorReview(BaseReview):
     """TODO: docstring goes here."""
 
-    pass
+    __slots__ = ()
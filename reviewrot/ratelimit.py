@@ -0,0 +1,257 @@
+"""ratelimit module."""
+from collections import Counter
+import hashlib
+import logging
+import threading
+import time
+import urllib.parse
+
+from reviewrot.fetcher import job_label
+from reviewrot.httpcache import AUTH_HEADERS
+
+log = logging.getLogger(__name__)
+
+# Names of remaining, limit and reset headers, used by Github and Gitlab
+RATE_LIMIT_HEADERS = (
+    ("X-RateLimit-Remaining", "X-RateLimit-Limit", "X-RateLimit-Reset"),
+    ("RateLimit-Remaining", "RateLimit-Limit", "RateLimit-Reset"),
+)
+
+# Requests kept for the rest of the run, workers pause until reset below
+DEFAULT_RESERVE = 10
+# Below this part of the limit, requests are spread until reset
+DEFAULT_SLOW_DOWN = 0.1
+# Longest pause for a single request
+DEFAULT_MAX_PAUSE = 15 * 60
+
+UNATTRIBUTED = "other"
+
+
+class RateLimitBudget(object):
+    """Rate limit state of one token on one host, as reported by the host."""
+
+    def __init__(self):
+        """Initialization dunder."""
+        self.remaining = None
+        self.limit = None
+        self.reset = None
+        self.used = 0
+
+    def update(self, headers):
+        """
+        Updates the state from response headers.
+
+        Args:
+            headers (dict): response headers
+
+        Returns:
+            True if the headers describe rate limit, False otherwise
+        """
+        for remaining, limit, reset in RATE_LIMIT_HEADERS:
+            if remaining in headers:
+                try:
+                    self.remaining = int(headers[remaining])
+                    self.limit = int(headers.get(limit, self.limit or 0)) or None
+                    self.reset = float(headers.get(reset, self.reset or 0)) or None
+                except ValueError:
+                    log.debug("Invalid rate limit headers: %s", headers)
+                    return False
+                return True
+        return False
+
+
+class RateLimiter(object):
+    """
+    Rate limit budget shared by all git services.
+
+    Responses of all sessions mounted to the limiter are inspected for rate
+    limit headers, per host and token. As the remaining budget gets low,
+    the worker which got the response is slowed down, and paused until the
+    limit is reset once only the reserve is left, instead of failing the
+    run. Requests are accounted to the job whose context they are sent in,
+    including requests of worker pools the job starts.
+    """
+
+    def __init__(
+        self,
+        reserve=DEFAULT_RESERVE,
+        slow_down=DEFAULT_SLOW_DOWN,
+        max_pause=DEFAULT_MAX_PAUSE,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        """
+        Returns limiter object.
+
+        Args:
+            reserve (int): number of requests kept, workers pause until
+                           reset once the remaining budget drops to it
+            slow_down (float): part of the limit below which requests are
+                               spread evenly until reset
+            max_pause (int): longest pause in seconds after a single request
+            clock (callable): returns current epoch time in seconds
+            sleep (callable): waits given number of seconds
+        """
+        self.reserve = reserve
+        self.slow_down = slow_down
+        self.max_pause = max_pause
+        self.clock = clock
+        self.sleep = sleep
+        self.budgets = {}
+        self.usage = Counter()
+        # number of reviews returned by jobs last time
+        self.yields = {}
+        self.state = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def budget_key(request):
+        """
+        Returns key of the budget a request is counted against.
+
+        Args:
+            request (requests.PreparedRequest): the request sent
+
+        Returns:
+            key (tuple): host and digest of authentication headers
+        """
+        identity = hashlib.sha256()
+        for name in AUTH_HEADERS:
+            identity.update(request.headers.get(name, "").encode("utf-8"))
+        host = urllib.parse.urlsplit(request.url).netloc
+        return host, identity.hexdigest()[:12]
+
+    def hook(self, response, *args, **kwargs):
+        """
+        Response hook accounting the request and throttling the worker.
+
+        Args:
+            response (requests.Response): response to inspect
+        """
+        key = self.budget_key(response.request)
+        label = job_label.get() or UNATTRIBUTED
+        with self._lock:
+            budget = self.budgets.setdefault(key, RateLimitBudget())
+            known = budget.update(response.headers)
+            if not getattr(response, "from_cache", False):
+                budget.used += 1
+                self.usage[label] += 1
+            pause = self.pause(budget) if known else 0
+
+        if pause > 0:
+            log.info(
+                "%d requests left for %s, pausing for %d seconds",
+                budget.remaining,
+                key[0],
+                pause,
+            )
+            self.sleep(pause)
+
+    def pause(self, budget):
+        """
+        Returns number of seconds to wait before the next request.
+
+        Args:
+            budget (RateLimitBudget): budget of the last request
+
+        Returns:
+            pause (float): seconds to wait, 0 to continue right away
+        """
+        if budget.reset is None:
+            return 0
+        until_reset = budget.reset - self.clock()
+        if until_reset <= 0:
+            return 0
+
+        if budget.remaining <= self.reserve:
+            # reset is in whole seconds, so wait one more
+            return min(until_reset + 1, self.max_pause)
+        if budget.limit and budget.remaining < budget.limit * self.slow_down:
+            # spread remaining requests over the rest of the window
+            return min(until_reset / (budget.remaining - self.reserve), self.max_pause)
+        return 0
+
+    def mount(self, session):
+        """
+        Accounts and throttles requests of a requests session.
+
+        Args:
+            session (requests.Session): session to inspect responses of
+        """
+        hooks = session.hooks["response"]
+        if self.hook not in hooks:
+            hooks.append(self.hook)
+
+    def use_state(self, state):
+        """
+        Keeps numbers of reviews returned by jobs between runs.
+
+        Args:
+            state (ReviewState): state storing the numbers
+        """
+        self.state = state
+        with self._lock:
+            self.yields.update(state.yields)
+
+    def order(self, jobs):
+        """
+        Returns order of jobs by expected yield.
+
+        Budget is spent first on repositories which had the most reviews
+        last time, jobs never run before are expected to yield the most.
+        Without a state, only jobs run before by the same process are known.
+
+        Args:
+            jobs (list): list of FetchJob
+
+        Returns:
+            order (list): indexes of the jobs, most promising first
+        """
+        return sorted(
+            range(len(jobs)),
+            key=lambda index: -self.yields.get(jobs[index].label, float("inf")),
+        )
+
+    def record_yield(self, label, count):
+        """
+        Stores number of reviews returned by a job.
+
+        Args:
+            label (str): label of the job
+            count (int): number of reviews
+        """
+        with self._lock:
+            self.yields[label] = count
+        if self.state is not None:
+            self.state.record_yield(label, count)
+
+    def report(self, entries):
+        """
+        Logs budget consumed by every git service entry and resets it.
+
+        Args:
+            entries (list): label, list of FetchJob and collection interval
+                            of every git service configuration
+        """
+        with self._lock:
+            usage = self.usage
+            self.usage = Counter()
+            budgets = dict(self.budgets)
+
+        for label, jobs, _ in entries:
+            used = sum(usage.pop(job.label, 0) for job in jobs)
+            if used:
+                log.info("Rate limit budget used by %s: %d requests", label, used)
+        if usage.get(UNATTRIBUTED):
+            log.info(
+                "Rate limit budget used by other requests: %d requests",
+                usage[UNATTRIBUTED],
+            )
+        for (host, _), budget in sorted(budgets.items()):
+            if budget.remaining is not None:
+                log.info(
+                    "Rate limit of %s: %d of %s requests remaining",
+                    host,
+                    budget.remaining,
+                    budget.limit or "unknown",
+                )
@@ -0,0 +1,157 @@
+"""retry module."""
+from itertools import takewhile
+import logging
+import random
+import time
+
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_TIME = 60
+
+# Responses of overloaded or restarting services, worth another try
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"))
+
+
+class RetryPolicy(Retry):
+    """
+    Retries transient failures of idempotent requests.
+
+    Connection errors and responses with RETRY_STATUSES are retried after an
+    exponential backoff with full jitter, or after the time requested by the
+    Retry-After header. All retries of one request have to fit into
+    max_time seconds, after that the last response is returned as is.
+    """
+
+    def __init__(
+        self,
+        total=DEFAULT_RETRIES,
+        backoff_factor=DEFAULT_BACKOFF,
+        max_time=DEFAULT_MAX_TIME,
+        deadline=None,
+        **kwargs
+    ):
+        """
+        Returns retry policy object.
+
+        Args:
+            total (int): maximum number of retries of one request
+            backoff_factor (float): backoff before the first retry, doubled
+                                    for every following one
+            max_time (float): seconds all retries of one request may take,
+                              unlimited if None
+            deadline (float): monotonic time when retries of the current
+                              request have to stop, set on first retry
+            kwargs: Arguments of urllib3.util.retry.Retry
+        """
+        kwargs.setdefault("status_forcelist", RETRY_STATUSES)
+        kwargs.setdefault("allowed_methods", IDEMPOTENT_METHODS)
+        kwargs.setdefault("respect_retry_after_header", True)
+        # the last response is returned, so errors are reported as before
+        kwargs.setdefault("raise_on_status", False)
+        super(RetryPolicy, self).__init__(
+            total=total, backoff_factor=backoff_factor, **kwargs
+        )
+        self.max_time = max_time
+        self.deadline = deadline
+
+    def new(self, **kwargs):
+        """Returns policy for the next retry of the same request."""
+        deadline = self.deadline
+        if deadline is None and self.max_time is not None:
+            deadline = time.monotonic() + self.max_time
+        kwargs.setdefault("max_time", self.max_time)
+        kwargs.setdefault("deadline", deadline)
+        return super(RetryPolicy, self).new(**kwargs)
+
+    def remaining_time(self):
+        """Returns seconds left for retries, None if unlimited."""
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
+
+    def is_exhausted(self):
+        """Returns True if no more retries are allowed."""
+        if super(RetryPolicy, self).is_exhausted():
+            return True
+        if self.remaining_time() == 0:
+            log.debug("Retries took more than %s seconds, giving up", self.max_time)
+            return True
+        return False
+
+    def get_backoff_time(self):
+        """Returns random backoff, up to the exponential one."""
+        errors = len(
+            list(
+                takewhile(lambda x: x.redirect_location is None, reversed(self.history))
+            )
+        )
+        if errors == 0:
+            return 0
+        backoff = min(self.backoff_max, self.backoff_factor * 2 ** (errors - 1))
+        return self._within_deadline(random.uniform(0, backoff))
+
+    def get_retry_after(self, response):
+        """Returns time requested by Retry-After header, within the deadline."""
+        retry_after = super(RetryPolicy, self).get_retry_after(response)
+        if retry_after is None:
+            return None
+        return self._within_deadline(retry_after)
+
+    def _within_deadline(self, seconds):
+        """Returns seconds cut to the time left for retries."""
+        remaining = self.remaining_time()
+        if remaining is None:
+            return seconds
+        return min(seconds, remaining)
+
+
+def mount_retry(session, retry):
+    """
+    Retries requests of a requests session by a retry policy.
+
+    The policy is set to the adapters already mounted, including the
+    caching adapter, so it has to be mounted after the cache.
+
+    Args:
+        session (requests.Session): session to retry requests of
+        retry (RetryPolicy): policy to use
+    """
+    for adapter in session.adapters.values():
+        adapter.max_retries = retry
+
+
+def github_retry_policy(retry):
+    """
+    Returns retry policy combined with PyGithub's GithubRetry.
+
+    GithubRetry also retries 403 responses of primary and secondary rate
+    limits, waiting until the limit is reset. Github requests are never
+    retried fewer times than PyGithub does by default.
+
+    Args:
+        retry (RetryPolicy): policy to combine
+
+    Returns:
+        retry (RetryPolicy): policy also being GithubRetry
+    """
+    from github import Github
+    from github.GithubRetry import GithubRetry
+
+    class GithubRetryPolicy(RetryPolicy, GithubRetry):
+        """Retry policy also retrying rate limited Github requests."""
+
+    return GithubRetryPolicy(
+        total=max(retry.total, Github.default_retry.total),
+        backoff_factor=retry.backoff_factor,
+        max_time=retry.max_time,
+        # GithubRetry adds 403 to the list
+        status_forcelist=sorted(retry.status_forcelist),
+        allowed_methods=retry.allowed_methods,
+        respect_retry_after_header=retry.respect_retry_after_header,
+        raise_on_status=retry.raise_on_status,
+    )
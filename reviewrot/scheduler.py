@@ -0,0 +1,182 @@
+"""scheduler module."""
+import datetime
+import logging
+import time
+
+from reviewrot.basereview import refresh_age
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 15 * 60
+
+
+class ScheduledEntry(object):
+    """Jobs of one git service configuration, collected periodically."""
+
+    def __init__(self, label, jobs, interval):
+        """
+        Returns entry object.
+
+        Args:
+            label (str): name of the entry used in logs
+            jobs (list): list of FetchJob collecting reviews of the entry
+            interval (int): number of seconds between two collections
+        """
+        self.label = label
+        self.jobs = jobs
+        self.interval = interval
+        self.next_run = None
+        # whether the entry was collected in the latest cycle
+        self.ran = False
+        self.results = []
+        self.errors = []
+
+
+class Scheduler(object):
+    """
+    Periodically collects reviews of configured git services.
+
+    Every git service configuration is collected on its own interval by
+    the same fetcher, so service objects, their sessions and caches are
+    kept between collections. The latest reviews of all entries are
+    reported after every cycle in which any entry was collected. Relative
+    --age filters of the jobs are computed again at the start of every
+    cycle.
+    """
+
+    def __init__(
+        self, fetcher, clock=time.monotonic, sleep=time.sleep, now=datetime.datetime.now
+    ):
+        """
+        Returns scheduler object.
+
+        Args:
+            fetcher (ReviewFetcher): fetcher to run jobs with
+            clock (callable): returns current time in seconds
+            sleep (callable): waits given number of seconds
+            now (callable): returns current local datetime, age filters
+                            are relative to
+        """
+        self.fetcher = fetcher
+        self.clock = clock
+        self.sleep = sleep
+        self.now = now
+        self.entries = []
+
+    def add(self, label, jobs, interval=DEFAULT_INTERVAL):
+        """
+        Adds jobs to be run periodically.
+
+        Args:
+            label (str): name of the entry used in logs
+            jobs (list): list of FetchJob
+            interval (int): number of seconds between two runs
+        """
+        if interval < 1:
+            raise ValueError("Interval of %s must be at least 1 second" % label)
+        self.entries.append(ScheduledEntry(label, jobs, interval))
+
+    def run_pending(self):
+        """
+        Runs jobs of all entries which are due.
+
+        Returns:
+            True if any entry was run, False otherwise
+        """
+        now = self.clock()
+        due = [
+            entry
+            for entry in self.entries
+            if entry.next_run is None or entry.next_run <= now
+        ]
+        if not due:
+            return False
+
+        log.debug("Collecting reviews for %s", ", ".join(e.label for e in due))
+        today = self.now()
+        # run all due entries together, so they share the worker pool
+        outcomes = self.fetcher.run_grouped(
+            [[self._refresh(job, today) for job in entry.jobs] for entry in due]
+        )
+        for entry in self.entries:
+            entry.ran = entry in due
+        for entry, (results, errors) in zip(due, outcomes):
+            entry.results = results
+            entry.errors = errors
+            entry.next_run = now + entry.interval
+        return True
+
+    @staticmethod
+    def _refresh(job, today):
+        """
+        Returns job with its age filter relative to today.
+
+        Args:
+            job (FetchJob): job to run
+            today (datetime.datetime): start of the cycle
+
+        Returns:
+            job (FetchJob): job to run in this cycle
+        """
+        age = job.kwargs.get("age")
+        if age is None or age.delta is None:
+            return job
+        kwargs = dict(job.kwargs, age=refresh_age(age, today))
+        return job._replace(kwargs=kwargs)
+
+    @property
+    def results(self):
+        """Latest reviews of all entries, in order of the entries."""
+        return [review for entry in self.entries for review in entry.results]
+
+    @property
+    def errors(self):
+        """Errors of the latest run of all entries."""
+        return [error for entry in self.entries for error in entry.errors]
+
+    @property
+    def idle_jobs(self):
+        """Labels of jobs of entries which weren't run in the latest cycle."""
+        return [
+            job.label for entry in self.entries if not entry.ran for job in entry.jobs
+        ]
+
+    def seconds_to_next_run(self):
+        """Returns number of seconds until the next entry is due."""
+        if not self.entries:
+            return None
+        pending = [
+            entry.next_run - self.clock()
+            for entry in self.entries
+            if entry.next_run is not None
+        ]
+        if len(pending) < len(self.entries):
+            return 0
+        return max(0, min(pending))
+
+    def run_forever(self, callback, cycles=None):
+        """
+        Runs due entries and reports their results until stopped.
+
+        Args:
+            callback (callable): called with results and errors of all
+                                 entries after every cycle which ran any
+            cycles (int): stop after this number of cycles, run forever
+                          if None
+        """
+        done = 0
+        while cycles is None or done < cycles:
+            if self.run_pending():
+                done += 1
+                try:
+                    callback(self.results, self.errors)
+                except Exception:
+                    # keep the daemon running when a report can't be sent
+                    log.exception("Failed to report collected reviews")
+                continue
+
+            wait = self.seconds_to_next_run()
+            if wait is None:
+                log.warning("Nothing to collect, stopping")
+                return
+            self.sleep(wait)
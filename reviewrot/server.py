@@ -0,0 +1,277 @@
+"""server module."""
+from email.utils import formatdate
+import functools
+import gzip
+import hashlib
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from reviewrot import ParseAge
+from reviewrot.basereview import RelativeAge
+from reviewrot.table import ReviewTable
+
+log = logging.getLogger(__name__)
+
+API_PATH = "/api/reviews"
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+# responses smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
+DEFAULT_WEB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "web")
+
+
+class ReviewStore(object):
+    """
+    Latest collected reviews, shared by the collecting and serving threads.
+
+    Reviews are kept in a table and serialized once when they are stored,
+    requests only filter the table and slice the stored data.
+    """
+
+    def __init__(self):
+        """Initialization dunder."""
+        self._lock = threading.Lock()
+        self._table = ReviewTable()
+        self._data = []
+        self._generated = None
+
+    def update(self, results, show_last_comment=None):
+        """
+        Replaces stored reviews.
+
+        Args:
+            results (ReviewTable or list): sorted reviews
+            show_last_comment (int): include text of last comments
+        """
+        if not isinstance(results, ReviewTable):
+            results = ReviewTable(results)
+        # all durations are relative to the same time
+        now = RelativeAge()
+        data = [review.__json__(show_last_comment, now=now) for review in results]
+        with self._lock:
+            self._table = results
+            self._data = data
+            self._generated = time.time()
+        log.debug("Serving %d reviews", len(data))
+
+    def snapshot(self):
+        """
+        Returns stored reviews.
+
+        Returns:
+            table (ReviewTable): stored reviews
+            data (list): JSON data of every review in the table
+            generated (float): when the reviews were stored, None if never
+        """
+        with self._lock:
+            return self._table, self._data, self._generated
+
+
+def filter_reviews(table, query):
+    """
+    Filters stored reviews by query parameters.
+
+    Args:
+        table (ReviewTable): stored reviews
+        query (dict): parsed query string, supports project, user
+                      and older_than (e.g. '5d' or '1m 2d')
+
+    Returns:
+        indexes (list): indexes of reviews matching all given parameters
+    """
+    before = None
+    older_than = query.get("older_than")
+    if older_than:
+        # Age dates are naive local times
+        before = ParseAge.parse(["older"] + older_than[0].split()).date.astimezone()
+    return table.select(
+        users=query.get("user") or None,
+        projects=query.get("project") or None,
+        before=before,
+    )
+
+
+def _positive_int(query, name, default):
+    """Returns positive integer query parameter."""
+    value = int(query.get(name, [default])[0])
+    if value < 1:
+        raise ValueError("%s must be a positive number" % name)
+    return value
+
+
+class ReviewRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves collected reviews as JSON and the web UI assets.
+
+    GET /api/reviews returns a list in the same format as `review-rot -f json`,
+    optionally filtered and paginated. Pagination is described by the
+    X-Total-Count and Link headers, so the body stays compatible with the
+    web UI.
+    """
+
+    server_version = "review-rot"
+
+    def do_GET(self):  # noqa: N802
+        """Serves API requests, other paths are served from web directory."""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.rstrip("/") == API_PATH:
+            self.send_reviews(urllib.parse.parse_qs(url.query))
+        elif self.server.web_dir is None:
+            self.send_error(404, "Web UI is not available")
+        else:
+            super(ReviewRequestHandler, self).do_GET()
+
+    def do_HEAD(self):  # noqa: N802
+        """Serves the same headers as GET requests, without the body."""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.rstrip("/") == API_PATH:
+            self.send_reviews(urllib.parse.parse_qs(url.query))
+        elif self.server.web_dir is None:
+            self.send_error(404, "Web UI is not available")
+        else:
+            super(ReviewRequestHandler, self).do_HEAD()
+
+    def send_reviews(self, query):
+        """
+        Sends filtered page of collected reviews.
+
+        Only the headers are sent for HEAD requests.
+
+        Args:
+            query (dict): parsed query string
+        """
+        table, data, generated = self.server.store.snapshot()
+        if generated is None:
+            self.send_error(503, "Reviews were not collected yet")
+            return
+
+        per_page = None
+        try:
+            indexes = filter_reviews(table, query)
+            page = _positive_int(query, "page", 1)
+            # all reviews are returned unless a page is requested
+            if "page" in query or "per_page" in query:
+                per_page = _positive_int(query, "per_page", DEFAULT_PER_PAGE)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        total = len(indexes)
+        headers = {"X-Total-Count": str(total)}
+        if per_page is not None:
+            per_page = min(per_page, MAX_PER_PAGE)
+            start = (page - 1) * per_page
+            indexes = indexes[start : start + per_page]
+            headers["Link"] = self._links(query, page, per_page, total)
+
+        body = json.dumps([data[i] for i in indexes]).encode("utf-8")
+        digest = hashlib.sha1(body).hexdigest()
+        compress = len(body) >= GZIP_MIN_SIZE and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        )
+        # compressed and identity bodies differ, so they have their own tags
+        etag = '"{}-gzip"'.format(digest) if compress else '"{}"'.format(digest)
+        headers["ETag"] = etag
+        headers["Last-Modified"] = formatdate(generated, usegmt=True)
+        headers["Cache-Control"] = "no-cache"
+        headers["Vary"] = "Accept-Encoding"
+
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        if compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    @staticmethod
+    def _links(query, page, per_page, total):
+        """
+        Returns Link header with URLs of neighbouring pages.
+
+        Args:
+            query (dict): parsed query string
+            page (int): current page
+            per_page (int): number of reviews per page
+            total (int): number of reviews matching the query
+
+        Returns:
+            links (str): value of the Link header
+        """
+        last = max(1, (total + per_page - 1) // per_page)
+        pages = [("first", 1), ("last", last)]
+        if page > 1:
+            pages.append(("prev", min(page - 1, last)))
+        if page < last:
+            pages.append(("next", page + 1))
+
+        links = []
+        for rel, number in pages:
+            params = dict(query)
+            params["page"] = [number]
+            params["per_page"] = [per_page]
+            links.append(
+                '<{}?{}>; rel="{}"'.format(
+                    API_PATH, urllib.parse.urlencode(params, doseq=True), rel
+                )
+            )
+        return ", ".join(links)
+
+    def log_message(self, format, *args):
+        """Logs requests as debug output instead of printing them."""
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+class ReviewServer(ThreadingHTTPServer):
+    """HTTP server of collected reviews."""
+
+    daemon_threads = True
+
+    def __init__(self, address, store, web_dir=DEFAULT_WEB_DIR):
+        """
+        Returns server object.
+
+        Args:
+            address (tuple): host and port to listen on
+            store (ReviewStore): reviews to serve
+            web_dir (str): directory with web UI assets, only API is served
+                           if it doesn't exist
+        """
+        self.store = store
+        self.web_dir = web_dir if web_dir and os.path.isdir(web_dir) else None
+        if web_dir and self.web_dir is None:
+            log.warning("Web UI directory %s not found, serving API only", web_dir)
+        handler = functools.partial(ReviewRequestHandler, directory=self.web_dir)
+        super(ReviewServer, self).__init__(address, handler)
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+
+        Returns:
+            thread (threading.Thread): the serving thread
+        """
+        thread = threading.Thread(target=self.serve_forever, name="review-server")
+        thread.daemon = True
+        thread.start()
+        host, port = self.server_address[:2]
+        log.info("Serving reviews on http://%s:%d%s", host, port, API_PATH)
+        return thread
@@ -0,0 +1,320 @@
+"""state module."""
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
+import logging
+import os
+import sqlite3
+import threading
+
+from reviewrot.basereview import LastComment
+from reviewrot.fetcher import job_label
+
+log = logging.getLogger(__name__)
+
+# Enrichment data of a review request seen by a previous run
+# comments_mode tells how comments were counted, records counted otherwise
+# aren't reused
+ReviewRecord = namedtuple(
+    "ReviewRecord",
+    (
+        "url",
+        "title",
+        "updated_time",
+        "comments",
+        "image",
+        "last_comment",
+        "comments_mode",
+    ),
+    defaults=(None,),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    updated_time TEXT NOT NULL,
+    comments INTEGER,
+    image TEXT,
+    last_comment_author TEXT,
+    last_comment_body TEXT,
+    last_comment_created_at TEXT,
+    comments_mode TEXT
+);
+CREATE TABLE IF NOT EXISTS listed (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS yields (
+    label TEXT PRIMARY KEY,
+    reviews INTEGER NOT NULL
+)
+"""
+
+
+def _format_time(value):
+    """Returns datetime formatted for storage, or None."""
+    if value is None:
+        return None
+    # keeps timezone of aware datetimes, e.g. those returned by PyGithub
+    return value.isoformat()
+
+
+def _parse_time(value):
+    """Returns datetime parsed from storage, or None."""
+    if value is None:
+        return None
+    return datetime.fromisoformat(value)
+
+
+class ReviewState(object):
+    """
+    Persisted state of review requests seen by the previous run.
+
+    The state is stored in a SQLite database. It is read once when the
+    object is created, so lookups are safe from concurrently running
+    services, and written by update() once all services finished.
+
+    Besides the reported review requests, URLs of all review requests
+    listed by the services are stored, including those dropped by
+    filters, so a filtered review request isn't taken for a closed one.
+    Numbers of reviews returned by every job are stored too, so the rate
+    limiter can order jobs of the next run by them.
+
+    Listed URLs are also kept in memory by the job which listed them, so a
+    daemon can carry over those of jobs which didn't run in its cycle.
+    """
+
+    def __init__(self, path):
+        """
+        Returns state object.
+
+        Args:
+            path (str): Path to the SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.previous = {}
+        # URLs of open review requests, whether reported or not
+        self.previous_listed = set()
+        # URLs listed in this run and by the latest run of every job, by
+        # job labels
+        self.current_listed = {}
+        self.job_listed = {}
+        # number of reviews returned by every job, by job labels
+        self.yields = {}
+        self._lock = threading.Lock()
+        with closing(self._connect()) as connection, connection:
+            connection.executescript(SCHEMA)
+            columns = [
+                row["name"] for row in connection.execute("PRAGMA table_info(reviews)")
+            ]
+            if "comments_mode" not in columns:
+                # database stored before comments modes were recorded
+                connection.execute("ALTER TABLE reviews ADD COLUMN comments_mode TEXT")
+            for row in connection.execute("SELECT * FROM reviews"):
+                record = self._from_row(row)
+                self.previous[record.url] = record
+            for row in connection.execute("SELECT url FROM listed"):
+                self.previous_listed.add(row["url"])
+            for row in connection.execute("SELECT label, reviews FROM yields"):
+                self.yields[row["label"]] = row["reviews"]
+        self.previous_listed.update(self.previous)
+        log.debug("Loaded %d reviews from %s", len(self.previous), path)
+
+    def _connect(self):
+        """Returns connection to the database."""
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @staticmethod
+    def _from_row(row):
+        """
+        Returns record for a database row.
+
+        Args:
+            row (sqlite3.Row): row of the reviews table
+
+        Returns:
+            record (ReviewRecord): record of the review request
+        """
+        last_comment = None
+        if row["last_comment_created_at"] is not None:
+            last_comment = LastComment(
+                author=row["last_comment_author"],
+                body=row["last_comment_body"],
+                created_at=_parse_time(row["last_comment_created_at"]),
+            )
+        return ReviewRecord(
+            url=row["url"],
+            title=row["title"],
+            updated_time=_parse_time(row["updated_time"]),
+            comments=row["comments"],
+            image=row["image"],
+            last_comment=last_comment,
+            comments_mode=row["comments_mode"],
+        )
+
+    @staticmethod
+    def _to_row(review):
+        """
+        Returns database row for a review.
+
+        Args:
+            review (BaseReview): review request to store
+
+        Returns:
+            row (tuple): values of the reviews table columns
+        """
+        last_comment = review.last_comment or LastComment(None, None, None)
+        return (
+            review.url,
+            review.title,
+            _format_time(review.updated_time),
+            review.comments,
+            review.image,
+            last_comment.author,
+            last_comment.body,
+            _format_time(last_comment.created_at),
+            getattr(review, "comments_mode", None),
+        )
+
+    @staticmethod
+    def _to_record(review):
+        """
+        Returns record of a review.
+
+        Args:
+            review (BaseReview): review request reported by this run
+
+        Returns:
+            record (ReviewRecord): record of the review request
+        """
+        return ReviewRecord(
+            url=review.url,
+            title=review.title,
+            updated_time=review.updated_time,
+            comments=review.comments,
+            image=review.image,
+            last_comment=review.last_comment,
+            comments_mode=getattr(review, "comments_mode", None),
+        )
+
+    def lookup(self, url, updated_time, comments_mode=None):
+        """
+        Returns record of an unchanged review request.
+
+        Args:
+            url (str): URL of the review request
+            updated_time (datetime.datetime): when the review request was
+                                              last updated
+            comments_mode (str): how comments are counted, by services
+                                 counting them in more than one way
+
+        Returns:
+            record (ReviewRecord): record from the previous run, or None if
+                                   the review request is new, was updated
+                                   or its comments were counted otherwise
+        """
+        record = self.previous.get(url)
+        if record is None or record.updated_time != updated_time:
+            return None
+        if record.comments_mode != comments_mode:
+            return None
+        return record
+
+    def listed(self, url):
+        """
+        Records review request listed by a service in this run.
+
+        Args:
+            url (str): URL of the review request, reported or not
+        """
+        with self._lock:
+            self.current_listed.setdefault(job_label.get(), set()).add(url)
+
+    def record_yield(self, label, count):
+        """
+        Records number of reviews returned by a job, stored by update().
+
+        Args:
+            label (str): label of the job
+            count (int): number of reviews
+        """
+        with self._lock:
+            self.yields[label] = count
+
+    def update(self, reviews, complete=True, idle=()):
+        """
+        Stores reviews of this run and compares them with the previous one.
+
+        Args:
+            reviews (list): review requests reported by this run
+            complete (bool): False if some repositories couldn't be queried,
+                             records of unseen review requests are then kept
+                             and none of them is reported as closed
+            idle (iterable): labels of jobs which didn't run this time,
+                             review requests listed by their latest run are
+                             taken as listed again
+
+        Returns:
+            new (list): reviews which were not listed by the previous run
+            closed (list): ReviewRecord of review requests reported by the
+                           previous run, but not listed by this one
+        """
+        current = dict((review.url, review) for review in reviews)
+        with self._lock:
+            job_listed = self.current_listed
+            self.current_listed = {}
+            yields = sorted(self.yields.items())
+        for label in idle:
+            job_listed[label] = self.job_listed.get(label, set())
+        listed = set(current)
+        for urls in job_listed.values():
+            listed.update(urls)
+
+        new = [
+            review for review in reviews if review.url not in self.previous_listed
+        ]
+        closed = []
+        if complete:
+            closed = [
+                record
+                for url, record in sorted(self.previous.items())
+                if url not in listed
+            ]
+
+        with closing(self._connect()) as connection, connection:
+            if complete:
+                connection.execute("DELETE FROM reviews")
+                connection.execute("DELETE FROM listed")
+            connection.executemany(
+                "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(review) for review in current.values()],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO listed VALUES (?)",
+                [(url,) for url in sorted(listed)],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO yields VALUES (?, ?)", yields
+            )
+        log.debug("Stored %d reviews to %s", len(current), self.path)
+
+        # the next run of the same process compares against this one
+        records = dict(
+            (url, self._to_record(review)) for url, review in current.items()
+        )
+        if complete:
+            self.previous = records
+            self.previous_listed = listed
+            self.job_listed = job_listed
+        else:
+            self.previous.update(records)
+            self.previous_listed.update(listed)
+            self.job_listed.update(job_listed)
+
+        return new, closed
@@ -0,0 +1,206 @@
+"""table module."""
+from array import array
+from collections import OrderedDict
+import datetime
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+
+# Columns reviews can be sorted by, named by the --sort choices
+SORT_COLUMNS = OrderedDict(
+    [
+        ("submitted", "times"),
+        ("updated", "updated_times"),
+        ("commented", "commented_times"),
+    ]
+)
+
+# Columns of interned names reviews can be grouped by
+GROUP_COLUMNS = OrderedDict([("user", "users"), ("project", "projects")])
+
+
+def timestamp(value, missing=float("-inf")):
+    """
+    Returns POSIX timestamp of a date.
+
+    Args:
+        value (datetime.datetime): the date, naive dates are in UTC
+        missing (float): timestamp of a missing date
+
+    Returns:
+        timestamp (float): seconds since epoch
+    """
+    if value is None:
+        return missing
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+class ReviewTable(object):
+    """
+    Reviews with values they are sorted, filtered and grouped by in columns.
+
+    Times are kept in arrays of timestamps and users and projects as
+    indexes into lists of interned names, so operations on the table
+    don't touch review objects and names shared by many reviews are
+    stored once. The table behaves as a sequence of its reviews.
+    """
+
+    def __init__(self, reviews=()):
+        """
+        Returns table of reviews.
+
+        Args:
+            reviews (iterable): reviews to add
+        """
+        self.reviews = []
+        self.times = array("d")
+        self.updated_times = array("d")
+        # reviews without comments are the last ones
+        self.commented_times = array("d")
+        self.users = array("l")
+        self.projects = array("l")
+        self.names = []
+        self._name_ids = {}
+        for review in reviews:
+            self.append(review)
+
+    def _name_id(self, name):
+        """Returns index of an interned name."""
+        if isinstance(name, str):
+            name = sys.intern(name)
+        index = self._name_ids.get(name)
+        if index is None:
+            index = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def append(self, review):
+        """
+        Adds a review to the end of the table.
+
+        Args:
+            review (BaseReview): review to add
+        """
+        last_comment = review.last_comment
+        self.reviews.append(review)
+        self.times.append(timestamp(review.time))
+        self.updated_times.append(timestamp(review.updated_time))
+        self.commented_times.append(
+            timestamp(last_comment.created_at if last_comment else None, float("inf"))
+        )
+        self.users.append(self._name_id(review.user))
+        self.projects.append(self._name_id(review.project_name))
+
+    def __len__(self):
+        """Returns number of reviews."""
+        return len(self.reviews)
+
+    def __iter__(self):
+        """Iterates over reviews."""
+        return iter(self.reviews)
+
+    def __getitem__(self, index):
+        """Returns review, or list of reviews for a slice."""
+        return self.reviews[index]
+
+    def take(self, indexes):
+        """
+        Returns table of some reviews.
+
+        Args:
+            indexes (iterable): indexes of the reviews, in the new order
+
+        Returns:
+            table (ReviewTable): table sharing names with this one
+        """
+        table = ReviewTable()
+        table.names = self.names
+        table._name_ids = self._name_ids
+        for index in indexes:
+            table.reviews.append(self.reviews[index])
+            table.times.append(self.times[index])
+            table.updated_times.append(self.updated_times[index])
+            table.commented_times.append(self.commented_times[index])
+            table.users.append(self.users[index])
+            table.projects.append(self.projects[index])
+        return table
+
+    def sort(self, by="submitted", reverse=False):
+        """
+        Returns table sorted by a time.
+
+        Sorting is stable, reviews with the same time keep their order.
+
+        Args:
+            by (str): one of SORT_COLUMNS
+            reverse (bool): most recent first
+
+        Returns:
+            table (ReviewTable): sorted table
+        """
+        name = SORT_COLUMNS.get(by)
+        if name is None:
+            error_message = "Sort by {} not supported".format(by)
+            log.debug(error_message)
+            raise ValueError(error_message)
+        column = getattr(self, name)
+        return self.take(
+            sorted(range(len(self)), key=column.__getitem__, reverse=reverse)
+        )
+
+    def select(self, users=None, projects=None, before=None, after=None):
+        """
+        Returns indexes of reviews matching all given conditions.
+
+        Args:
+            users (iterable): names of users who filed the reviews
+            projects (iterable): names of projects of the reviews
+            before (datetime.datetime): reviews submitted before the date
+            after (datetime.datetime): reviews submitted after the date
+
+        Returns:
+            indexes (list): indexes of matching reviews, in table order
+        """
+        indexes = range(len(self))
+        if users is not None:
+            wanted = {self._name_ids.get(user) for user in users}
+            indexes = [i for i in indexes if self.users[i] in wanted]
+        if projects is not None:
+            wanted = {self._name_ids.get(project) for project in projects}
+            indexes = [i for i in indexes if self.projects[i] in wanted]
+        if before is not None:
+            limit = timestamp(before)
+            indexes = [i for i in indexes if self.times[i] < limit]
+        if after is not None:
+            limit = timestamp(after)
+            indexes = [i for i in indexes if self.times[i] > limit]
+        return list(indexes)
+
+    def group_by(self, column="project"):
+        """
+        Returns reviews grouped by user or project.
+
+        Reviews are grouped by indexes of their interned names, in order of
+        the first review of every name, and keep their order within groups.
+
+        Args:
+            column (str): one of GROUP_COLUMNS
+
+        Returns:
+            groups (OrderedDict): table of reviews of every name
+        """
+        name = GROUP_COLUMNS.get(column)
+        if name is None:
+            error_message = "Group by {} not supported".format(column)
+            log.debug(error_message)
+            raise ValueError(error_message)
+        groups = OrderedDict()
+        for index, name_id in enumerate(getattr(self, name)):
+            groups.setdefault(name_id, []).append(index)
+        return OrderedDict(
+            (self.names[name_id], self.take(indexes))
+            for name_id, indexes in groups.items()
+        )
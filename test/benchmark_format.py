@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of review formatting.
+
+Run it from the repository root, e.g.
+`python -m test.benchmark_format --reviews 10000`.
+"""
+import argparse
+from datetime import datetime, timedelta
+import timeit
+
+from reviewrot.basereview import BaseReview, format_reviews, LastComment
+
+
+def make_reviews(count):
+    """Returns reviews of various age, every other one with last comment."""
+    now = datetime.utcnow()
+    reviews = []
+    for index in range(count):
+        created = now - timedelta(hours=index)
+        review = BaseReview(
+            user="user{}".format(index % 50),
+            title="Review request {}".format(index),
+            url="https://example.com/pull/{}".format(index),
+            time=created,
+            updated_time=created,
+            comments=index % 7,
+            image="https://example.com/avatar.png",
+            project_name="project{}".format(index % 20),
+        )
+        if index % 2:
+            review.last_comment = LastComment(
+                author="reviewer", body="Looks good", created_at=created
+            )
+        reviews.append(review)
+    return reviews
+
+
+def format_each(reviews, style):
+    """Formats reviews one by one, as done before batch formatting."""
+    n = len(reviews)
+    return [
+        review.format(style, i, n, show_last_comment=1)
+        for i, review in enumerate(reviews)
+    ]
+
+
+def main():
+    """Prints best time of formatting reviews in every style."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reviews", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    reviews = make_reviews(args.reviews)
+    for style in ("oneline", "indented", "json"):
+        for name, function in (
+            ("format", format_each),
+            ("format_reviews", format_reviews),
+        ):
+            best = min(
+                timeit.repeat(
+                    lambda: function(reviews, style), number=1, repeat=args.repeat
+                )
+            )
+            print("{:<9} {:<15} {:>8.1f} ms".format(style, name, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
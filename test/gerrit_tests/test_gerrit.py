@@ -1,8 +1,10 @@
 """TODO: docstring goes here."""
+from datetime import datetime
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
 import requests
+from reviewrot.basereview import BaseService
 from reviewrot.gerritstack import GerritService
 
 from . import mock_gerrit
@@ -18,6 +20,7 @@ class GerritTest(TestCase):
         """Set up the testing environment."""
         self.mock_age = MagicMock()
         self.mock_age.state = "mock_state"
+        BaseService.clients.clear()
 
     @patch(PATH + "datetime")
     @patch(PATH + "GerritService.check_request_state")
@@ -79,6 +82,66 @@ class GerritTest(TestCase):
             last_comment=None,
             project_name="mock_project",
             image="mock_image",
+            comments_mode="inline",
+        )
+        self.assertEqual(["1"], response)
+
+    @patch(PATH + "datetime")
+    @patch(PATH + "GerritService.check_request_state")
+    @patch(PATH + "GerritService._call_api")
+    @patch(PATH + "GerritService.get_last_comment")
+    @patch(PATH + "GerritReview")
+    @patch(PATH + "gravatar")
+    def test_format_response_unchanged_since_previous_run(
+        self,
+        mock_gravatar,
+        mock_gerrit_review,
+        mock_get_last_comment,
+        mock_call_api,
+        mock_check_request_state,
+        mock_datetime,
+    ):
+        """
+        Tests 'format_response' function where.
+
+            * the change didn't change since previous run
+            * comments are reused from the previous run
+        """
+        # Set up mock return values and side effects
+        mock_datetime.strptime.return_value = "mock_date"
+        mock_check_request_state.return_value = True
+        mock_gerrit_review.return_value = "1"
+        mock_gravatar.return_value = "mock_image"
+        mock_state = MagicMock()
+        mock_state.lookup.return_value.comments = 3
+        mock_state.lookup.return_value.last_comment = "mock_last_comment"
+        service = GerritService()
+        service.use_state(mock_state)
+
+        # Call function
+        response = service.format_response(
+            decoded_responses=mock_gerrit.mock_decoded_response_no_email(),
+            age=self.mock_age,
+            show_last_comment=None,
+        )
+
+        # Validate function calls and response
+        mock_state.lookup.assert_called_with(
+            "None/mock_number", "mock_date", "inline"
+        )
+        mock_call_api.assert_not_called()
+        mock_get_last_comment.assert_not_called()
+        mock_gerrit_review.assert_called_with(
+            user="mock_username",
+            title="mock_subject",
+            url="None/mock_number",
+            time="mock_date",
+            updated_time="mock_date",
+            comments=3,
+            last_comment="mock_last_comment",
+            project_name="mock_project",
+            image="mock_image",
+            comments_mode="inline",
         )
         self.assertEqual(["1"], response)
 
@@ -123,7 +186,8 @@ class GerritTest(TestCase):
         # Validate function calls and response
         mock_datetime.strptime.assert_called_with("mock_d", "%Y-%m-%d %H:%M:%S.%f")
         mock_check_request_state.assert_called_with("mock_date", self.mock_age)
-        mock_call_api.assert_called_with("None/changes/mock_id/comments")
+        # comments of filtered out changes are not requested
+        mock_call_api.assert_not_called()
         mock_has_new_comments.assert_not_called()
         mock_comments_count.assert_not_called()
         mock_gerrit_review.assert_not_called()
@@ -250,7 +314,7 @@ class GerritTest(TestCase):
         # Set up mock return values and side effects
         mock_get_response.return_value = "mock_host_exists"
         mock_check_repo_exists.return_value = True
-        mock_call_api.return_value = "mock_review_response"
+        mock_call_api.return_value = [{"_number": 1}]
         mock_format_response.return_value = "Successful Call!"
 
         # Call function
@@ -271,7 +335,9 @@ class GerritTest(TestCase):
         )
 
         mock_call_api.assert_called_with(url=changes_url, ssl_verify=True)
-        mock_format_response.assert_called_with("mock_review_response", None, None)
+        mock_format_response.assert_called_with(
+            [{"_number": 1}], None, None, ignore_wip=False, bulk_comments=False
+        )
         self.assertEqual("Successful Call!", response)
 
     @patch(PATH + "GerritService.get_response")
@@ -293,7 +359,7 @@ class GerritTest(TestCase):
         """
         # Set up mock return values and side effects
         mock_check_repo_exists.return_value = True
-        mock_call_api.return_value = "mock_review_response"
+        mock_call_api.return_value = [{"_number": 1}]
         mock_format_response.return_value = "Successful Call!"
         service = GerritService()
         service.host_exists = True
@@ -312,7 +378,9 @@ class GerritTest(TestCase):
         )
 
         mock_call_api.assert_called_with(url=changes_url, ssl_verify=True)
-        mock_format_response.assert_called_with("mock_review_response", None, None)
+        mock_format_response.assert_called_with(
+            [{"_number": 1}], None, None, ignore_wip=False, bulk_comments=False
+        )
         self.assertEqual("Successful Call!", response)
 
     @patch(PATH + "GerritService.get_response")
@@ -334,7 +402,7 @@ class GerritTest(TestCase):
         """
         # Set up mock return values and side effects
         mock_check_repo_exists.return_value = None
-        mock_call_api.return_value = "mock_review_response"
+        mock_call_api.return_value = [{"_number": 1}]
         mock_format_response.return_value = "Successful Call!"
         service = GerritService()
         service.host_exists = True
@@ -371,7 +439,7 @@ class GerritTest(TestCase):
 
         service = GerritService()
 
-        mocked_requests.session.assert_called()
+        self.assertIsNotNone(service.session)
 
         service.request_reviews("host", "repo", reviewers_config=reviewers_config)
 
@@ -401,7 +469,7 @@ class GerritTest(TestCase):
 
         service = GerritService()
 
-        mocked_requests.session.assert_called()
+        self.assertIsNotNone(service.session)
 
         service.request_reviews("host", "repo", reviewers_config=reviewers_config)
 
@@ -431,7 +499,7 @@ class GerritTest(TestCase):
 
         service = GerritService()
 
-        mocked_requests.session.assert_called()
+        self.assertIsNotNone(service.session)
 
         filtered_changes = service._filter_invited(changes, **reviewers_config)
 
@@ -479,7 +547,7 @@ class GerritTest(TestCase):
 
         service = GerritService()
 
-        mocked_requests.session.assert_called()
+        self.assertIsNotNone(service.session)
 
         filtered_changes = service._filter_invited(changes, **reviewers_config)
 
@@ -501,3 +569,128 @@ class GerritTest(TestCase):
 
         # Validate function calls and response
         self.assertEqual(response, 4)
+
+    def test_get_last_message(self):
+        """Tests comments derived from change messages."""
+        change = {
+            "messages": [
+                {
+                    "author": {"username": "mock_author"},
+                    "tag": "autogenerated:gerrit:newPatchSet",
+                    "message": "Uploaded patch set 2.",
+                    "date": "2019-01-01 10:00:00.000000000",
+                },
+                {
+                    "author": {"username": "mock_reviewer"},
+                    "message": "Patch Set 2: Code-Review+1",
+                    "date": "2019-01-02 10:00:00.000000000",
+                },
+                {
+                    "message": "Change has been successfully rebased",
+                    "date": "2019-01-03 10:00:00.000000000",
+                },
+            ]
+        }
+        service = GerritService()
+
+        messages = service.get_message_comments(change)
+        response = service.get_last_message(messages)
+
+        self.assertEqual(1, len(messages))
+        self.assertEqual("mock_reviewer", response.author)
+        self.assertEqual("Patch Set 2: Code-Review+1", response.body)
+        self.assertEqual(datetime(2019, 1, 2, 10), response.created_at)
+        self.assertIsNone(service.get_last_message([]))
+
+    @patch(PATH + "GerritService.check_repos_exist")
+    @patch(PATH + "GerritService._call_api")
+    @patch(PATH + "GerritService.format_response")
+    def test_request_reviews_combined_repos(
+        self, mock_format_response, mock_call_api, mock_check_repos_exist
+    ):
+        """Tests that repositories are queried together, page by page."""
+        mock_check_repos_exist.return_value = True
+        mock_call_api.side_effect = [
+            [{"_number": 1}, {"_number": 2, "_more_changes": True}],
+            [{"_number": 3}],
+        ]
+        service = GerritService()
+        service.url = "mock_host"
+        service.host_exists = True
+
+        service.request_reviews(
+            host="mock_host",
+            repo_names=["first", "second"],
+            bulk_comments=True,
+        )
+
+        changes_url = (
+            "mock_host/changes/?q=(project:first+OR+project:second)+status:open"
+            "&n=500"
+            "&o=DETAILED_ACCOUNTS"
+            "&o=DETAILED_LABELS"
+            "&o=MESSAGES"
+        )
+        mock_call_api.assert_any_call(url=changes_url, ssl_verify=True)
+        mock_call_api.assert_called_with(url=changes_url + "&S=2", ssl_verify=True)
+        mock_format_response.assert_called_with(
+            [{"_number": 1}, {"_number": 2, "_more_changes": True}, {"_number": 3}],
+            None,
+            None,
+            ignore_wip=False,
+            bulk_comments=True,
+        )
+
+    @patch(PATH + "FilterStats.log")
+    @patch(PATH + "GerritService.passes_metadata_filters")
+    def test_format_response_stats_label(
+        self, mock_passes_metadata_filters, mock_log
+    ):
+        """Tests that filter stats of combined queries name all projects."""
+        mock_passes_metadata_filters.return_value = False
+        changes = []
+        for number, project in enumerate(["second", "first", "second"]):
+            changes.append(
+                {
+                    "created": "2019-01-01 10:00:00.000000000",
+                    "updated": "2019-01-01 10:00:00.000000000",
+                    "subject": "mock_subject",
+                    "project": project,
+                    "_number": number,
+                }
+            )
+
+        response = GerritService().format_response(changes, None, None)
+
+        self.assertEqual([], response)
+        mock_log.assert_called_once_with("gerrit first, second")
+
+    @patch(PATH + "GerritService._call_api")
+    def test_check_repos_exist_batched(self, mock_call_api):
+        """Tests that expected repos are validated by one request."""
+        mock_call_api.return_value = {"mock/first": {}, "mock.second": {}}
+        service = GerritService()
+        service.url = "mock_host"
+        service.expect_repos("mock_host", ["mock%2Ffirst", "mock.second"])
+
+        self.assertTrue(service.check_repos_exist(["mock%2Ffirst"], True))
+        self.assertTrue(service.check_repos_exist(["mock.second"], True))
+
+        mock_call_api.assert_called_once_with(
+            url="mock_host/projects/?r=%5E%28mock%5C.second%7Cmock%2Ffirst%29%24",
+            ssl_verify=True,
+        )
+
+    @patch(PATH + "GerritService.check_repo_exists")
+    @patch(PATH + "GerritService._call_api")
+    def test_check_repos_exist_not_listed(self, mock_call_api, mock_check_repo_exists):
+        """Tests that repos missing in the listing are checked one by one."""
+        mock_call_api.return_value = {"mock_first": {}}
+        mock_check_repo_exists.return_value = True
+        service = GerritService()
+        service.url = "mock_host"
+
+        response = service.check_repos_exist(["mock_first", "mock_second"], True)
+
+        self.assertTrue(response)
+        mock_check_repo_exists.assert_called_once_with("mock_second", True)
@@ -69,3 +69,60 @@ class MockRepo:
     """Mocks Github repo."""
 
     name = "dummy_repo"
+    archived = False
+    open_issues_count = 1
+
+
+def mock_graphql_comment(login, created_at):
+    """Mocks comment returned by Github GraphQL API."""
+    return {"author": {"login": login}, "body": "dummy_body", "createdAt": created_at}
+
+
+def mock_graphql_reviews(has_previous_page=False):
+    """Mocks page of pull request reviews returned by Github GraphQL API."""
+    return {
+        "pageInfo": {
+            "hasPreviousPage": has_previous_page,
+            "startCursor": "dummy_reviews_cursor",
+        },
+        "nodes": [
+            {
+                "comments": {
+                    "totalCount": 3,
+                    "nodes": [mock_graphql_comment("reviewer", "2019-05-27T10:12:02Z")],
+                }
+            }
+        ],
+    }
+
+
+def mock_graphql_repository(has_next_page=False, has_previous_reviews=False):
+    """Mocks repository with one pull request returned by Github GraphQL API."""
+    return {
+        "repository": {
+            "nameWithOwner": "dummy_user/dummy_repo",
+            "url": "dummy_repo_url",
+            "pullRequests": {
+                "pageInfo": {"hasNextPage": has_next_page, "endCursor": "dummy_cursor"},
+                "nodes": [
+                    {
+                        "number": 1,
+                        "title": "dummy_title",
+                        "url": "dummy_url",
+                        "createdAt": "2019-05-24T10:12:02Z",
+                        "updatedAt": "2019-05-25T10:12:02Z",
+                        "author": {"login": "dummy_user", "avatarUrl": "dummy_avatar"},
+                        "comments": {
+                            "totalCount": 2,
+                            "nodes": [
+                                mock_graphql_comment(
+                                    "issue_commenter", "2019-05-26T10:12:02Z"
+                                )
+                            ],
+                        },
+                        "reviews": mock_graphql_reviews(has_previous_reviews),
+                    }
+                ],
+            },
+        }
+    }
@@ -1,10 +1,13 @@
 """Github Tests Cases."""
+from datetime import datetime
 import logging
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
-from github.GithubException import UnknownObjectException
-from reviewrot.githubstack import GithubService
+from github.GithubException import GithubException, UnknownObjectException
+import requests
+from reviewrot.basereview import BaseService
+from reviewrot.githubstack import GithubService, GraphQLUnavailableError
 
 from . import mock_github
 
@@ -18,6 +21,10 @@ logging.disable(logging.CRITICAL)
 class GithubTest(TestCase):
     """This class represents the Github test cases."""
 
+    def setUp(self):
+        """Set up the testing environment."""
+        BaseService.clients.clear()
+
     @patch(PATH + "LastComment")
     def test_get_last_comment_review_issue_comment_older(self, mock_lastcomment):
         """
@@ -143,6 +150,23 @@ class GithubTest(TestCase):
         mock_last_comment.assert_not_called()
         mock_check_request_state.assert_not_called()
 
+    def test_get_reviews_given_repo(self):
+        """Tests get_reviews() doesn't fetch the repository again."""
+        # Set up mock return values and side effects
+        mock_uname = MagicMock()
+        mock_repo = MagicMock()
+        mock_repo.get_pulls.return_value = []
+
+        # Call function
+        response = GithubService().get_reviews(
+            uname=mock_uname, repo_name="dummy_repo", repo=mock_repo
+        )
+
+        # Validate function calls and response
+        mock_uname.get_repo.assert_not_called()
+        mock_repo.get_pulls.assert_called_once_with()
+        self.assertEqual([], response)
+
     @patch(PATH + "GithubService.check_request_state")
     @patch(PATH + "GithubService.get_last_comment")
     @patch(PATH + "GithubReview")
@@ -239,7 +263,8 @@ class GithubTest(TestCase):
             "dummy_createdAt",
             mock_age,
         )
-        mock_last_comment.assert_called_with(mock_github.MockPull)
+        # comments of filtered out pull requests are not looked up
+        mock_last_comment.assert_not_called()
         mock_has_new_comments.assert_not_called()
         self.assertEqual([], response)
 
@@ -309,7 +334,9 @@ class GithubTest(TestCase):
             "Invalid username/organizaton: dummy_user", context.exception.__str__()
         )
         mock_github_instance.get_user.assert_called_with("dummy_user")
-        mock_github_patch.assert_called_with("dummy_token")
+        mock_github_patch.assert_called_with(
+            "dummy_token", pool_size=BaseService.pool_size
+        )
 
     @patch(PATH + "Github")
     @patch(PATH + "GithubService.get_reviews")
@@ -335,10 +362,13 @@ class GithubTest(TestCase):
             repo_name="dummy_repo",
             age=None,
             show_last_comment=None,
+            ignore_wip=False,
         )
         mock_user_object.get_repos.assert_not_called()
         mock_github_instance.get_user.assert_called_with("dummy_user")
-        mock_github_patch.assert_called_with("dummy_token")
+        mock_github_patch.assert_called_with(
+            "dummy_token", pool_size=BaseService.pool_size
+        )
         self.assertEqual(["1"], response)
 
     @patch(PATH + "Github")
@@ -364,9 +394,328 @@ class GithubTest(TestCase):
             repo_name="dummy_repo",
             age=None,
             show_last_comment=None,
+            ignore_wip=False,
+            repo=mock_github.MockRepo,
         )
 
         mock_user_object.get_repos.assert_any_call()
         mock_github_instance.get_user.assert_called_with("dummy_user")
-        mock_github_patch.assert_called_with("dummy_token")
+        mock_github_patch.assert_called_with(
+            "dummy_token", pool_size=BaseService.pool_size
+        )
+        self.assertEqual(["1"], response)
+
+    @patch(PATH + "Github")
+    @patch(PATH + "GithubService.get_reviews")
+    def test_request_reviews_search(self, mock_get_reviews, mock_github_patch):
+        """Tests request_reviews finds repositories with pull requests by search."""
+        # Set up mock return values and side effects
+        mock_github_instance = MagicMock()
+        mock_user_object = MagicMock()
+        mock_user_object.type = "Organization"
+        mock_user_object.login = "dummy_org"
+        mock_results = MagicMock()
+        mock_results.totalCount = 3
+        mock_results.incomplete_results = False
+        mock_results.__iter__.return_value = [
+            MagicMock(repository_url="https://api.github.com/repos/dummy_org/" + name)
+            for name in ["second_repo", "first_repo", "second_repo"]
+        ]
+        mock_github_instance.search_issues.return_value = mock_results
+        mock_github_instance.get_user.return_value = mock_user_object
+        mock_get_reviews.return_value = ["1"]
+        mock_github_patch.return_value = mock_github_instance
+
+        # Call function
+        response = GithubService().request_reviews(
+            user_name="dummy_org", token="dummy_token", host=None, search=True
+        )
+
+        # Validate function calls and response
+        mock_github_instance.search_issues.assert_called_once_with(
+            "org:dummy_org is:pr is:open"
+        )
+        mock_user_object.get_repos.assert_not_called()
+        self.assertEqual(
+            ["first_repo", "second_repo"],
+            [c[1]["repo_name"] for c in mock_get_reviews.call_args_list],
+        )
+        self.assertEqual(["1", "1"], response)
+
+    @patch(PATH + "Github")
+    @patch(PATH + "GithubService.get_reviews")
+    def test_request_reviews_search_fallback(self, mock_get_reviews, mock_github_patch):
+        """Tests request_reviews lists repositories when search can't be used."""
+        # Set up mock return values and side effects
+        mock_github_instance = MagicMock()
+        mock_user_object = MagicMock()
+        mock_user_object.type = "User"
+        mock_user_object.login = "dummy_user"
+        mock_user_object.get_repos.return_value = [mock_github.MockRepo]
+        mock_results = MagicMock()
+        mock_results.totalCount = 1001
+        mock_results.__iter__.return_value = [MagicMock()]
+        mock_github_instance.search_issues.return_value = mock_results
+        mock_github_instance.get_user.return_value = mock_user_object
+        mock_get_reviews.return_value = "1"
+        mock_github_patch.return_value = mock_github_instance
+
+        # Call function
+        response = GithubService().request_reviews(
+            user_name="dummy_user", token="dummy_token", host=None, search=True
+        )
+
+        # Validate function calls and response
+        mock_github_instance.search_issues.assert_called_once_with(
+            "user:dummy_user is:pr is:open"
+        )
+        mock_get_reviews.assert_called_once_with(
+            uname=mock_user_object,
+            repo_name="dummy_repo",
+            age=None,
+            show_last_comment=None,
+            ignore_wip=False,
+            repo=mock_github.MockRepo,
+        )
+        self.assertEqual(["1"], response)
+
+        # search errors fall back to listing too
+        mock_github_instance.search_issues.side_effect = GithubException(403)
+        self.assertEqual(
+            ["1"],
+            GithubService().request_reviews(
+                user_name="dummy_user", token="dummy_token", host=None, search=True
+            ),
+        )
+
+    @patch(PATH + "Github")
+    @patch(PATH + "GithubService.get_reviews")
+    def test_request_reviews_skips_repos(self, mock_get_reviews, mock_github_patch):
+        """Tests request_reviews skips archived repos and repos without issues."""
+        # Set up mock return values and side effects
+        mock_github_instance = MagicMock()
+        mock_user_object = MagicMock()
+        mock_archived = MagicMock(archived=True, open_issues_count=1)
+        mock_empty = MagicMock(archived=False, open_issues_count=0)
+        mock_user_object.get_repos.return_value = [
+            mock_archived,
+            mock_empty,
+            mock_github.MockRepo,
+        ]
+        mock_github_instance.get_user.return_value = mock_user_object
+        mock_get_reviews.return_value = "1"
+        mock_github_patch.return_value = mock_github_instance
+
+        # Call function
+        response = GithubService().request_reviews(
+            user_name="dummy_user", token="dummy_token", host=None
+        )
+
+        # Validate function calls and response
+        mock_get_reviews.assert_called_once_with(
+            uname=mock_user_object,
+            repo_name="dummy_repo",
+            age=None,
+            show_last_comment=None,
+            ignore_wip=False,
+            repo=mock_github.MockRepo,
+        )
+        self.assertEqual(["1"], response)
+
+    def test_scannable_repos_stats(self):
+        """Tests scannable_repos counts requests saved by skipping repos."""
+        # Set up mock return values and side effects
+        mock_archived = MagicMock(archived=True, open_issues_count=1)
+        mock_empty = MagicMock(archived=False, open_issues_count=0)
+        mock_repo = MagicMock(archived=False, open_issues_count=2)
+
+        # Call function
+        with patch(PATH + "RepoScanStats.log", autospec=True) as mock_log:
+            response = GithubService().scannable_repos(
+                [mock_archived, mock_empty, mock_repo],
+                graphql=False,
+                label="dummy_user",
+            )
+
+        # Validate function calls and response
+        self.assertEqual([mock_repo], response)
+        stats = mock_log.call_args[0][0]
+        self.assertEqual(3, stats.counts["listed"])
+        self.assertEqual(1, stats.counts["skipped_archived"])
+        self.assertEqual(1, stats.counts["skipped_empty"])
+        self.assertEqual(1, stats.counts["queried"])
+        # get_repo and get_pulls of skipped repos, get_repo of the queried one
+        self.assertEqual(5, stats.counts["saved_requests"])
+
+    @patch(PATH + "GithubService._call_api")
+    def test_get_reviews_graphql(self, mock_call_api):
+        """Tests get_reviews_graphql() builds reviews from a single query."""
+        # Set up mock return values and side effects
+        mock_uname = MagicMock()
+        mock_uname.login = "dummy_user"
+        mock_call_api.return_value = {"data": mock_github.mock_graphql_repository()}
+
+        # Call function
+        response = GithubService().get_reviews_graphql(
+            uname=mock_uname, repo_name="dummy_repo"
+        )
+
+        # Validate function calls and response
+        self.assertEqual(1, mock_call_api.call_count)
+        variables = mock_call_api.call_args[1]["json"]["variables"]
+        self.assertEqual(
+            {"owner": "dummy_user", "name": "dummy_repo", "cursor": None}, variables
+        )
+        self.assertEqual(1, len(response))
+        review = response[0]
+        self.assertEqual("dummy_user", review.user)
+        self.assertEqual("dummy_avatar", review.image)
+        self.assertEqual(5, review.comments)
+        self.assertEqual(datetime(2019, 5, 24, 10, 12, 2), review.time)
+        self.assertEqual("dummy_user/dummy_repo", review.project_name)
+        self.assertEqual("reviewer", review.last_comment.author)
+        self.assertEqual(
+            datetime(2019, 5, 27, 10, 12, 2), review.last_comment.created_at
+        )
+
+    @patch(PATH + "GithubService._call_api")
+    def test_get_reviews_graphql_pagination(self, mock_call_api):
+        """Tests get_reviews_graphql() follows the end cursor."""
+        # Set up mock return values and side effects
+        mock_uname = MagicMock()
+        mock_uname.login = "dummy_user"
+        mock_call_api.side_effect = [
+            {"data": mock_github.mock_graphql_repository(has_next_page=True)},
+            {"data": mock_github.mock_graphql_repository()},
+        ]
+
+        # Call function
+        response = GithubService().get_reviews_graphql(
+            uname=mock_uname, repo_name="dummy_repo"
+        )
+
+        # Validate function calls and response
+        self.assertEqual(2, len(response))
+        variables = mock_call_api.call_args[1]["json"]["variables"]
+        self.assertEqual("dummy_cursor", variables["cursor"])
+
+    @patch(PATH + "GithubService._call_api")
+    def test_get_reviews_graphql_review_pages(self, mock_call_api):
+        """Tests get_reviews_graphql() counts comments of all review pages."""
+        # Set up mock return values and side effects
+        mock_uname = MagicMock()
+        mock_uname.login = "dummy_user"
+        earlier_reviews = mock_github.mock_graphql_reviews()
+        mock_call_api.side_effect = [
+            {"data": mock_github.mock_graphql_repository(has_previous_reviews=True)},
+            {"data": {"repository": {"pullRequest": {"reviews": earlier_reviews}}}},
+        ]
+
+        # Call function
+        response = GithubService().get_reviews_graphql(
+            uname=mock_uname, repo_name="dummy_repo"
+        )
+
+        # Validate function calls and response
+        self.assertEqual(2, mock_call_api.call_count)
+        variables = mock_call_api.call_args[1]["json"]["variables"]
+        self.assertEqual(
+            {
+                "owner": "dummy_user",
+                "name": "dummy_repo",
+                "number": 1,
+                "cursor": "dummy_reviews_cursor",
+            },
+            variables,
+        )
+        self.assertEqual(8, response[0].comments)
+
+    @patch(PATH + "GithubService._call_api")
+    def test_get_reviews_graphql_not_found(self, mock_call_api):
+        """Tests get_reviews_graphql() with repository which doesn't exist."""
+        # Set up mock return values and side effects
+        mock_uname = MagicMock()
+        mock_call_api.return_value = {
+            "data": {"repository": None},
+            "errors": [{"type": "NOT_FOUND", "message": "Not found"}],
+        }
+
+        # Call function
+        with self.assertRaises(Exception) as context:
+            GithubService().get_reviews_graphql(
+                uname=mock_uname, repo_name="dummy_repo"
+            )
+
+        # Validate function calls and response
+        self.assertIn("Repository dummy_repo not found", str(context.exception))
+        self.assertNotIsInstance(context.exception, GraphQLUnavailableError)
+
+    @patch(PATH + "GithubService._call_api")
+    def test_get_reviews_graphql_unavailable(self, mock_call_api):
+        """Tests get_reviews_graphql() where GraphQL API can't be reached."""
+        # Set up mock return values and side effects
+        mock_call_api.side_effect = requests.exceptions.HTTPError("404")
+
+        # Call function
+        with self.assertRaises(GraphQLUnavailableError):
+            GithubService().get_reviews_graphql(
+                uname=MagicMock(), repo_name="dummy_repo"
+            )
+
+    @patch(PATH + "Github")
+    @patch(PATH + "GithubService.get_reviews")
+    @patch(PATH + "GithubService.get_reviews_graphql")
+    def test_request_reviews_graphql_fallback(
+        self, mock_get_reviews_graphql, mock_get_reviews, mock_github_patch
+    ):
+        """Tests request_reviews falls back to REST API when GraphQL fails."""
+        # Set up mock return values and side effects
+        mock_user_object = MagicMock()
+        mock_github_patch.return_value.get_user.return_value = mock_user_object
+        mock_get_reviews_graphql.side_effect = GraphQLUnavailableError("mock_error")
+        mock_get_reviews.return_value = ["1"]
+
+        # Call function
+        response = GithubService().request_reviews(
+            user_name="dummy_user",
+            repo_name="dummy_repo",
+            token="dummy_token",
+            graphql=True,
+        )
+
+        # Validate function calls and response
+        mock_get_reviews_graphql.assert_called_with(
+            uname=mock_user_object,
+            repo_name="dummy_repo",
+            age=None,
+            show_last_comment=None,
+            ignore_wip=False,
+            ssl_verify=True,
+        )
+        mock_get_reviews.assert_called_with(
+            uname=mock_user_object,
+            repo_name="dummy_repo",
+            age=None,
+            show_last_comment=None,
+            ignore_wip=False,
+        )
+        self.assertEqual(["1"], response)
+
+    @patch(PATH + "Github")
+    @patch(PATH + "GithubService.get_reviews")
+    @patch(PATH + "GithubService.get_reviews_graphql")
+    def test_request_reviews_graphql_without_token(
+        self, mock_get_reviews_graphql, mock_get_reviews, mock_github_patch
+    ):
+        """Tests request_reviews uses REST API when no token is provided."""
+        # Set up mock return values and side effects
+        mock_get_reviews.return_value = ["1"]
+
+        # Call function
+        response = GithubService().request_reviews(
+            user_name="dummy_user", repo_name="dummy_repo", graphql=True
+        )
+
+        # Validate function calls and response
+        mock_get_reviews_graphql.assert_not_called()
         self.assertEqual(["1"], response)
@@ -2,10 +2,11 @@
 from datetime import datetime
 import logging
 from unittest import TestCase
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 from gitlab.exceptions import GitlabGetError, GitlabListError
 from requests.exceptions import SSLError
+from reviewrot.basereview import BaseService
 from reviewrot.gitlabstack import GitlabService
 
 
@@ -20,6 +21,7 @@ class GitlabTest(TestCase):
 
     def setUp(self):
         """Set up the testing environment. Load mock."""
+        BaseService.clients.clear()
         # Mock Merge Requests
         self.mock_merge_request = MagicMock(name="mock_merge_request")
         self.mock_merge_request = MagicMock(name="mock_merge_request")
@@ -92,6 +94,42 @@ class GitlabTest(TestCase):
 
         self.assertEqual("Successful Call!", response)
 
+    def test_get_last_comment_paging(self):
+        """
+        Test 'get_last_comment' function.
+
+        With the newest page of notes full of system notes
+        """
+        # Set up mock return values and side effects
+        system_note = MagicMock(system=True)
+        mock_merge_requests = MagicMock(name="mock_merge_requests")
+        mock_merge_requests.notes.list.side_effect = [
+            [system_note] * 20,
+            [system_note, self.mock_merge_request],
+        ]
+
+        # Call function
+        response = GitlabService().get_last_comment(mock_merge_requests)
+
+        # Validate function calls and response
+        mock_merge_requests.notes.list.assert_called_with(
+            sort="desc", order_by="created_at", per_page=20, page=2
+        )
+        self.assertEqual("dummy_author", response.author)
+
+    @patch(PATH + "GitlabService.get_last_comment")
+    def test_get_last_comments(self, mock_get_last_comment):
+        """Tests 'get_last_comments' keeps order of merge requests."""
+        # Set up mock return values and side effects
+        mock_get_last_comment.side_effect = lambda mr: mr + "_comment"
+
+        # Call function
+        response = GitlabService().get_last_comments(["a", "b", "c"], workers=3)
+
+        # Validate function calls and response
+        self.assertEqual(["a_comment", "b_comment", "c_comment"], response)
+        self.assertEqual(3, mock_get_last_comment.call_count)
+
     @patch(PATH + "GitlabService.get_last_comment")
     @patch(PATH + "GitlabService.check_request_state")
     @patch(PATH + "GitlabService.has_new_comments")
@@ -268,7 +306,8 @@ class GitlabTest(TestCase):
             expected_date,
             mock_age,
         )
-        mock_get_last_comment.assert_called_with(self.mock_mr)
+        # notes of filtered out merge requests are not looked up
+        mock_get_last_comment.assert_not_called()
         mock_gitlab_review.assert_not_called()
         mock_has_new_comments.assert_not_called()
         self.assertEqual(response, [])
@@ -316,11 +355,17 @@ class GitlabTest(TestCase):
     @patch(PATH + "gitlab.Gitlab")
     @patch(PATH + "GitlabService.get_reviews")
     def test_request_reviews_ssl_error_no_repo(self, mock_get_reviews, mock_gitlab):
-        """Test 'request_reviews' function where there is an SSL error and no repos."""
+        """
+        Test 'request_reviews' function where there is an SSL error and no repos.
+
+        Group merge requests endpoint is not available, so merge requests
+        are listed per project.
+        """
         # Set up mock return values and side effects
         mock_gitlab_group = MagicMock(name="mock_gitlab_group")
         mock_gitlab_group.id = 1
         mock_gitlab_group_projects = MagicMock()
+        mock_gitlab_group_projects.mergerequests.list.side_effect = GitlabListError
         mock_gitlab_group_projects.projects.list.return_value = [mock_gitlab_group]
         mock_gitlab_instance = MagicMock(name="mock_gitlab_instance")
         mock_gitlab_instance.groups.get.return_value = mock_gitlab_group_projects
@@ -338,15 +383,75 @@ class GitlabTest(TestCase):
         )
 
         # Validate function calls and response
-        mock_gitlab.assert_called_with("dummy.com", "dummy_token", ssl_verify=True)
+        mock_gitlab.assert_called_with(
+            "dummy.com", "dummy_token", ssl_verify=True, session=ANY
+        )
         mock_gitlab_instance.auth.assert_called_once()
         mock_gitlab_instance.groups.get.assert_called_with("dummy_user")
         mock_gitlab_instance.projects.get.assert_called_with(1)
         mock_get_reviews.assert_called_with(
-            uname="dummy_user", project="dummy_project", age=None
+            uname="dummy_user",
+            project="dummy_project",
+            age=None,
+            show_last_comment=None,
+            ignore_wip=False,
+            comment_workers=4,
         )
         self.assertEqual(["1"], response)
 
+    @patch(PATH + "gitlab.Gitlab")
+    @patch(PATH + "GitlabService.format_reviews")
+    def test_request_reviews_group_merge_requests(
+        self, mock_format_reviews, mock_gitlab
+    ):
+        """
+        Tests 'request_reviews' function where no repo is given.
+
+        Merge requests of the whole group are listed at once and
+        only projects with open merge requests are formatted.
+        """
+        # Set up mock return values and side effects
+        first_mr = MagicMock(project_id=1, iid=10, attributes={"iid": 10})
+        second_mr = MagicMock(project_id=2, iid=20, attributes={"iid": 20})
+        third_mr = MagicMock(project_id=1, iid=11, attributes={"iid": 11})
+        first_project = MagicMock(id=1)
+        second_project = MagicMock(id=2)
+        idle_project = MagicMock(id=3)
+        mock_group = MagicMock(name="mock_group")
+        mock_group.mergerequests.list.return_value = [first_mr, second_mr, third_mr]
+        mock_group.projects.list.return_value = [
+            first_project,
+            second_project,
+            idle_project,
+        ]
+        mock_gitlab_instance = MagicMock(name="mock_gitlab_instance")
+        mock_gitlab_instance.groups.get.return_value = mock_group
+        mock_gitlab.return_value = mock_gitlab_instance
+        mock_format_reviews.side_effect = lambda **kwargs: [kwargs["project"]]
+
+        # Call function
+        response = GitlabService().request_reviews(
+            user_name="dummy_user",
+            token="dummy_token",
+            host="dummy.com",
+            show_last_comment=3,
+        )
+
+        # Validate function calls and response
+        mock_group.mergerequests.list.assert_called_with(
+            state="opened", include_subgroups=True, all=True, per_page=100
+        )
+        mock_group.projects.list.assert_called_with(
+            all=True, simple=True, include_subgroups=True, per_page=100
+        )
+        # projects are bound lazily, without any API call
+        for call in mock_gitlab_instance.projects.get.call_args_list:
+            self.assertEqual({"lazy": True}, call[1])
+        self.assertEqual([first_project, second_project], response)
+        first_call = mock_format_reviews.call_args_list[0][1]
+        self.assertEqual([10, 11], [mr.iid for mr in first_call["merge_requests"]])
+        self.assertEqual(3, first_call["show_last_comment"])
+
     @patch(PATH + "gitlab.Gitlab")
     @patch(PATH + "GitlabService.get_reviews")
     def test_request_reviews_no_group_no_repo(self, mock_get_reviews, mock_gitlab):
@@ -367,7 +472,9 @@ class GitlabTest(TestCase):
             )
 
         # Validate function calls and response
-        mock_gitlab.assert_called_with("dummy.com", "dummy_token", ssl_verify=True)
+        mock_gitlab.assert_called_with(
+            "dummy.com", "dummy_token", ssl_verify=True, session=ANY
+        )
         mock_gitlab_instance.auth.assert_called_once()
         mock_get_reviews.assert_not_called()
         mock_gitlab_instance.groups.get.assert_called_with("dummy_user")
@@ -399,7 +506,9 @@ class GitlabTest(TestCase):
             )
 
         # Validate function calls and response
-        mock_gitlab.assert_called_with("dummy.com", "dummy_token", ssl_verify=True)
+        mock_gitlab.assert_called_with(
+            "dummy.com", "dummy_token", ssl_verify=True, session=ANY
+        )
         mock_gitlab_instance.groups.get.assert_not_called()
         mock_gitlab_instance.auth.assert_called_once()
         mock_gitlab_instance.projects.get.assert_called_with("dummy_user/dummy_repo")
@@ -425,7 +534,9 @@ class GitlabTest(TestCase):
         )
 
         # Validate function calls and response
-        mock_gitlab.assert_called_with("dummy.com", "dummy_token", ssl_verify=True)
+        mock_gitlab.assert_called_with(
+            "dummy.com", "dummy_token", ssl_verify=True, session=ANY
+        )
         mock_gitlab_instance.groups.get.assert_not_called()
         mock_gitlab_instance.auth.assert_called_once()
         mock_gitlab_instance.projects.get.assert_called_with("dummy_user/dummy_repo")
@@ -434,5 +545,7 @@ class GitlabTest(TestCase):
             project="dummy_project",
             age=None,
             show_last_comment=None,
+            ignore_wip=False,
+            comment_workers=4,
         )
         self.assertEqual(["1"], response)
@@ -0,0 +1,95 @@
+"""Helpers shared by test cases."""
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from reviewrot.basereview import BaseReview, LastComment
+from reviewrot.fetcher import FetchJob
+
+NOW = datetime(2020, 1, 10)
+
+
+def review_url(index):
+    """Returns URL of review made by make_review."""
+    return "https://example.com/pull/{}".format(index)
+
+
+def make_review(
+    index,
+    user="mock_user",
+    project="mock_project",
+    days=None,
+    updated_days=None,
+    comment_days=None,
+    now=NOW,
+    **kwargs
+):
+    """
+    Returns review filed given number of days before now.
+
+    Args:
+        index (int): Number in title and URL of the review
+        user (str): Author of the review
+        project (str): Project name of the review
+        days (int): Days since filed, index if None
+        updated_days (int): Days since updated, same as filed if None
+        comment_days (int): Days since last comment, no comment if None
+        now (datetime): Time the days are counted from
+        kwargs: Other BaseReview arguments, take precedence over the above
+
+    Returns:
+        BaseReview
+    """
+    created = now - timedelta(days=index if days is None else days)
+    updated = created
+    if updated_days is not None:
+        updated = now - timedelta(days=updated_days)
+
+    last_comment = None
+    if comment_days is not None:
+        last_comment = LastComment(
+            author="mock_author",
+            body="mock_body",
+            created_at=now - timedelta(days=comment_days),
+        )
+
+    fields = dict(
+        user=user,
+        title="mock_title {}".format(index),
+        url=review_url(index),
+        time=created,
+        updated_time=updated,
+        comments=0,
+        image="mock_image",
+        last_comment=last_comment,
+        project_name=project,
+    )
+    fields.update(kwargs)
+    return BaseReview(**fields)
+
+
+def make_job(label, host="mock_host", reviews=None, side_effect=None):
+    """Returns FetchJob with mocked service."""
+    service = MagicMock(name=label)
+    service.request_reviews.return_value = reviews
+    service.request_reviews.side_effect = side_effect
+    return FetchJob(
+        label=label, host=host, service=service, kwargs={"repo_name": label}
+    )
+
+
+class FakeClock(object):
+    """Clock advanced only by sleeping."""
+
+    def __init__(self, now=1000):
+        """Initialization dunder."""
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        """Returns current time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advances current time."""
+        self.sleeps.append(seconds)
+        self.now += seconds
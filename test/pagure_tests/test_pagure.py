@@ -1,4 +1,5 @@
 """test pagure."""
+from datetime import datetime
 import logging
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
@@ -33,6 +34,7 @@ class PagureTest(TestCase):
         # Mock Age
         self.mock_age = MagicMock()
         self.mock_age.state = "mock_age_state"
+        PagureService.avatar_caches.clear()
 
     @patch(PATH + "urllib")
     @patch(PATH + "hashlib")
@@ -201,6 +203,7 @@ class PagureTest(TestCase):
         mock_call_api.assert_called_with(
             url="https://pagure.io/api/0/dummy_user/dummy_repo/pull-requests",
             ssl_verify=True,
+            params={"status": "Open", "per_page": 100},
         )
         mock_get_last_comment.assert_called_with(
             mock_call_api.return_value["requests"][0]
@@ -258,7 +261,9 @@ class PagureTest(TestCase):
 
         # Validate function calls and response
         mock_call_api.assert_called_with(
-            url="https://pagure.io/api/0/dummy_user/pull-requests", ssl_verify=True
+            url="https://pagure.io/api/0/dummy_user/pull-requests",
+            ssl_verify=True,
+            params={"status": "Open", "per_page": 100},
         )
         mock_get_last_comment.assert_not_called()
         mock_datetime.strptime.assert_not_called()
@@ -312,6 +317,7 @@ class PagureTest(TestCase):
         mock_call_api.assert_called_with(
             url="https://pagure.io/api/0/dummy_user/dummy_repo/pull-requests",
             ssl_verify=True,
+            params={"status": "Open", "per_page": 100},
         )
         mock_get_last_comment.assert_called_with(
             mock_call_api.return_value["requests"][0]
@@ -366,10 +372,10 @@ class PagureTest(TestCase):
         mock_call_api.assert_called_with(
             url="https://pagure.io/api/0/dummy_user/dummy_repo/pull-requests",
             ssl_verify=True,
+            params={"status": "Open", "per_page": 100},
         )
-        mock_get_last_comment.assert_called_with(
-            mock_call_api.return_value["requests"][0]
-        )
+        # last comment of filtered out pull requests is not looked up
+        mock_get_last_comment.assert_not_called()
         mock_datetime.strptime.assert_any_call(
             "2019-01-05 12:12:12", "%Y-%m-%d %H:%M:%S"
         )
@@ -378,3 +384,72 @@ class PagureTest(TestCase):
         mock_avatar.assert_not_called()
         mock_pagure_review.assert_not_called()
         self.assertEqual(response, [])
+
+    @patch(PATH + "PagureService._avatar")
+    def test_get_avatars(self, mock_avatar):
+        """Tests that avatar of every user is looked up once."""
+        # Set up mock return values and side effects
+        mock_avatar.side_effect = lambda username, ssl_verify: username + "_avatar"
+        service = PagureService()
+
+        # Call function
+        response = service.get_avatars(["first", "second", "first"], workers=2)
+        cached = PagureService().get_avatars(["second"])
+
+        # Validate function calls and response
+        self.assertEqual(2, mock_avatar.call_count)
+        mock_avatar.assert_any_call("first", ssl_verify=True)
+        mock_avatar.assert_any_call("second", ssl_verify=True)
+        self.assertEqual({"first": "first_avatar", "second": "second_avatar"}, response)
+        self.assertEqual({"second": "second_avatar"}, cached)
+
+    @patch(PATH + "PagureService._call_api")
+    def test_get_avatars_local(self, mock_call_api):
+        """Tests that avatar URLs can be constructed without requests."""
+        # Call function
+        response = PagureService().get_avatars(["first"], local=True)
+
+        # Validate function calls and response
+        mock_call_api.assert_not_called()
+        self.assertTrue(
+            response["first"].startswith("https://seccdn.libravatar.org/avatar/")
+        )
+
+    @patch(PATH + "PagureService._call_api")
+    @patch(PATH + "PagureService.get_avatars")
+    def test_request_reviews_pages(self, mock_get_avatars, mock_call_api):
+        """Tests that all pages are read and newer ones are filtered by Pagure."""
+        # Set up mock return values and side effects
+        first_page = mock_pagure.mock_api_call_return_value()
+        first_page["pagination"] = {"next": "https://pagure.io/next_page"}
+        second_page = mock_pagure.mock_api_call_return_value()
+        second_page["requests"][0]["id"] = "mock_id_2"
+        second_page["pagination"] = {"next": None}
+        for page in (first_page, second_page):
+            page["requests"][0]["comments"] = []
+        mock_call_api.side_effect = [first_page, second_page]
+        mock_get_avatars.return_value = {"dummy_user": "dummy_avatar"}
+        self.mock_age.state = "newer"
+        self.mock_age.date = datetime(1970, 1, 1)
+
+        # Call function
+        response = PagureService().request_reviews(
+            user_name="dummy_user", repo_name="dummy_repo", age=self.mock_age
+        )
+
+        # Validate function calls and response
+        mock_call_api.assert_any_call(
+            url="https://pagure.io/api/0/dummy_user/dummy_repo/pull-requests",
+            ssl_verify=True,
+            params={"status": "Open", "per_page": 100, "updated_since": 0},
+        )
+        mock_call_api.assert_called_with(
+            url="https://pagure.io/next_page", ssl_verify=True
+        )
+        self.assertEqual(
+            [
+                "https://pagure.io/mock_repo_reference/pull-request/mock_id",
+                "https://pagure.io/mock_repo_reference/pull-request/mock_id_2",
+            ],
+            [review.url for review in response],
+        )
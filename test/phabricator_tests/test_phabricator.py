@@ -1,9 +1,13 @@
 """Test phabricator."""
 import datetime
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
-from reviewrot.phabricatorstack import PhabricatorService
+from phabricator import parse_interfaces
+from reviewrot.phabricatorstack import PhabricatorService, UserDirectory
 
 from . import mock_phabricator
 
@@ -25,6 +29,9 @@ class PhabricatorTest(TestCase):
         self.fake_phab.user.query.return_value = "Successful call!"
         self.fake_phab.user.query.return_value = "Successful call!"
         self.mock_age = MagicMock()
+        self.users = UserDirectory()
+        PhabricatorService.directories.clear()
+        PhabricatorService.clients.clear()
 
     def test_time_from_epoch(self):
         """Tests 'time_from_epoch' function."""
@@ -88,38 +95,37 @@ class PhabricatorTest(TestCase):
         self.assertEqual(expected_response, response)
 
     @patch(PATH + "PhabricatorService.user_query_ids")
-    def test_author_data_in_raw_reponse(self, mock_user_query_ids):
-        """Tests author_data function where author_phid IS IN the raw response."""
+    def test_author_data_in_directory(self, mock_user_query_ids):
+        """Tests author_data function where author_phid IS IN the directory."""
         # Set up mock return values and side effects
         fake_user, fake_raw_response = self.mock.author_data_raw_response()
+        self.users.add(fake_raw_response)
 
         # Call function
-        user, raw_response = PhabricatorService().author_data(
-            author_phid=fake_user["phid"], raw_response=fake_raw_response, phab=None
+        user = PhabricatorService().author_data(
+            author_phid=fake_user["phid"], users=self.users, phab=None
         )
 
         # Validate function calls and response
         mock_user_query_ids.assert_not_called()
         self.assertEqual(fake_user, user)
-        self.assertEqual(fake_raw_response, raw_response)
 
-    @patch(PATH + "PhabricatorService.user_query_ids", return_value=["New User!"])
-    def test_author_data_not_in_raw_response(self, mock_user_query_ids):
-        """Tests author_data function where author_phid IS NOT IN the raw response."""
+    @patch(PATH + "PhabricatorService.user_query_ids")
+    def test_author_data_not_in_directory(self, mock_user_query_ids):
+        """Tests author_data function where author_phid IS NOT IN the directory."""
         # Set up mock return values and side effects
-        expected_raw_response = ["New User!"]
-        expected_user = "New User!"
         fake_user, _ = self.mock.author_data_raw_response()
+        mock_user_query_ids.return_value = [fake_user]
 
         # Call function
-        user, raw_response = PhabricatorService().author_data(
-            author_phid=fake_user["phid"], raw_response=[], phab=None
+        user = PhabricatorService().author_data(
+            author_phid=fake_user["phid"], users=self.users, phab=None
         )
 
         # Validate function calls and response
         mock_user_query_ids.assert_called_with([fake_user["phid"]], None)
-        self.assertEqual(expected_user, user)
-        self.assertEqual(expected_raw_response, raw_response)
+        self.assertEqual(fake_user, user)
+        self.assertEqual(fake_user, self.users.get_by_name(fake_user["userName"]))
 
     @patch(PATH + "PhabricatorService.user_query_ids", side_effect=InternetError)
     def test_author_data_failure(self, mock_user_query_ids):
@@ -134,7 +140,7 @@ class PhabricatorTest(TestCase):
         # Call function
         with self.assertRaises(InternetError):
             PhabricatorService().author_data(
-                author_phid=fake_user["phid"], raw_response=[], phab=None
+                author_phid=fake_user["phid"], users=self.users, phab=None
             )
 
         # Validate function calls and response
@@ -142,7 +148,7 @@ class PhabricatorTest(TestCase):
 
     @patch(
         PATH + "PhabricatorService.author_data",
-        return_value=({"userName": "dummy-user"}, []),
+        return_value={"userName": "dummy-user"},
     )
     @patch(PATH + "PhabricatorService.time_from_epoch", return_value="dummy-time")
     @patch(PATH + "LastComment")
@@ -160,12 +166,12 @@ class PhabricatorTest(TestCase):
 
         # Call function
         response = PhabricatorService().get_last_comment(
-            comments=fake_comments, phab=None, raw_response=[]
+            comments=fake_comments, phab=None, users=self.users
         )
 
         # Validate function calls and response
         mock_author_data.assert_called_with(
-            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxxx", phab=None, raw_response=[]
+            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxxx", phab=None, users=self.users
         )
         mock_time_from_epoch.assert_called_with("1551763640")
         mock_last_comment.assert_called_with(
@@ -175,7 +181,7 @@ class PhabricatorTest(TestCase):
 
     @patch(
         PATH + "PhabricatorService.author_data",
-        return_value=({"userName": "dummy-user"}, []),
+        return_value={"userName": "dummy-user"},
     )
     @patch(PATH + "PhabricatorService.time_from_epoch", return_value="dummy-time")
     @patch(PATH + "LastComment")
@@ -193,12 +199,12 @@ class PhabricatorTest(TestCase):
 
         # Call function
         response = PhabricatorService().get_last_comment(
-            comments=fake_comments, phab=None, raw_response=[]
+            comments=fake_comments, phab=None, users=self.users
         )
 
         # Validate function calls and response
         mock_author_data.assert_called_with(
-            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxx3", phab=None, raw_response=[]
+            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxx3", phab=None, users=self.users
         )
         mock_time_from_epoch.assert_called_with("1551763640")
         self.assertEqual(response, mock_last_comment.return_value)
@@ -217,12 +223,12 @@ class PhabricatorTest(TestCase):
         # Call function
         with self.assertRaises(InternetError):
             PhabricatorService().get_last_comment(
-                comments=fake_comments, phab=None, raw_response=[]
+                comments=fake_comments, phab=None, users=self.users
             )
 
         # Validate function calls and response
         mock_author_data.assert_called_with(
-            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxx3", phab=None, raw_response=[]
+            author_phid="PHID-USER-xxxxxxxxxxxxxxxxxxx3", phab=None, users=self.users
         )
         mock_time_from_epoch.assert_not_called()
 
@@ -253,6 +259,57 @@ class PhabricatorTest(TestCase):
         # Validate function calls and response
         self.fake_phab.differential.getrevisioncomments.assert_called_with(ids=[0])
 
+    @patch(PATH + "REVISIONS_PER_QUERY", 2)
+    def test_get_comments_bulk(self):
+        """Tests get_comments_bulk function requesting comments in chunks."""
+        # Set up mock return values and side effects
+        timeline = self.mock.get_revision_comments()[0]
+        self.fake_phab.differential.getrevisioncomments.side_effect = [
+            {"1": timeline, "2": []},
+            {"3": timeline},
+        ]
+
+        # Call function
+        response = PhabricatorService().get_comments_bulk(
+            ids=["1", "2", "3"], phab=self.fake_phab
+        )
+
+        # Validate function calls and response
+        self.assertEqual(2, self.fake_phab.differential.getrevisioncomments.call_count)
+        self.fake_phab.differential.getrevisioncomments.assert_called_with(ids=[3])
+        self.assertEqual(
+            {
+                "1": self.mock.get_comments_return_value(),
+                "2": [],
+                "3": self.mock.get_comments_return_value(),
+            },
+            response,
+        )
+
+    @patch(PATH + "USERS_PER_QUERY", 1)
+    @patch(PATH + "PhabricatorService.user_query_ids")
+    def test_resolve_users(self, mock_user_query_ids):
+        """Tests resolve_users function querying only users not seen yet."""
+        # Set up mock return values and side effects
+        fake_user, fake_raw_response = self.mock.author_data_raw_response()
+        self.users.add(fake_raw_response[:2])
+        mock_user_query_ids.return_value = [fake_user]
+
+        # Call function
+        PhabricatorService().resolve_users(
+            phids=[
+                "PHID-USER-xxxxxxxxxxxxxxxxxxxx",
+                fake_user["phid"],
+                fake_user["phid"],
+            ],
+            users=self.users,
+            phab=None,
+        )
+
+        # Validate function calls and response
+        mock_user_query_ids.assert_called_once_with([fake_user["phid"]], None)
+        self.assertEqual(fake_user, self.users.get(fake_user["phid"]))
+
     @patch(PATH + "PhabricatorService.user_query_usernames")
     def test_generate_phids_successful(self, mock_user_query_usernames):
         """
@@ -266,16 +323,36 @@ class PhabricatorTest(TestCase):
             expected_raw_response,
         ) = self.mock.generate_phids_response()
         mock_user_query_usernames.return_value = self.mock.user_query_usernames()
+        user_names = ["dummy_user1", "dummy_user2"]
 
         # Call function
-        list_of_phids, raw_response = PhabricatorService().generate_phids(
-            "user_names", None
+        list_of_phids = PhabricatorService().generate_phids(
+            user_names, None, self.users
         )
 
         # Validate function calls and response
         self.assertEqual(expected_list_of_phids, list_of_phids)
-        self.assertEqual(expected_raw_response, raw_response)
-        mock_user_query_usernames.assert_called_with("user_names", None)
+        self.assertEqual(
+            expected_raw_response,
+            [self.users.get_by_name(user_name) for user_name in user_names],
+        )
+        mock_user_query_usernames.assert_called_with(user_names, None)
+
+    @patch(PATH + "PhabricatorService.user_query_usernames")
+    def test_generate_phids_known_users(self, mock_user_query_usernames):
+        """Tests generate_phids function with users found in the directory."""
+        # Set up mock return values and side effects
+        expected_list_of_phids, known_users = self.mock.generate_phids_response()
+        self.users.add(known_users)
+
+        # Call function
+        list_of_phids = PhabricatorService().generate_phids(
+            ["dummy_user1", "dummy_user2"], None, self.users
+        )
+
+        # Validate function calls and response
+        self.assertEqual(expected_list_of_phids, list_of_phids)
+        mock_user_query_usernames.assert_not_called()
 
     @patch(PATH + "PhabricatorService.user_query_usernames", side_effect=InternetError)
     def test_generate_phids_failure(self, mock_user_query_usernames):
@@ -286,14 +363,13 @@ class PhabricatorTest(TestCase):
         """
         # Call function
         with self.assertRaises(InternetError):
-            list_of_phids, raw_response = PhabricatorService().generate_phids(
-                "user_names", None
-            )
+            PhabricatorService().generate_phids(["user_name"], None, self.users)
 
         # Validate function calls and response
-        mock_user_query_usernames.assert_called_with("user_names", None)
+        mock_user_query_usernames.assert_called_with(["user_name"], None)
 
-    @patch(PATH + "PhabricatorService.get_comments")
+    @patch(PATH + "PhabricatorService.resolve_users", return_value=[])
+    @patch(PATH + "PhabricatorService.get_comments_bulk")
     @patch(PATH + "PhabricatorService.get_last_comment")
     @patch(PATH + "PhabricatorService.time_from_epoch")
     @patch(PATH + "PhabricatorService.check_request_state")
@@ -308,7 +384,8 @@ class PhabricatorTest(TestCase):
         mock_check_request_state,
         mock_time_from_epoch,
         mock_get_last_comment,
-        mock_get_comments,
+        mock_get_comments_bulk,
+        mock_resolve_users,
     ):
         """
         Tests get_reviews function with simple parameters.
@@ -319,38 +396,37 @@ class PhabricatorTest(TestCase):
         mock_phabricator_review.return_value = MagicMock()
         mock_time_from_epoch.return_value = "mock_date"
         fake_reviews = self.mock.get_reviews()
-        mock_get_comments.return_value = "test comment"
+        fake_comments = self.mock.get_comments_single()
+        mock_get_comments_bulk.return_value = {0: fake_comments}
         mock_check_request_state.return_value = True
-        mock_author_data.return_value = (
-            {"userName": "mock_user", "image": "mock.com"},
-            [],
-        )
+        mock_author_data.return_value = {"userName": "mock_user", "image": "mock.com"}
 
         # Call function
         response = PhabricatorService().get_reviews(
             phab=self.fake_phab,
             reviews=fake_reviews,
-            raw_response=[],
+            users=self.users,
             host="www.google.com",
             age=self.mock_age,
         )
 
         # Validate function calls and response
-        mock_get_comments.assert_called_with(id=0, phab=self.fake_phab)
+        mock_get_comments_bulk.assert_called_with(ids=[0], phab=self.fake_phab)
         mock_get_last_comment(
-            comments=mock_get_comments.return_value,
+            comments=fake_comments,
             phab=self.fake_phab,
-            raw_response=[],
+            users=self.users,
         )
         mock_time_from_epoch.assert_called_with("mock_date")
         mock_check_request_state.assert_called_with("mock_date", self.mock_age)
         mock_has_new_comments.assert_not_called()
         mock_author_data.assert_called_with(
-            "PHID-USER-xxxxxxxxxxxxxxxxxxxx", [], self.fake_phab
+            "PHID-USER-xxxxxxxxxxxxxxxxxxxx", self.users, self.fake_phab
         )
         self.assertEqual(response, [mock_phabricator_review.return_value])
 
-    @patch(PATH + "PhabricatorService.get_comments")
+    @patch(PATH + "PhabricatorService.resolve_users", return_value=[])
+    @patch(PATH + "PhabricatorService.get_comments_bulk")
     @patch(PATH + "PhabricatorService.get_last_comment")
     @patch(PATH + "PhabricatorService.time_from_epoch")
     @patch(PATH + "PhabricatorService.check_request_state")
@@ -365,7 +441,8 @@ class PhabricatorTest(TestCase):
         mock_check_request_state,
         mock_time_from_epoch,
         mock_get_last_comment,
-        mock_get_comments,
+        mock_get_comments_bulk,
+        mock_resolve_users,
     ):
         """
         Tests get_reviews function with show_last_comment.
@@ -379,29 +456,27 @@ class PhabricatorTest(TestCase):
         mock_get_last_comment.return_value = mock_last_comment_object
         mock_time_from_epoch.return_value = "mock_date"
         fake_reviews = self.mock.get_reviews()
-        mock_get_comments.return_value = "test comment"
+        fake_comments = self.mock.get_comments_single()
+        mock_get_comments_bulk.return_value = {0: fake_comments}
         mock_check_request_state.return_value = True
-        mock_author_data.return_value = (
-            {"userName": "mock_user", "image": "mock.com"},
-            [],
-        )
+        mock_author_data.return_value = {"userName": "mock_user", "image": "mock.com"}
 
         # Call function
         response = PhabricatorService().get_reviews(
             phab=self.fake_phab,
             reviews=fake_reviews,
-            raw_response=[],
+            users=self.users,
             host="www.google.com",
             show_last_comment=True,
             age=self.mock_age,
         )
 
         # Validate function calls and response
-        mock_get_comments.assert_called_with(id=0, phab=self.fake_phab)
+        mock_get_comments_bulk.assert_called_with(ids=[0], phab=self.fake_phab)
         mock_get_last_comment.assert_called_with(
-            comments=mock_get_comments.return_value,
+            comments=fake_comments,
             phab=self.fake_phab,
-            raw_response=[],
+            users=self.users,
         )
         mock_time_from_epoch.assert_called_with("mock_date")
         mock_check_request_state.assert_called_with("mock_date", self.mock_age)
@@ -409,7 +484,8 @@ class PhabricatorTest(TestCase):
         mock_author_data.assert_not_called()
         self.assertEqual(response, [])
 
-    @patch(PATH + "PhabricatorService.get_comments")
+    @patch(PATH + "PhabricatorService.resolve_users", return_value=[])
+    @patch(PATH + "PhabricatorService.get_comments_bulk")
     @patch(PATH + "PhabricatorService.get_last_comment")
     @patch(PATH + "PhabricatorService.time_from_epoch")
     @patch(PATH + "PhabricatorService.check_request_state")
@@ -424,7 +500,8 @@ class PhabricatorTest(TestCase):
         mock_check_request_state,
         mock_time_from_epoch,
         mock_get_last_comment,
-        mock_get_comments,
+        mock_get_comments_bulk,
+        mock_resolve_users,
     ):
         """Tests get_reviews function with check_request_state returning false."""
         # Set up mock return values and side effects
@@ -434,30 +511,25 @@ class PhabricatorTest(TestCase):
         mock_get_last_comment.return_value = mock_last_comment_object
         mock_time_from_epoch.return_value = "mock_date"
         fake_reviews = self.mock.get_reviews()
-        mock_get_comments.return_value = "test comment"
+        fake_comments = self.mock.get_comments_single()
+        mock_get_comments_bulk.return_value = {0: fake_comments}
         mock_check_request_state.return_value = False
-        mock_author_data.return_value = (
-            {"userName": "mock_user", "image": "mock.com"},
-            [],
-        )
+        mock_author_data.return_value = {"userName": "mock_user", "image": "mock.com"}
 
         # Call function
         response = PhabricatorService().get_reviews(
             phab=self.fake_phab,
             reviews=fake_reviews,
-            raw_response=[],
+            users=self.users,
             host="www.google.com",
             show_last_comment=True,
             age=self.mock_age,
         )
 
         # Validate function calls and response
-        mock_get_comments.assert_called_with(id=0, phab=self.fake_phab)
-        mock_get_last_comment(
-            comments=mock_get_comments.return_value,
-            phab=self.fake_phab,
-            raw_response=[],
-        )
+        # comments of filtered out revisions are not requested
+        mock_get_comments_bulk.assert_called_with(ids=[], phab=self.fake_phab)
+        mock_get_last_comment.assert_not_called()
         mock_time_from_epoch.assert_called_with("mock_date")
         mock_check_request_state.assert_called_with("mock_date", self.mock_age)
         mock_has_new_comments.assert_not_called()
@@ -477,7 +549,7 @@ class PhabricatorTest(TestCase):
     ):
         """Tests request_reviews with user names specified."""
         # Set up mock return values and side effects
-        mock_generate_phids.return_value = ([], "PHID-USER-xxxxxxxxxxxxxxxxxxxx")
+        mock_generate_phids.return_value = []
         mock_differential_query.return_value = "mock_reviews"
         mock_phabricator.return_value = self.fake_phab
         mock_get_reviews.return_value = "1"
@@ -488,9 +560,13 @@ class PhabricatorTest(TestCase):
         )
 
         # Validate function calls and response
-        mock_generate_phids.assert_called_with("test_user", self.fake_phab)
+        mock_generate_phids.assert_called_with(
+            "test_user",
+            self.fake_phab,
+            PhabricatorService.directories["https://www.dummy.com"],
+        )
         mock_differential_query.assert_called_with(
-            status="status-open", responsibleUsers=[], phab=self.fake_phab
+            status="status-open", responsible_users=[], phab=self.fake_phab
         )
         mock_phabricator.assert_called_with(
             host="https://www.dummy.com/api/", token="dummy_token"
@@ -510,7 +586,7 @@ class PhabricatorTest(TestCase):
     ):
         """Tests request_reviews without user names specified."""
         # Set up mock return values and side effects
-        mock_generate_phids.return_value = ([], "PHID-USER-xxxxxxxxxxxxxxxxxxxx")
+        mock_generate_phids.return_value = []
         mock_differential_query.return_value = "mock_reviews"
         mock_phabricator.return_value = self.fake_phab
         mock_get_reviews.return_value = "1"
@@ -523,7 +599,7 @@ class PhabricatorTest(TestCase):
         # Validate function calls and response
         mock_generate_phids.assert_not_called()
         mock_differential_query.assert_called_with(
-            status="status-open", responsibleUsers=[], phab=self.fake_phab
+            status="status-open", responsible_users=[], phab=self.fake_phab
         )
         mock_phabricator.assert_called_with(
             host="https://www.dummy.com/api/", token="dummy_token"
@@ -543,7 +619,7 @@ class PhabricatorTest(TestCase):
     ):
         """Tests request_reviews where get_reviews returns nothing."""
         # Set up mock return values and side effects
-        mock_generate_phids.return_value = ([], "PHID-USER-xxxxxxxxxxxxxxxxxxxx")
+        mock_generate_phids.return_value = []
         mock_differential_query.return_value = "mock_reviews"
         mock_phabricator.return_value = self.fake_phab
         mock_get_reviews.return_value = None
@@ -556,9 +632,141 @@ class PhabricatorTest(TestCase):
         # Validate function calls and response
         mock_generate_phids.assert_not_called()
         mock_differential_query.assert_called_with(
-            status="status-open", responsibleUsers=[], phab=self.fake_phab
+            status="status-open", responsible_users=[], phab=self.fake_phab
         )
         mock_phabricator.assert_called_with(
             host="https://www.dummy.com/api/", token="dummy_token"
         )
         self.assertEqual([], response)
+
+
+class UserDirectoryTest(TestCase):
+    """This class represents the UserDirectory test cases."""
+
+    def setUp(self):
+        """Creates temporary directory for the stored users."""
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "users.cache")
+        self.user, _ = mock_phabricator.author_data_raw_response()
+
+    def tearDown(self):
+        """Removes temporary directory."""
+        shutil.rmtree(self.path)
+
+    def test_save_and_load(self):
+        """Tests that saved users are found by PHID and user name."""
+        users = UserDirectory(self.filename)
+        users.add([self.user])
+        users.save()
+
+        loaded = UserDirectory(self.filename)
+
+        self.assertEqual(self.user, loaded.get(self.user["phid"]))
+        self.assertEqual(self.user, loaded.get_by_name(self.user["userName"]))
+        self.assertNotIn("PHID-USER-unknown", loaded)
+
+    @patch("reviewrot.httpcache.time.time")
+    def test_expired(self, mock_time):
+        """Tests that users expire after ttl."""
+        mock_time.return_value = 1000
+        users = UserDirectory(self.filename, ttl=60)
+        users.add([self.user])
+        users.save()
+
+        mock_time.return_value = 1061
+
+        self.assertIsNone(users.get(self.user["phid"]))
+        self.assertIsNone(UserDirectory(self.filename, ttl=60).get(self.user["phid"]))
+
+    def test_shared_by_services(self):
+        """Tests that services of one host share the directory."""
+        PhabricatorService.directories.clear()
+        cache = MagicMock(path=self.path, ttl=60)
+        service = PhabricatorService()
+        service.use_cache(cache)
+
+        users = service.user_directory("https://phab.example.com")
+
+        self.assertIs(
+            users, PhabricatorService().user_directory("https://phab.example.com")
+        )
+        self.assertEqual(
+            os.path.join(self.path, "phabricator-users-phab.example.com.cache"),
+            users.path,
+        )
+        PhabricatorService.directories.clear()
+
+
+class PhabricatorClientTest(TestCase):
+    """This class represents the shared Phabricator client test cases."""
+
+    def setUp(self):
+        """Creates temporary cache directory."""
+        self.path = tempfile.mkdtemp()
+        self.cache = MagicMock(path=self.path, ttl=60)
+        self.schema = {
+            "differential.query": {
+                "params": {"status": "optional string"},
+                "return": "list",
+            }
+        }
+        PhabricatorService.clients.clear()
+
+    def tearDown(self):
+        """Removes temporary cache directory."""
+        shutil.rmtree(self.path)
+        PhabricatorService.clients.clear()
+
+    @patch(PATH + "Phabricator")
+    def test_get_client_shared(self, mock_phabricator):
+        """Tests that entries of one host share the client."""
+        client = PhabricatorService().get_client("https://phab.example.com", "t")
+
+        self.assertIs(
+            client, PhabricatorService().get_client("https://phab.example.com", "t")
+        )
+        mock_phabricator.assert_called_once_with(
+            host="https://phab.example.com/api/", token="t"
+        )
+        client.update_interfaces.assert_called_once_with()
+
+    @patch(PATH + "Phabricator")
+    def test_get_client_stored_schema(self, mock_phabricator):
+        """Tests that Conduit schema is downloaded once per cache_ttl."""
+        mock_phabricator.return_value.conduit.query.return_value = self.schema
+        service = PhabricatorService()
+        service.use_cache(self.cache)
+
+        service.get_client("https://phab.example.com", "t")
+        PhabricatorService.clients.clear()
+        service.get_client("https://phab.example.com", "t")
+
+        mock_phabricator.return_value.conduit.query.assert_called_once_with()
+        mock_phabricator.return_value.update_interfaces.assert_not_called()
+        mock_phabricator.assert_called_with(
+            host="https://phab.example.com/api/",
+            token="t",
+            interface=parse_interfaces(self.schema),
+        )
+
+    @patch("reviewrot.httpcache.time.time")
+    @patch(PATH + "Phabricator")
+    def test_get_client_schema_expired(self, mock_phabricator, mock_time):
+        """Tests that stored schema expires and is checked for its format."""
+        mock_time.return_value = 1000
+        mock_phabricator.return_value.conduit.query.return_value = self.schema
+        service = PhabricatorService()
+        service.use_cache(self.cache)
+        query = mock_phabricator.return_value.conduit.query
+
+        service._create_client("https://phab.example.com", "t")
+        service._create_client("https://phab.example.com", "t")
+        self.assertEqual(1, query.call_count)
+
+        with patch(PATH + "SCHEMA_VERSION", 2):
+            service._create_client("https://phab.example.com", "t")
+        self.assertEqual(2, query.call_count)
+
+        mock_time.return_value = 1061
+        service._create_client("https://phab.example.com", "t")
+        self.assertEqual(3, query.call_count)
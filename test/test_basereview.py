@@ -3,7 +3,18 @@ from datetime import datetime
 from unittest import TestCase
 
 from dateutil.relativedelta import relativedelta
-from reviewrot.basereview import Age, BaseReview, BaseService
+from reviewrot.basereview import (
+    Age,
+    BaseReview,
+    BaseService,
+    FilterStats,
+    format_reviews,
+    FORMATTERS,
+    is_wip,
+    register_formatter,
+    RelativeAge,
+)
+from reviewrot.httpcache import CachingAdapter, mount_cache
 
 try:
     # Python 3 >
@@ -93,6 +104,73 @@ class BaseServiceTest(TestCase):
         # Validate function calls and response
         self.assertTrue(response)
 
+    def test_passes_metadata_filters(self):
+        """Tests 'passes_metadata_filters' drops WIP and old reviews."""
+        base_service = BaseService()
+        stats = FilterStats()
+        now = datetime.now()
+        age = Age(date=now - relativedelta(days=1), state="newer")
+
+        self.assertTrue(
+            base_service.passes_metadata_filters("Fix", now, age, True, stats)
+        )
+        self.assertFalse(
+            base_service.passes_metadata_filters("WIP: Fix", now, age, True, stats)
+        )
+        self.assertTrue(
+            base_service.passes_metadata_filters("WIP: Fix", now, age, False, stats)
+        )
+        old = now - relativedelta(days=2)
+        self.assertFalse(
+            base_service.passes_metadata_filters("Fix", old, age, True, stats)
+        )
+
+        self.assertEqual(4, stats.counts["fetched"])
+        self.assertEqual(1, stats.counts["dropped_wip"])
+        self.assertEqual(1, stats.counts["dropped_age"])
+        self.assertEqual(2, stats.counts["enriched"])
+        self.assertEqual(2, stats.saved)
+
+    def test_passes_metadata_filters_lists_state(self):
+        """Tests that reviews are recorded in state before they are filtered."""
+        base_service = BaseService()
+        base_service.use_state(MagicMock())
+
+        self.assertFalse(
+            base_service.passes_metadata_filters(
+                "WIP: Fix", datetime.now(), None, True, url="mock_url"
+            )
+        )
+
+        base_service.state.listed.assert_called_once_with("mock_url")
+
+    @patch(PATH + "BaseService.has_new_comments")
+    def test_passes_comment_filter(self, mock_has_new_comments):
+        """Tests 'passes_comment_filter' drops reviews with new comments."""
+        base_service = BaseService()
+        stats = FilterStats()
+        last_comment = MagicMock()
+        last_comment.created_at = "mock_created_at"
+        mock_has_new_comments.return_value = True
+
+        self.assertTrue(base_service.passes_comment_filter("Fix", None, 1, stats=stats))
+        self.assertTrue(
+            base_service.passes_comment_filter("Fix", last_comment, None, stats=stats)
+        )
+        self.assertFalse(
+            base_service.passes_comment_filter("Fix", last_comment, 1, stats=stats)
+        )
+
+        mock_has_new_comments.assert_called_once_with("mock_created_at", 1)
+        self.assertEqual(2, stats.counts["kept"])
+        self.assertEqual(1, stats.counts["dropped_last_comment"])
+
+    def test_is_wip(self):
+        """Tests 'is_wip' function."""
+        self.assertTrue(is_wip("[WIP] refactor"))
+        self.assertTrue(is_wip("Draft: fix bug"))
+        self.assertFalse(is_wip("[WIPER] Add the possibility of ignoring WIP"))
+
     @patch(PATH + "json")
     def test_decode_response(self, mock_json):
         """Tests '_decode_response' function."""
@@ -196,6 +274,38 @@ class BaseServiceTest(TestCase):
             method="mock_method", url="mock_url", headers="mock_header", verify=True
         )
 
+    def test_shared_client(self):
+        """Tests that clients are shared by services of the same type."""
+        self.addCleanup(BaseService.clients.clear)
+        factory = MagicMock(side_effect=lambda: object())
+
+        client = BaseService().shared_client("mock_host", "token", True, factory)
+
+        self.assertIs(
+            client, BaseService().shared_client("mock_host", "token", True, factory)
+        )
+        self.assertIsNot(
+            client, BaseService().shared_client("mock_host", "other", True, factory)
+        )
+        self.assertEqual(2, factory.call_count)
+
+    @patch.object(BaseService, "pool_size", 10)
+    def test_shared_session(self):
+        """Tests that shared session keeps a connection per worker."""
+        self.addCleanup(BaseService.clients.clear)
+        BaseService.set_pool_size(16)
+        cache = MagicMock()
+
+        session = BaseService().shared_session()
+        mount_cache(session, cache)
+
+        self.assertIs(session, BaseService().shared_session())
+        adapter = session.get_adapter("https://example.com")
+        self.assertIsInstance(adapter, CachingAdapter)
+        self.assertEqual(16, adapter._pool_maxsize)
+        mount_cache(session, cache)
+        self.assertIs(adapter, session.get_adapter("https://example.com"))
+
 
 class BaseReviewTest(TestCase):
     """This class represents the BaseReview test cases."""
@@ -336,7 +446,7 @@ class BaseReviewTest(TestCase):
         # Validate function calls and response
         self.assertEqual(response, "mock_format_json")
         mock_json.dumps.assert_called_with("mock__json__", indent=2)
-        mock__json__.assert_called_with(3)
+        mock__json__.assert_called_with(3, now=None)
 
     @patch(PATH + "BaseReview.format_duration")
     def test_format_irc_one_comment(self, mock_format_duration):
@@ -380,3 +490,60 @@ class BaseReviewTest(TestCase):
             "last comment by \x02mock_author\x02 mock_duration ago",
             response,
         )
+
+    def test_format_only_requested_style(self):
+        """Tests that 'format' renders only the requested style."""
+        review = BaseReview(
+            user="mock_user", title="mock_title", url="mock_url", comments=0
+        )
+        review.time = datetime(2020, 1, 1)
+        review.last_comment = None
+
+        with patch.object(BaseReview, "_format_json") as mock_format_json:
+            response = review.format("oneline", 0, 1, now=datetime(2020, 1, 3))
+
+        mock_format_json.assert_not_called()
+        self.assertEqual("mock_user filed 'mock_title' mock_url 2 days ago", response)
+        with self.assertRaises(KeyError):
+            review.format("mock_style", 0, 1)
+
+    def test_format_reviews(self):
+        """Tests that reviews are formatted relative to the same time."""
+        reviews = [BaseReview(user="mock_user"), BaseReview(user="mock_user")]
+        for review in reviews:
+            review.time = datetime(2020, 1, 1)
+            review.last_comment = None
+        formatter = MagicMock(return_value="mock_formatted")
+        register_formatter("mock_style", formatter)
+        self.addCleanup(FORMATTERS.pop, "mock_style")
+
+        response = format_reviews(reviews, "mock_style", show_last_comment=3)
+
+        self.assertEqual(["mock_formatted", "mock_formatted"], response)
+        calls = formatter.call_args_list
+        self.assertEqual((reviews[1], 1, 2, 3), calls[1][0][:4])
+        self.assertIs(calls[0][0][4], calls[1][0][4])
+
+    def test_relative_age(self):
+        """Tests that durations are relative to one time and memoized."""
+        ages = RelativeAge(datetime(2020, 3, 1, 12, 30, 45))
+
+        response = ages.format_all(
+            [
+                datetime(2019, 1, 15, 10, 0),
+                datetime(2020, 3, 1, 12, 20, 10),
+                datetime(2020, 3, 1, 12, 20, 50),
+                datetime(2020, 3, 1, 12, 30, 5),
+            ]
+        )
+
+        self.assertEqual(
+            ["1 year 1 month 15 days 2 hours", "10 minutes", "10 minutes"],
+            response[:3],
+        )
+        self.assertEqual("less than 1 minute", response[3])
+        self.assertEqual(3, len(ages._durations))
+        self.assertEqual(
+            "10 minutes",
+            BaseReview.format_duration(datetime(2020, 3, 1, 12, 20), ages),
+        )
@@ -476,6 +476,31 @@ class CommandLineParserTest(TestCase):
             expected_date.replace(second=0, microsecond=0),
         )
 
+    def test_workers_argument_in_config(self):
+        """Ensure that workers are read from config and validated."""
+        cli_args = argparse.Namespace(cacert=None, insecure=False)
+
+        config = {"arguments": {"workers": 8, "max_per_host": 2}}
+        arguments = get_arguments(cli_args, config)
+        self.assertEqual(arguments.get("workers"), 8)
+        self.assertEqual(arguments.get("max_per_host"), 2)
+
+        config = {"arguments": {"workers": 0}}
+        with self.assertRaises(ValueError):
+            get_arguments(cli_args, config)
+
+    def test_compact_argument(self):
+        """Ensure that compact output is accepted only by json formats."""
+        cli_args = argparse.Namespace(
+            cacert=None, insecure=False, format="ndjson", compact=True
+        )
+        arguments = get_arguments(cli_args, {})
+        self.assertTrue(arguments.get("compact"))
+
+        cli_args.format = "indented"
+        with self.assertRaises(ValueError):
+            get_arguments(cli_args, {})
+
     @classmethod
     def tearDownClass(cls):
         """TODO: docstring goes here."""
@@ -0,0 +1,127 @@
+"""Fetcher Tests Cases."""
+import logging
+import threading
+import time
+from unittest import TestCase
+
+from reviewrot.fetcher import ReviewFetcher
+
+from .helpers import make_job
+
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+class ReviewFetcherTest(TestCase):
+    """This class represents the ReviewFetcher test cases."""
+
+    def test_invalid_workers(self):
+        """Tests that number of workers has to be positive."""
+        with self.assertRaises(ValueError):
+            ReviewFetcher(workers=0)
+
+        with self.assertRaises(ValueError):
+            ReviewFetcher(workers=1, per_host=0)
+
+    def test_run_sequential(self):
+        """Tests 'run' function with single worker."""
+        jobs = [make_job("first", reviews=[1, 2]), make_job("second", reviews=None)]
+
+        results, errors = ReviewFetcher().run(jobs)
+
+        self.assertEqual([1, 2], results)
+        self.assertEqual([], errors)
+        jobs[0].service.request_reviews.assert_called_with(repo_name="first")
+        jobs[1].service.request_reviews.assert_called_with(repo_name="second")
+
+    def test_run_parallel_keeps_order(self):
+        """Tests 'run' returns results in order of jobs regardless of timing."""
+
+        def slow(**kwargs):
+            time.sleep(0.05)
+            return ["slow"]
+
+        jobs = [
+            make_job("slow", side_effect=slow),
+            make_job("fast", reviews=["fast"]),
+        ]
+
+        results, errors = ReviewFetcher(workers=2).run(jobs)
+
+        self.assertEqual(["slow", "fast"], results)
+        self.assertEqual([], errors)
+
+    def test_run_collects_errors(self):
+        """Tests 'run' continues after a job fails."""
+        error = ValueError("No repo found")
+        jobs = [
+            make_job("broken", side_effect=error),
+            make_job("working", reviews=["review"]),
+        ]
+
+        results, errors = ReviewFetcher(workers=2).run(jobs)
+
+        self.assertEqual(["review"], results)
+        self.assertEqual(1, len(errors))
+        self.assertEqual(jobs[0], errors[0].job)
+        self.assertEqual(error, errors[0].error)
+
+    def test_run_per_host_limit(self):
+        """Tests 'run' never runs more jobs against one host than allowed."""
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def track(**kwargs):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.02)
+            with lock:
+                running["now"] -= 1
+            return []
+
+        jobs = [make_job(str(i), side_effect=track) for i in range(6)]
+
+        ReviewFetcher(workers=6, per_host=2).run(jobs)
+
+        self.assertEqual(2, running["max"])
+
+    def test_run_busy_host_keeps_workers_free(self):
+        """Tests that jobs waiting for a busy host don't hold workers."""
+        lock = threading.Lock()
+        started = []
+        slow_host_free = threading.Event()
+
+        def slow(**kwargs):
+            slow_host_free.wait(1)
+            return []
+
+        def fast(**kwargs):
+            with lock:
+                started.append("fast")
+                if len(started) == 2:
+                    slow_host_free.set()
+            return []
+
+        jobs = [make_job(str(i), host="slow_host", side_effect=slow) for i in range(3)]
+        jobs += [make_job("fast", host="fast_host", side_effect=fast) for _ in range(2)]
+
+        start = time.monotonic()
+        ReviewFetcher(workers=2, per_host=1).run(jobs)
+
+        self.assertEqual(["fast", "fast"], started)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_run_grouped(self):
+        """Tests 'run_grouped' returns results and errors per group."""
+        error = ValueError("No repo found")
+        first = [make_job("first", reviews=[1]), make_job("broken", side_effect=error)]
+        second = [make_job("second", reviews=[2, 3])]
+
+        outcomes = ReviewFetcher(workers=3).run_grouped([first, [], second])
+
+        self.assertEqual([1], outcomes[0][0])
+        self.assertEqual([first[1]], [e.job for e in outcomes[0][1]])
+        self.assertEqual(([], []), outcomes[1])
+        self.assertEqual(([2, 3], []), outcomes[2])
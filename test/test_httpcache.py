@@ -0,0 +1,392 @@
+"""HTTP Cache Tests Cases."""
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from reviewrot import get_git_service, get_response_cache
+from reviewrot.basereview import BaseService
+from reviewrot.gerritstack import GerritService
+from reviewrot.httpcache import (
+    atomic_write,
+    CachingAdapter,
+    EndpointCache,
+    GITHUB_SESSION_CONFIGURATORS,
+    mount_cache,
+    ResponseCache,
+    wrap_github_sessions,
+)
+from reviewrot.ratelimit import RateLimiter
+
+PATH = "reviewrot.httpcache."
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+def _request(url="https://example.com/api", headers=None):
+    """Returns prepared GET request."""
+    return requests.Request("GET", url, headers=headers).prepare()
+
+
+def _response(status_code=200, body=b"", headers=None):
+    """Returns response object with given status, body and headers."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.url = "https://example.com/api"
+    response.raw = MagicMock()
+    return response
+
+
+class AtomicWriteTest(TestCase):
+    """This class represents the atomic_write test cases."""
+
+    def setUp(self):
+        """Creates temporary directory."""
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "file.json")
+
+    def tearDown(self):
+        """Removes temporary directory."""
+        shutil.rmtree(self.path)
+
+    def test_replaces_file(self):
+        """Tests that the file is replaced once written."""
+        with atomic_write(self.filename) as f:
+            f.write("first")
+            self.assertFalse(os.path.exists(self.filename))
+
+        with open(self.filename) as f:
+            self.assertEqual("first", f.read())
+
+    def test_error_keeps_file(self):
+        """Tests that the file is kept and temporary file removed on error."""
+        with atomic_write(self.filename) as f:
+            f.write("first")
+
+        with self.assertRaises(ValueError):
+            with atomic_write(self.filename) as f:
+                f.write("second")
+                raise ValueError("mock_error")
+
+        self.assertEqual(["file.json"], os.listdir(self.path))
+        with open(self.filename) as f:
+            self.assertEqual("first", f.read())
+
+
+class ResponseCacheTest(TestCase):
+    """This class represents the ResponseCache test cases."""
+
+    def setUp(self):
+        """Creates temporary cache directory."""
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Removes temporary cache directory."""
+        shutil.rmtree(self.path)
+
+    def test_key_depends_on_credentials(self):
+        """Tests that responses for different tokens are cached separately."""
+        first = ResponseCache.key(_request(headers={"Authorization": "token a"}))
+        second = ResponseCache.key(_request(headers={"Authorization": "token b"}))
+        same = ResponseCache.key(
+            _request(headers={"Authorization": "token a", "Accept": "*/*"})
+        )
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, same)
+
+    def test_set_and_get(self):
+        """Tests storing and loading an entry."""
+        cache = ResponseCache(self.path)
+        response = _response(
+            body=b'{"id": 1}', headers={"ETag": '"abc"', "Content-Encoding": "gzip"}
+        )
+
+        cache.set("key", response)
+        entry = cache.get("key")
+
+        self.assertEqual({"ETag": '"abc"'}, entry["headers"])
+        self.assertEqual("eyJpZCI6IDF9", entry["body"])
+        self.assertIsNone(cache.get("missing"))
+
+    @patch(PATH + "json.dump")
+    def test_set_unable_to_store(self, mock_dump):
+        """Tests that failure to store a response isn't raised."""
+        mock_dump.side_effect = OSError("No space left on device")
+        cache = ResponseCache(self.path)
+
+        cache.set("key", _response(body=b'{"id": 1}'))
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_get_expired(self):
+        """Tests that entries older than ttl are dropped."""
+        cache = ResponseCache(self.path, ttl=60)
+        cache.set("key", _response(headers={"ETag": '"abc"'}))
+        old = time.time() - 120
+        os.utime(cache._file("key"), (old, old))
+
+        self.assertIsNone(cache.get("key"))
+        self.assertFalse(os.path.exists(cache._file("key")))
+
+    def test_evict_least_recently_used(self):
+        """Tests that the oldest entries are evicted over size limit."""
+        cache = ResponseCache(self.path, max_size=None)
+        for index, key in enumerate(["old", "used", "new"]):
+            cache.set(key, _response(body=b"x" * 100))
+            mtime = time.time() - 100 + index
+            os.utime(cache._file(key), (mtime, mtime))
+        cache.touch("used")
+
+        cache.max_size = os.path.getsize(cache._file("new")) * 2
+        cache.evict()
+
+        self.assertIsNone(cache.get("old"))
+        self.assertIsNotNone(cache.get("used"))
+        self.assertIsNotNone(cache.get("new"))
+
+    def test_set_evicts_over_size(self):
+        """Tests that the directory is scanned only when over size limit."""
+        cache = ResponseCache(self.path)
+        cache.set("first", _response(body=b"x" * 100))
+        size = os.path.getsize(cache._file("first"))
+        cache.max_size = size * 2
+
+        with patch(PATH + "os.listdir", wraps=os.listdir) as mock_listdir:
+            cache.set("second", _response(body=b"x" * 100))
+            cache.set("second", _response(body=b"x" * 100))
+            self.assertEqual(0, mock_listdir.call_count)
+
+            old = time.time() - 100
+            os.utime(cache._file("first"), (old, old))
+            cache.set("third", _response(body=b"x" * 100))
+            self.assertEqual(1, mock_listdir.call_count)
+
+        self.assertIsNone(cache.get("first"))
+        self.assertIsNotNone(cache.get("second"))
+        self.assertIsNotNone(cache.get("third"))
+        self.assertEqual(size * 2, cache._size)
+
+
+class EndpointCacheTest(TestCase):
+    """This class represents the EndpointCache test cases."""
+
+    def setUp(self):
+        """Creates temporary cache directory."""
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "endpoints.cache")
+
+    def tearDown(self):
+        """Removes temporary cache directory."""
+        shutil.rmtree(self.path)
+
+    def test_add_persisted(self):
+        """Tests that validated endpoints are loaded by next run."""
+        endpoints = EndpointCache(self.filename)
+        endpoints.add("https://example.com")
+        endpoints.save()
+
+        endpoints = EndpointCache(self.filename)
+
+        self.assertIn("https://example.com", endpoints)
+        self.assertNotIn("https://example.com/projects/missing", endpoints)
+
+    def test_save_unchanged(self):
+        """Tests that nothing is written until an endpoint is added."""
+        endpoints = EndpointCache(self.filename)
+
+        endpoints.save()
+        self.assertFalse(os.path.exists(self.filename))
+
+        endpoints.add("https://example.com")
+        endpoints.save()
+        os.remove(self.filename)
+        endpoints.save()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_gerrit_shares_endpoints(self):
+        """Tests that Gerrit entries share endpoints of a cache directory."""
+        self.addCleanup(GerritService.endpoint_caches.clear)
+        self.addCleanup(BaseService.clients.clear)
+        cache = MagicMock(path=self.path, ttl=60)
+        first = GerritService()
+        second = GerritService()
+
+        first.use_cache(cache)
+        second.use_cache(cache)
+
+        self.assertIs(first.endpoints, second.endpoints)
+        self.assertEqual(
+            os.path.join(self.path, "gerrit-endpoints.cache"), first.endpoints.path
+        )
+
+    @patch(PATH + "time.time")
+    def test_expired(self, mock_time):
+        """Tests that validations expire after ttl."""
+        mock_time.return_value = 1000
+        endpoints = EndpointCache(ttl=60)
+        endpoints.add("https://example.com")
+
+        mock_time.return_value = 1061
+
+        self.assertNotIn("https://example.com", endpoints)
+
+
+class CachingAdapterTest(TestCase):
+    """This class represents the CachingAdapter test cases."""
+
+    def setUp(self):
+        """Creates temporary cache directory."""
+        self.path = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.path)
+        self.adapter = CachingAdapter(self.cache)
+
+    def tearDown(self):
+        """Removes temporary cache directory."""
+        shutil.rmtree(self.path)
+
+    @patch(PATH + "HTTPAdapter.send")
+    def test_send_stores_response(self, mock_send):
+        """Tests that responses with validators are stored."""
+        request = _request()
+        mock_send.return_value = _response(body=b"[]", headers={"ETag": '"abc"'})
+
+        response = self.adapter.send(request)
+
+        self.assertEqual(b"[]", response.content)
+        self.assertNotIn("If-None-Match", request.headers)
+        self.assertIsNotNone(self.cache.get(ResponseCache.key(request)))
+
+    @patch(PATH + "HTTPAdapter.send")
+    def test_send_without_validators(self, mock_send):
+        """Tests that responses without ETag/Last-Modified aren't stored."""
+        request = _request()
+        mock_send.return_value = _response(body=b"[]")
+
+        self.adapter.send(request)
+
+        self.assertIsNone(self.cache.get(ResponseCache.key(request)))
+
+    @patch(PATH + "HTTPAdapter.send")
+    def test_send_not_modified(self, mock_send):
+        """Tests that cached body is returned for 304 response."""
+        self.cache.set(
+            ResponseCache.key(_request()),
+            _response(
+                body=b'[{"id": 1}]',
+                headers={
+                    "ETag": '"abc"',
+                    "Last-Modified": "Mon, 01 Jan 2018 00:00:00 GMT",
+                    "X-RateLimit-Remaining": "10",
+                },
+            ),
+        )
+        mock_send.return_value = _response(
+            status_code=304, headers={"X-RateLimit-Remaining": "9"}
+        )
+        request = _request()
+
+        response = self.adapter.send(request)
+
+        self.assertEqual('"abc"', request.headers["If-None-Match"])
+        self.assertEqual(
+            "Mon, 01 Jan 2018 00:00:00 GMT", request.headers["If-Modified-Since"]
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{"id": 1}], response.json())
+        self.assertEqual("9", response.headers["X-RateLimit-Remaining"])
+        self.assertTrue(response.from_cache)
+
+    @patch(PATH + "HTTPAdapter.send")
+    def test_send_modified(self, mock_send):
+        """Tests that modified response replaces the cached one."""
+        key = ResponseCache.key(_request())
+        self.cache.set(key, _response(body=b"[]", headers={"ETag": '"abc"'}))
+        mock_send.return_value = _response(body=b"[1]", headers={"ETag": '"def"'})
+
+        response = self.adapter.send(_request())
+
+        self.assertEqual(b"[1]", response.content)
+        self.assertEqual({"ETag": '"def"'}, self.cache.get(key)["headers"])
+
+    @patch(PATH + "HTTPAdapter.send")
+    def test_send_post(self, mock_send):
+        """Tests that other than GET requests bypass the cache."""
+        request = requests.Request("POST", "https://example.com/api").prepare()
+        mock_send.return_value = _response(body=b"[]", headers={"ETag": '"abc"'})
+
+        self.adapter.send(request)
+
+        self.assertEqual([], os.listdir(self.path))
+
+
+class ResponseCacheConfigTest(TestCase):
+    """This class represents the response cache configuration test cases."""
+
+    def test_get_response_cache_not_configured(self):
+        """Tests that no cache is used unless cache_dir is configured."""
+        self.assertIsNone(get_response_cache({}))
+
+    @patch("reviewrot.ResponseCache")
+    def test_get_response_cache(self, mock_cache):
+        """Tests that cache is created from configuration."""
+        get_response_cache(
+            {"cache_dir": "/tmp/review-rot", "cache_ttl": 60, "cache_max_size": 1024}
+        )
+
+        mock_cache.assert_called_with("/tmp/review-rot", ttl=60, max_size=1024)
+
+    def test_wrap_github_sessions(self):
+        """Tests that PyGithub sessions are configured in order."""
+        from github import Requester
+
+        attribute = "_Requester__httpsConnectionClass"
+        original = getattr(Requester.Requester, attribute)
+        self.addCleanup(setattr, Requester.Requester, attribute, original)
+        self.addCleanup(GITHUB_SESSION_CONFIGURATORS.clear)
+        cache = MagicMock()
+        limiter = RateLimiter()
+
+        wrap_github_sessions("cache", functools.partial(mount_cache, cache=cache))
+        wrap_github_sessions("rate_limiter", limiter.mount)
+        wrap_github_sessions("rate_limiter", limiter.mount)
+
+        connection_class = getattr(Requester.Requester, attribute)
+        self.assertIs(original, connection_class.__mro__[1])
+        session = connection_class("api.github.com").session
+        self.assertIsInstance(
+            session.get_adapter("https://api.github.com"), CachingAdapter
+        )
+        self.assertEqual([limiter.hook], session.hooks["response"])
+
+    @patch("reviewrot.gitlabstack.gitlab.Gitlab")
+    def test_gitlab_uses_cache(self, mock_gitlab):
+        """Tests that python-gitlab client is given the caching session."""
+        cache = MagicMock()
+        # the session is shared by all Gitlab services
+        self.addCleanup(BaseService.clients.clear)
+        service = get_git_service("gitlab", cache=cache)
+        mock_gitlab.return_value.projects.get.return_value.mergerequests.list = (
+            MagicMock(return_value=[])
+        )
+
+        service.request_reviews(
+            host="https://gitlab.com", token="token", user_name="user", repo_name="repo"
+        )
+
+        self.assertIsInstance(
+            service.session.get_adapter("https://gitlab.com"), CachingAdapter
+        )
+        mock_gitlab.assert_called_with(
+            "https://gitlab.com", "token", ssl_verify=True, session=service.session
+        )
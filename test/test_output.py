@@ -0,0 +1,67 @@
+"""Output Tests Cases."""
+import io
+import json
+import logging
+from unittest import TestCase
+
+from reviewrot.output import ReviewWriter, write_reviews
+
+from .helpers import make_review, NOW
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+class ReviewWriterTest(TestCase):
+    """This class represents the ReviewWriter test cases."""
+
+    def write(self, reviews, style, **kwargs):
+        """Returns reviews written in a style."""
+        stream = io.StringIO()
+        self.count = write_reviews(stream, reviews, style, now=NOW, **kwargs)
+        return stream.getvalue()
+
+    def test_json(self):
+        """Tests that json output is a valid array, even if empty."""
+        output = self.write([make_review(1), make_review(2)], "json")
+
+        self.assertEqual(
+            ["1 day", "2 days"], [r["relative_time"] for r in json.loads(output)]
+        )
+        self.assertIn('\n  "user": "mock_user"', output)
+        self.assertEqual([], json.loads(self.write([], "json")))
+
+    def test_json_compact(self):
+        """Tests that compact json output has no whitespace."""
+        output = self.write([make_review(1)], "json", compact=True)
+
+        self.assertIn('{"user":"mock_user","title":"mock_title 1"', output)
+        self.assertEqual(1, len(json.loads(output)))
+
+    def test_ndjson(self):
+        """Tests that ndjson output is one document per line."""
+        output = self.write((make_review(i) for i in range(3)), "ndjson")
+
+        lines = output.splitlines()
+        self.assertEqual(3, self.count)
+        self.assertEqual(3, len(lines))
+        self.assertEqual(
+            ["mock_title 0", "mock_title 1", "mock_title 2"],
+            [json.loads(line)["title"] for line in lines],
+        )
+
+    def test_write_incrementally(self):
+        """Tests that reviews are written as they come."""
+        stream = io.StringIO()
+        with ReviewWriter(stream, "oneline", now=NOW) as writer:
+            writer.write(make_review(1))
+            self.assertEqual(
+                "mock_user filed 'mock_title 1' https://example.com/pull/1"
+                " 1 day ago\n",
+                stream.getvalue(),
+            )
+            writer.write(make_review(2))
+        self.assertEqual(2, len(stream.getvalue().splitlines()))
+
+        with self.assertRaises(KeyError):
+            ReviewWriter(stream, "mock_style")
@@ -0,0 +1,129 @@
+"""Rate Limit Tests Cases."""
+import logging
+from unittest import TestCase
+
+import requests
+from reviewrot.basereview import BaseService
+from reviewrot.fetcher import FetchJob, job_context, ReviewFetcher
+from reviewrot.ratelimit import RateLimiter, UNATTRIBUTED
+
+from .helpers import FakeClock, make_job
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+def _response(remaining=None, limit=5000, reset=1600, token="mock_token"):
+    """Returns response with rate limit headers."""
+    response = requests.Response()
+    response.status_code = 200
+    response.request = requests.Request(
+        "GET", "https://api.example.com/repos", headers={"Authorization": token}
+    ).prepare()
+    if remaining is not None:
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Limit"] = str(limit)
+        response.headers["X-RateLimit-Reset"] = str(reset)
+    return response
+
+
+class RateLimiterTest(TestCase):
+    """This class represents the RateLimiter test cases."""
+
+    def setUp(self):
+        """Set up the testing environment."""
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+
+    def test_hook_accounts_requests(self):
+        """Tests that requests are accounted per job and budget."""
+        with job_context("mock_job"):
+            self.limiter.hook(_response(remaining=4999))
+            cached = _response(remaining=4999)
+            cached.from_cache = True
+            self.limiter.hook(cached)
+        self.limiter.hook(_response(remaining=4998))
+        self.limiter.hook(_response(remaining=59, limit=60, token="other_token"))
+
+        self.assertEqual(1, self.limiter.usage["mock_job"])
+        self.assertEqual(2, self.limiter.usage[UNATTRIBUTED])
+        budgets = sorted(
+            (budget.remaining, budget.used) for budget in self.limiter.budgets.values()
+        )
+        self.assertEqual([(59, 1), (4998, 2)], budgets)
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_hook_accounts_nested_workers(self):
+        """Tests that requests of worker pools started by a job are its own."""
+        with job_context("mock_job"):
+            BaseService.map_workers(
+                lambda remaining: self.limiter.hook(_response(remaining=remaining)),
+                [4999, 4998, 4997],
+                workers=3,
+            )
+
+        self.assertEqual(3, self.limiter.usage["mock_job"])
+        self.assertEqual(0, self.limiter.usage[UNATTRIBUTED])
+
+    def test_hook_throttles(self):
+        """Tests that workers slow down on low budget and pause on reserve."""
+        # 400 seconds until reset, 40 requests above reserve
+        self.limiter.hook(_response(remaining=50, reset=1400))
+        self.assertEqual([10], self.clock.sleeps)
+
+        self.limiter.hook(_response(remaining=10, reset=1400))
+        self.assertEqual([10, 391], self.clock.sleeps)
+
+        # limit was reset meanwhile
+        self.limiter.hook(_response(remaining=10, reset=1400))
+        self.assertEqual([10, 391], self.clock.sleeps)
+
+    def test_hook_without_headers(self):
+        """Tests that responses without rate limit are only accounted."""
+        self.limiter.hook(_response())
+
+        self.assertEqual(1, self.limiter.usage[UNATTRIBUTED])
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_mount(self):
+        """Tests that the hook is mounted to a session only once."""
+        session = requests.session()
+
+        self.limiter.mount(session)
+        self.limiter.mount(session)
+
+        self.assertEqual([self.limiter.hook], session.hooks["response"])
+
+    def test_report_resets_usage(self):
+        """Tests that usage is reported once."""
+        job = FetchJob(label="mock_job", host="mock_host", service=None, kwargs={})
+        with job_context("mock_job"):
+            self.limiter.hook(_response(remaining=4999))
+
+        self.limiter.report([("mock_entry", [job], 60)])
+
+        self.assertEqual(0, sum(self.limiter.usage.values()))
+
+    def test_fetcher_orders_jobs_by_yield(self):
+        """Tests that jobs which yielded most reviews run first."""
+        started = []
+        reviews = {"empty": [], "busy": [1, 2], "some": [3]}
+
+        def request_reviews(repo_name):
+            started.append(repo_name)
+            return reviews[repo_name]
+
+        jobs = [
+            make_job(label, side_effect=request_reviews)
+            for label in ("empty", "busy", "some")
+        ]
+        fetcher = ReviewFetcher(rate_limiter=self.limiter)
+
+        fetcher.run(jobs)
+        self.assertEqual(["empty", "busy", "some"], started)
+
+        del started[:]
+        results, errors = fetcher.run(jobs)
+        self.assertEqual(["busy", "some", "empty"], started)
+        self.assertEqual([1, 2, 3], results)
+        self.assertEqual({"empty": 0, "busy": 2, "some": 1}, self.limiter.yields)
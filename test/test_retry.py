@@ -0,0 +1,141 @@
+"""Retry Tests Cases."""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import logging
+import threading
+from unittest import TestCase
+
+from github import Github
+import requests
+from reviewrot import get_arguments, get_retry_policy, parse_cli_args
+from reviewrot.httpcache import CachingAdapter
+from reviewrot.retry import github_retry_policy, mount_retry, RetryPolicy
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers with queued statuses, 200 once they run out."""
+
+    def _respond(self):
+        """Sends the next queued status."""
+        self.server.requests.append(self.command)
+        status, headers = (200, {})
+        if self.server.statuses:
+            status, headers = self.server.statuses.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = _respond  # noqa: N815
+    do_POST = _respond  # noqa: N815
+
+    def log_message(self, format, *args):
+        """Keeps test output clean."""
+        pass
+
+
+class RetryPolicyTest(TestCase):
+    """This class represents the RetryPolicy test cases."""
+
+    def setUp(self):
+        """Starts server and session retrying its requests."""
+        self.server = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+        self.server.statuses = []
+        self.server.requests = []
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+        self.session = requests.session()
+        mount_retry(self.session, RetryPolicy(backoff_factor=0))
+
+    def tearDown(self):
+        """Stops the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_transient_errors(self):
+        """Tests that transient errors of GET requests are retried."""
+        self.server.statuses = [(503, {}), (429, {"Retry-After": "0"})]
+
+        response = self.session.get(self.url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["GET"] * 3, self.server.requests)
+
+    def test_retry_exhausted(self):
+        """Tests that the last response is returned when retries run out."""
+        self.server.statuses = [(502, {})] * 5
+
+        response = self.session.get(self.url)
+
+        self.assertEqual(502, response.status_code)
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_no_retry_post(self):
+        """Tests that POST requests and other errors are not retried."""
+        self.server.statuses = [(503, {})]
+        self.assertEqual(503, self.session.post(self.url).status_code)
+
+        self.server.statuses = [(404, {})]
+        self.assertEqual(404, self.session.get(self.url).status_code)
+
+        self.assertEqual(["POST", "GET"], self.server.requests)
+
+    def test_retry_max_time(self):
+        """Tests that requests aren't retried without time left."""
+        mount_retry(self.session, RetryPolicy(max_time=0))
+        self.server.statuses = [(503, {})] * 5
+
+        response = self.session.get(self.url)
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_github_retry_rate_limit(self):
+        """Tests that Github policy also retries rate limited requests."""
+        retry = github_retry_policy(RetryPolicy(total=2, backoff_factor=0))
+        mount_retry(self.session, retry)
+        self.server.statuses = [(403, {"Retry-After": "0"}), (503, {})]
+
+        response = self.session.get(self.url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(Github.default_retry.total, retry.total)
+
+    def test_retry_backoff(self):
+        """Tests that backoff is random up to the exponential one."""
+        retry = RetryPolicy(backoff_factor=1, max_time=None)
+        for _ in range(3):
+            retry = retry.increment(method="GET", url="/", error=OSError())
+
+        self.assertTrue(0 <= retry.get_backoff_time() <= 4)
+        self.assertIsNone(retry.deadline)
+
+    def test_mount_retry_caching_adapter(self):
+        """Tests that the policy applies to already mounted adapters."""
+        session = requests.session()
+        adapter = CachingAdapter(cache=None)
+        session.mount("https://", adapter)
+        retry = RetryPolicy()
+
+        mount_retry(session, retry)
+
+        self.assertIs(retry, adapter.max_retries)
+
+    def test_get_retry_policy(self):
+        """Tests that retries are configured by arguments."""
+        retry = get_retry_policy({"retries": 5, "retry_backoff": 0})
+        self.assertEqual(5, retry.total)
+        self.assertEqual(0, retry.backoff_factor)
+
+        self.assertIsNone(get_retry_policy({"retries": 0}))
+        self.assertIsNotNone(get_retry_policy({}))
+
+        with self.assertRaises(ValueError):
+            get_arguments(parse_cli_args([]), {"arguments": {"retry_max_time": -1}})
@@ -0,0 +1,102 @@
+"""Scheduler Tests Cases."""
+from datetime import datetime, timedelta
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from dateutil.relativedelta import relativedelta
+from reviewrot.basereview import Age
+from reviewrot.fetcher import ReviewFetcher
+from reviewrot.scheduler import Scheduler
+
+from .helpers import FakeClock, make_job
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+class SchedulerTest(TestCase):
+    """This class represents the Scheduler test cases."""
+
+    def setUp(self):
+        """Set up the testing environment."""
+        self.clock = FakeClock(now=0)
+        self.scheduler = Scheduler(
+            ReviewFetcher(), clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def test_add_invalid_interval(self):
+        """Tests that interval has to be positive."""
+        with self.assertRaises(ValueError):
+            self.scheduler.add("mock_label", [], interval=0)
+
+    def test_run_forever_intervals(self):
+        """Tests that entries are collected on their own intervals."""
+        fast = make_job("fast", reviews=["fast_review"])
+        slow = make_job("slow", reviews=["slow_review"])
+        self.scheduler.add("fast", [fast], interval=60)
+        self.scheduler.add("slow", [slow], interval=150)
+        callback = MagicMock()
+
+        self.scheduler.run_forever(callback, cycles=4)
+
+        # collections at 0 (both), 60, 120 (fast) and 150 (slow)
+        self.assertEqual(150, self.clock.now)
+        self.assertEqual(3, fast.service.request_reviews.call_count)
+        self.assertEqual(2, slow.service.request_reviews.call_count)
+        self.assertEqual(4, callback.call_count)
+        callback.assert_called_with(["fast_review", "slow_review"], [])
+
+    def test_idle_jobs(self):
+        """Tests that jobs of entries which weren't due are reported idle."""
+        self.scheduler.add("fast", [make_job("fast", reviews=[])], interval=60)
+        self.scheduler.add("slow", [make_job("slow", reviews=[])], interval=150)
+
+        self.scheduler.run_pending()
+        self.assertEqual([], self.scheduler.idle_jobs)
+
+        self.clock.sleep(60)
+        self.scheduler.run_pending()
+        self.assertEqual(["slow"], self.scheduler.idle_jobs)
+
+    def test_run_pending_refreshes_age(self):
+        """Tests that relative age filters move with every cycle."""
+        start = datetime(2020, 1, 10)
+        self.scheduler.now = lambda: start + timedelta(seconds=self.clock.now)
+        job = make_job("mock_job", reviews=[])
+        age = Age(date=None, state="older", delta=relativedelta(days=5))
+        self.scheduler.add("mock_job", [job._replace(kwargs={"age": age})], 60)
+
+        self.scheduler.run_pending()
+        self.clock.sleep(3600)
+        self.scheduler.run_pending()
+
+        dates = [
+            call[1]["age"].date for call in job.service.request_reviews.call_args_list
+        ]
+        self.assertEqual(
+            [datetime(2020, 1, 5), datetime(2020, 1, 5, 1)],
+            dates,
+        )
+
+    def test_run_forever_keeps_running_on_errors(self):
+        """Tests that failing jobs and reports don't stop the scheduler."""
+        job = make_job("broken")
+        job.service.request_reviews.side_effect = ValueError("No repo found")
+        self.scheduler.add("broken", [job], interval=60)
+        callback = MagicMock(side_effect=IOError("mail server down"))
+
+        self.scheduler.run_forever(callback, cycles=2)
+
+        self.assertEqual(2, callback.call_count)
+        results, errors = callback.call_args[0]
+        self.assertEqual([], results)
+        self.assertEqual([job], [error.job for error in errors])
+
+    def test_run_forever_without_entries(self):
+        """Tests that scheduler stops when there's nothing to collect."""
+        callback = MagicMock()
+
+        self.scheduler.run_forever(callback)
+
+        callback.assert_not_called()
@@ -0,0 +1,159 @@
+"""Server Tests Cases."""
+from datetime import datetime
+import logging
+import shutil
+import tempfile
+from unittest import TestCase
+
+import requests
+from reviewrot.server import ReviewServer, ReviewStore
+
+from .helpers import make_review
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+class ReviewServerTest(TestCase):
+    """This class represents the ReviewServer test cases."""
+
+    def setUp(self):
+        """Starts server with some reviews."""
+        self.web_dir = tempfile.mkdtemp()
+        with open(self.web_dir + "/index.html", "w") as f:
+            f.write("<html></html>")
+
+        self.store = ReviewStore()
+        self.server = ReviewServer(("127.0.0.1", 0), self.store, web_dir=self.web_dir)
+        self.server.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def tearDown(self):
+        """Stops the server."""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.web_dir)
+
+    def get(self, path, **kwargs):
+        """Sends GET request to the server."""
+        return requests.get(self.url + path, **kwargs)
+
+    def test_not_collected_yet(self):
+        """Tests that API is unavailable until reviews are collected."""
+        self.assertEqual(503, self.get("/api/reviews").status_code)
+
+    def test_reviews(self):
+        """Tests that all reviews are returned in stored order."""
+        self.store.update([make_review(1), make_review(2)])
+
+        response = self.get("/api/reviews")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("2", response.headers["X-Total-Count"])
+        self.assertNotIn("Link", response.headers)
+        self.assertEqual(
+            ["mock_title 1", "mock_title 2"], [r["title"] for r in response.json()]
+        )
+
+    def test_reviews_filtered(self):
+        """Tests filtering by project, user and age."""
+        now = datetime.now()
+        self.store.update(
+            [
+                make_review(1, "alice", "first", 10, now=now),
+                make_review(2, "bob", "first", 10, now=now),
+                make_review(3, "alice", "second", 10, now=now),
+                make_review(4, "alice", "first", 1, now=now),
+            ]
+        )
+
+        response = self.get(
+            "/api/reviews",
+            params={"project": "first", "user": "alice", "older_than": "5d"},
+        )
+
+        self.assertEqual(["mock_title 1"], [r["title"] for r in response.json()])
+        self.assertEqual(
+            400, self.get("/api/reviews", params={"older_than": "5x"}).status_code
+        )
+
+    def test_reviews_paginated(self):
+        """Tests pagination and its headers."""
+        self.store.update([make_review(index) for index in range(5)])
+
+        response = self.get("/api/reviews", params={"page": 2, "per_page": 2})
+
+        self.assertEqual(
+            ["mock_title 2", "mock_title 3"], [r["title"] for r in response.json()]
+        )
+        self.assertEqual("5", response.headers["X-Total-Count"])
+        self.assertEqual(
+            "/api/reviews?page=3&per_page=2", response.links["next"]["url"]
+        )
+        self.assertEqual(
+            "/api/reviews?page=1&per_page=2", response.links["prev"]["url"]
+        )
+        self.assertEqual(400, self.get("/api/reviews", params={"page": 0}).status_code)
+
+    def test_reviews_head(self):
+        """Tests that HEAD requests get headers of GET requests only."""
+        self.store.update([make_review(1), make_review(2)])
+        response = self.get("/api/reviews", params={"per_page": 1})
+
+        head = requests.head(self.url + "/api/reviews", params={"per_page": 1})
+
+        self.assertEqual(200, head.status_code)
+        self.assertEqual(b"", head.content)
+        for name in ("ETag", "X-Total-Count", "Link", "Content-Length"):
+            self.assertEqual(response.headers[name], head.headers[name])
+
+    def test_reviews_not_modified(self):
+        """Tests that unchanged reviews are revalidated by ETag."""
+        self.store.update([make_review(1)])
+        etag = self.get("/api/reviews").headers["ETag"]
+
+        response = self.get("/api/reviews", headers={"If-None-Match": etag})
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.content)
+
+        self.store.update([make_review(1), make_review(2)])
+        response = self.get("/api/reviews", headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+
+    def test_reviews_gzip(self):
+        """Tests that large responses are compressed."""
+        self.store.update([make_review(index) for index in range(20)])
+
+        response = self.get("/api/reviews", headers={"Accept-Encoding": "gzip"})
+        identity = self.get("/api/reviews", headers={"Accept-Encoding": "identity"})
+
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertNotIn("Content-Encoding", identity.headers)
+        self.assertEqual(identity.json(), response.json())
+        self.assertEqual("Accept-Encoding", response.headers["Vary"])
+        self.assertTrue(response.headers["ETag"].endswith('-gzip"'))
+        self.assertNotEqual(identity.headers["ETag"], response.headers["ETag"])
+
+        # a cached identity body isn't revalidated for a gzip request
+        response = self.get(
+            "/api/reviews",
+            headers={
+                "Accept-Encoding": "gzip",
+                "If-None-Match": identity.headers["ETag"],
+            },
+        )
+        self.assertEqual(200, response.status_code)
+
+    def test_web_ui(self):
+        """Tests that web UI assets are served."""
+        response = self.get("/index.html")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("<html></html>", response.text)
+
+    def test_web_ui_missing(self):
+        """Tests that only API is served without web UI directory."""
+        server = ReviewServer(("127.0.0.1", 0), self.store, web_dir="/nonexistent")
+        self.assertIsNone(server.web_dir)
+        server.server_close()
@@ -0,0 +1,219 @@
+"""State Tests Cases."""
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from reviewrot import get_review_state
+from reviewrot.basereview import LastComment
+from reviewrot.fetcher import job_context
+from reviewrot.gerritstack import GerritReview, INLINE_COMMENTS, MESSAGE_COMMENTS
+from reviewrot.ratelimit import RateLimiter
+from reviewrot.state import ReviewState
+
+from .helpers import make_review, review_url
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+UPDATED = datetime(2018, 1, 2, 10, 30, tzinfo=timezone.utc)
+
+
+class ReviewStateTest(TestCase):
+    """This class represents the ReviewState test cases."""
+
+    def setUp(self):
+        """Creates temporary state directory."""
+        self.path = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.path, "state", "reviews.db")
+
+    def tearDown(self):
+        """Removes temporary state directory."""
+        shutil.rmtree(self.path)
+
+    def test_lookup(self):
+        """Tests that only unchanged reviews are found."""
+        last_comment = LastComment(
+            author="mock_author", body="mock_body", created_at=datetime(2018, 1, 2)
+        )
+        ReviewState(self.state_file).update(
+            [
+                make_review(
+                    1, updated_time=UPDATED, comments=2, last_comment=last_comment
+                )
+            ]
+        )
+
+        state = ReviewState(self.state_file)
+        record = state.lookup(review_url(1), UPDATED)
+
+        self.assertEqual(last_comment, record.last_comment)
+        self.assertEqual(2, record.comments)
+        self.assertEqual("mock_image", record.image)
+        self.assertIsNone(state.lookup(review_url(1), UPDATED + timedelta(minutes=1)))
+        self.assertIsNone(state.lookup("other_url", UPDATED))
+
+    def test_lookup_naive_time(self):
+        """Tests that reviews without timezone and comments are stored."""
+        updated_time = datetime(2018, 1, 2, 10, 30, 0, 123)
+        ReviewState(self.state_file).update([make_review(1, updated_time=updated_time)])
+
+        record = ReviewState(self.state_file).lookup(review_url(1), updated_time)
+
+        self.assertIsNone(record.last_comment)
+
+    def test_lookup_comments_mode(self):
+        """Tests that records of comments counted otherwise aren't reused."""
+        review = GerritReview(
+            comments_mode=MESSAGE_COMMENTS, url=review_url(1), updated_time=UPDATED
+        )
+        ReviewState(self.state_file).update([review])
+
+        state = ReviewState(self.state_file)
+
+        self.assertIsNotNone(state.lookup(review_url(1), UPDATED, MESSAGE_COMMENTS))
+        self.assertIsNone(state.lookup(review_url(1), UPDATED, INLINE_COMMENTS))
+        self.assertIsNone(state.lookup(review_url(1), UPDATED))
+
+    def test_stored_without_comments_mode(self):
+        """Tests that databases stored before comments modes are upgraded."""
+        os.makedirs(os.path.dirname(self.state_file))
+        with closing(sqlite3.connect(self.state_file)) as connection, connection:
+            connection.execute(
+                "CREATE TABLE reviews (url TEXT PRIMARY KEY, title TEXT,"
+                " updated_time TEXT NOT NULL, comments INTEGER, image TEXT,"
+                " last_comment_author TEXT, last_comment_body TEXT,"
+                " last_comment_created_at TEXT)"
+            )
+            connection.execute(
+                "INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    review_url(1),
+                    "mock_title",
+                    UPDATED.isoformat(),
+                    2,
+                    None,
+                    None,
+                    None,
+                    None,
+                ),
+            )
+
+        state = ReviewState(self.state_file)
+        state.update([make_review(1, updated_time=UPDATED, comments=2)])
+
+        self.assertEqual(2, state.lookup(review_url(1), UPDATED).comments)
+        self.assertIsNone(state.lookup(review_url(1), UPDATED, INLINE_COMMENTS))
+
+    def test_update_reports_changes(self):
+        """Tests that new and closed reviews are reported."""
+        ReviewState(self.state_file).update(
+            [make_review(1, updated_time=UPDATED), make_review(2, updated_time=UPDATED)]
+        )
+
+        third = make_review(3, updated_time=UPDATED)
+        new, closed = ReviewState(self.state_file).update(
+            [make_review(2, updated_time=UPDATED), third]
+        )
+
+        self.assertEqual([third], new)
+        self.assertEqual([review_url(1)], [record.url for record in closed])
+        self.assertIsNone(ReviewState(self.state_file).lookup(review_url(1), UPDATED))
+
+    def test_update_refreshes_previous(self):
+        """Tests that next update of the same state compares with this one."""
+        state = ReviewState(self.state_file)
+        state.update([make_review(1, updated_time=UPDATED)])
+
+        new, closed = state.update([make_review(2, updated_time=UPDATED)])
+
+        self.assertEqual([review_url(2)], [review.url for review in new])
+        self.assertEqual([review_url(1)], [record.url for record in closed])
+        self.assertIsNotNone(state.lookup(review_url(2), UPDATED))
+
+    def test_update_filtered(self):
+        """Tests that open reviews dropped by filters aren't reported closed."""
+        ReviewState(self.state_file).update(
+            [make_review(1, updated_time=UPDATED), make_review(2, updated_time=UPDATED)]
+        )
+
+        state = ReviewState(self.state_file)
+        state.listed(review_url(1))
+        state.listed(review_url(2))
+        new, closed = state.update([make_review(1, updated_time=UPDATED)])
+        self.assertEqual([], new)
+        self.assertEqual([], closed)
+
+        # reported again once the filter changes, still not new
+        state = ReviewState(self.state_file)
+        state.listed(review_url(2))
+        new, closed = state.update(
+            [make_review(1, updated_time=UPDATED), make_review(2, updated_time=UPDATED)]
+        )
+        self.assertEqual([], new)
+        self.assertEqual([], closed)
+
+    def test_update_incomplete(self):
+        """Tests that unseen reviews are kept when some repositories failed."""
+        ReviewState(self.state_file).update([make_review(1, updated_time=UPDATED)])
+
+        new, closed = ReviewState(self.state_file).update(
+            [make_review(2, updated_time=UPDATED)], complete=False
+        )
+
+        self.assertEqual([review_url(2)], [review.url for review in new])
+        self.assertEqual([], closed)
+        self.assertIsNotNone(
+            ReviewState(self.state_file).lookup(review_url(1), UPDATED)
+        )
+
+    def test_update_idle_jobs(self):
+        """Tests that reviews filtered by jobs which didn't run aren't new."""
+        state = ReviewState(self.state_file)
+        with job_context("idle"):
+            state.listed(review_url(1))
+        with job_context("busy"):
+            state.listed(review_url(2))
+        state.update([make_review(2, updated_time=UPDATED)])
+
+        with job_context("busy"):
+            state.listed(review_url(2))
+        state.update([make_review(2, updated_time=UPDATED)], idle=["idle"])
+
+        # the idle job runs again and its review passes the filter now
+        with job_context("idle"):
+            state.listed(review_url(1))
+        with job_context("busy"):
+            state.listed(review_url(2))
+        new, closed = state.update(
+            [make_review(1, updated_time=UPDATED), make_review(2, updated_time=UPDATED)]
+        )
+
+        self.assertEqual([], new)
+        self.assertEqual([], closed)
+
+    def test_yields_persisted(self):
+        """Tests that numbers of reviews of jobs are loaded by next run."""
+        state = ReviewState(self.state_file)
+        state.record_yield("mock_job", 3)
+        state.update([])
+
+        limiter = RateLimiter()
+        limiter.use_state(ReviewState(self.state_file))
+        limiter.record_yield("other_job", 1)
+
+        self.assertEqual({"mock_job": 3, "other_job": 1}, limiter.yields)
+        self.assertEqual({"mock_job": 3, "other_job": 1}, limiter.state.yields)
+
+    def test_get_review_state(self):
+        """Tests that state is used only when configured."""
+        self.assertIsNone(get_review_state({}))
+
+        state = get_review_state({"state_file": self.state_file})
+
+        self.assertEqual(self.state_file, state.path)
+        self.assertEqual({}, state.previous)
@@ -0,0 +1,134 @@
+"""Review Table Tests Cases."""
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+from unittest import TestCase
+
+from jinja2 import Environment, FileSystemLoader
+import reviewrot
+from reviewrot.basereview import RelativeAge
+from reviewrot.githubstack import GithubReview
+from reviewrot.table import ReviewTable
+
+from .helpers import make_review, NOW
+
+# Disable logging to avoid messing up test output
+logging.disable(logging.CRITICAL)
+
+
+def _titles(table):
+    """Returns titles of reviews in a table."""
+    return [review.title for review in table]
+
+
+class ReviewTableTest(TestCase):
+    """This class represents the ReviewTable test cases."""
+
+    def setUp(self):
+        """Set up the testing environment."""
+        self.table = ReviewTable(
+            [
+                make_review(1, "alice", "first", 3, updated_days=1, comment_days=2),
+                make_review(2, "bob", "first", 1, updated_days=2),
+                make_review(3, "alice", "second", 2, updated_days=3, comment_days=1),
+                make_review(4, "alice", "first", 3, updated_days=4),
+            ]
+        )
+
+    def test_sequence(self):
+        """Tests that the table behaves as a list of its reviews."""
+        self.assertEqual(4, len(self.table))
+        self.assertEqual("mock_title 2", self.table[1].title)
+        self.assertEqual(["mock_title 1", "mock_title 2"], _titles(self.table[:2]))
+        self.assertEqual(["alice", "first", "bob", "second"], self.table.names)
+
+    def test_sort(self):
+        """Tests that sorting is stable and missing comments are last."""
+        self.assertEqual(
+            ["mock_title 1", "mock_title 4", "mock_title 3", "mock_title 2"],
+            _titles(self.table.sort("submitted")),
+        )
+        self.assertEqual(
+            ["mock_title 2", "mock_title 3", "mock_title 1", "mock_title 4"],
+            _titles(self.table.sort("submitted", reverse=True)),
+        )
+        self.assertEqual(
+            ["mock_title 4", "mock_title 3", "mock_title 2", "mock_title 1"],
+            _titles(self.table.sort("updated")),
+        )
+        self.assertEqual(
+            ["mock_title 1", "mock_title 3", "mock_title 2", "mock_title 4"],
+            _titles(self.table.sort("commented")),
+        )
+        with self.assertRaises(ValueError):
+            self.table.sort("mock_sort")
+
+    def test_sort_aware_times(self):
+        """Tests that naive times in UTC are sorted with aware ones."""
+        table = ReviewTable([make_review(1, days=1), make_review(2, days=2)])
+        table[1].time = datetime(2020, 1, 9, 2, tzinfo=timezone(timedelta(hours=3)))
+        table = ReviewTable(table)
+
+        self.assertEqual(["mock_title 2", "mock_title 1"], _titles(table.sort()))
+
+    def test_select(self):
+        """Tests selecting by users, projects and submission time."""
+        self.assertEqual(
+            [0, 3],
+            self.table.select(
+                users=["alice"],
+                projects=["first", "unknown"],
+                before=NOW - timedelta(days=2),
+            ),
+        )
+        self.assertEqual([1], self.table.select(after=NOW - timedelta(2)))
+        self.assertEqual([], self.table.select(users=["unknown"]))
+        self.assertEqual([0, 1, 2, 3], self.table.select())
+
+    def test_group_by(self):
+        """Tests grouping in order of first review of every group."""
+        groups = self.table.group_by("user")
+
+        self.assertEqual(["alice", "bob"], list(groups))
+        self.assertEqual(
+            ["mock_title 1", "mock_title 3", "mock_title 4"], _titles(groups["alice"])
+        )
+        self.assertEqual(
+            ["mock_title 3", "mock_title 1", "mock_title 4"],
+            _titles(groups["alice"].sort("submitted", reverse=True)),
+        )
+        self.assertEqual(["first", "second"], list(self.table.group_by("project")))
+        with self.assertRaises(ValueError):
+            self.table.group_by("mock_column")
+
+    def test_email_grouped_by_project(self):
+        """Tests that the email lists reviews of every project together."""
+        loader = FileSystemLoader(os.path.dirname(reviewrot.__file__))
+        env = Environment(loader=loader)
+        env.filters["formatduration"] = RelativeAge(NOW)
+
+        output_text = env.get_template("html_template.jinja").render(
+            {"groups": self.table.group_by("project")}
+        )
+
+        positions = [
+            output_text.index(text)
+            for text in (
+                "first</a>",
+                "mock_title 1",
+                "mock_title 2",
+                "mock_title 4",
+                "second</a>",
+                "mock_title 3",
+            )
+        ]
+        self.assertEqual(sorted(positions), positions)
+        self.assertEqual(1, output_text.count("first</a>"))
+
+    def test_review_slots(self):
+        """Tests that reviews keep no dictionary of attributes."""
+        review = GithubReview(user="mock_user")
+
+        self.assertFalse(hasattr(review, "__dict__"))
+        with self.assertRaises(AttributeError):
+            review.mock_attribute = "mock_value"
@@ -12,38 +12,52 @@ $(document).ready(function() {
 	var stats_template = Handlebars.compile($("#stats-template").html());
 	var footer_template = Handlebars.compile($("#footer-template").html());
 
-	var xhr = $.ajax({
-		dataType: 'json',
-		cache: false,
+	// A user needs to change this value to get their site to work.
+	var data_url = 'https://raw.githubusercontent.com/nirzari/review-rot/master/web/js/default-data.json';
+	// Live data, available when the page is served by `review-rot --serve`.
+	var api_url = 'api/reviews';
 
-		// A user needs to change this value to get their site to work.
-		url: 'https://raw.githubusercontent.com/nirzari/review-rot/master/web/js/default-data.json',
-
-		error: function() {
-			$('error-message').removeClass('hidden');
-		},
-		success: function(data) {
-			var modified = xhr.getResponseHeader("Last-Modified")
-			$('.footer').append(footer_template({
-				generated: moment(modified).fromNow()
-			}));
-			$.each(data, function(key, value) {
-				value.pretty_repo = prettify_repo(value.url);
-				// Strip off the pull request from the URL to get the base URL of the repo
-				value.repo_url = value.url.split('/').slice(0, -2).join('/');
-				if (value.updated_time) {
-					value.relative_updated_time = moment.unix(value.updated_time).fromNow();
-				}
-				if (value.title.toUpperCase().indexOf("WIP") == -1) {
-					$('#reviews').append(entry_template(value));
+	var load = function(url, fallback_url) {
+		var xhr = $.ajax({
+			dataType: 'json',
+			// The API revalidates its data with ETag itself.
+			cache: url == api_url,
+			url: url,
+			error: function() {
+				if (fallback_url) {
+					load(fallback_url);
 				} else {
-					$('#wip-header').removeClass('hidden');
-					$('#wip-reviews').append(entry_template(value));
+					$('error-message').removeClass('hidden');
 				}
-			});
-			$('.page-header').append(stats_template(average_age(data)));
-		}
-	})
+			},
+			success: function(data) {
+				render(data, xhr.getResponseHeader("Last-Modified"));
+			}
+		});
+	};
+
+	var render = function(data, modified) {
+		$('.footer').append(footer_template({
+			generated: moment(modified).fromNow()
+		}));
+		$.each(data, function(key, value) {
+			value.pretty_repo = prettify_repo(value.url);
+			// Strip off the pull request from the URL to get the base URL of the repo
+			value.repo_url = value.url.split('/').slice(0, -2).join('/');
+			if (value.updated_time) {
+				value.relative_updated_time = moment.unix(value.updated_time).fromNow();
+			}
+			if (value.title.toUpperCase().indexOf("WIP") == -1) {
+				$('#reviews').append(entry_template(value));
+			} else {
+				$('#wip-header').removeClass('hidden');
+				$('#wip-reviews').append(entry_template(value));
+			}
+		});
+		$('.page-header').append(stats_template(average_age(data)));
+	};
+
+	load(api_url, data_url);
 });
 
 function prettify_repo(full_repo) {